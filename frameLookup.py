@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 24 11:02:37 2026
+
+@author: eo
+"""
+
+import os
+import sys
+
+from local.lib.video.provenance import ProvenanceReader, provenancePath, PROVENANCE_EXT
+from local.lib.utils.files import guiLoad, guiDialogEntry
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define functions
+
+def print_frame_source(provenance_reader, output_frame_index):
+
+    print("")
+    print("Output frame:", output_frame_index)
+
+    source_dict = provenance_reader.lookup(output_frame_index)
+    if source_dict is None:
+        print("  Not found! Output has", len(provenance_reader), "frames")
+        return
+
+    # Print out everything needed to jump back to the source footage
+    source_name = "unknown" if source_dict["source"] is None else os.path.basename(source_dict["source"])
+    print("  Source file:", source_name, "(file {} of {})".format(1 + source_dict["file_idx"],
+                                                                  len(provenance_reader.sourceList)))
+    print("  Source frame:", source_dict["frame_idx"])
+    if source_dict["source_seconds"] is not None:
+        print("  Source position: {:.3f} seconds".format(source_dict["source_seconds"]))
+    if source_dict["time"] is not None:
+        print("  Time:", source_dict["time"].strftime("%Y-%m-%d %H:%M:%S.%f")[:-3])
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Load frame sources
+
+# Take the sidecar (or output video) & frame numbers from the command line if given, otherwise ask for them
+if len(sys.argv) > 1:
+    sidecarSource = sys.argv[1]
+    frameList = [int(eachArg) for eachArg in sys.argv[2:]]
+else:
+    sidecarSource = guiLoad(windowTitle="Select stitched video (or frame source file)")
+    frameList = []
+
+# Allow the output video to be given instead of the sidecar itself
+if not sidecarSource.endswith(PROVENANCE_EXT):
+    sidecarSource = provenancePath(sidecarSource)
+provenanceReader = ProvenanceReader(sidecarSource)
+
+print("")
+print("Frame sources:", os.path.basename(sidecarSource))
+print("  Output frames:", len(provenanceReader))
+print("  Source files:", len(provenanceReader.sourceList))
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Look up frames
+
+if len(frameList) > 0:
+    for eachFrameIndex in frameList:
+        print_frame_source(provenanceReader, eachFrameIndex)
+
+else:
+    # Keep asking for frames until the prompt is cancelled
+    while True:
+        outputFrameIndex = guiDialogEntry(dialogText="Enter output frame number:\n(Cancel to quit)",
+                                          windowTitle="Frame lookup",
+                                          retType=int)
+        if outputFrameIndex is None:
+            break
+        print_frame_source(provenanceReader, outputFrameIndex)
+
+provenanceReader.close()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 26 09:48:31 2026
+
+@author: eo
+"""
+
+import json
+import threading
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class MetricsServer:
+
+    '''
+    Serves job metrics over HTTP on localhost, for monitoring long (unattended) jobs:
+        /metrics      -> Prometheus text format
+        /metrics.json -> JSON
+    Nothing is stored or rendered until a request comes in. Each request calls the given collection function,
+    which should just read existing counters, so there is no per-frame cost to having the server running.
+
+    The collection function returns a dictionary of metric names to values:
+        - numbers are given as-is (names ending in "_total" are treated as counters, everything else as gauges)
+        - strings are given as labels on an "_info" metric (e.g. the name of the current file)
+        - dictionaries are given as metrics labelled by name (e.g. {"read": 120.0, "recorded": 60.0} for stages)
+        - None values are left out
+    '''
+
+    def __init__(self, collectFunc, port=9477, host="127.0.0.1", prefix="videostitch", helpDict=None):
+
+        # Store metric settings
+        self._collectFunc = collectFunc
+        self._prefix = prefix
+        self._helpDict = {} if helpDict is None else helpDict
+        self.url = "http://{}:{}/metrics".format(host, port)
+
+        # Start serving in the background. Daemon threads, so a stuck scrape can't hold up the job from closing
+        self._server = _ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+        self._server.metricsServer = self
+        self._thread = threading.Thread(target = self._server.serve_forever, daemon = True)
+        self._thread.start()
+
+    # .................................................................................................................
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    # .................................................................................................................
+
+    def renderJSON(self):
+        return json.dumps(self._collectFunc(), indent = 2, sort_keys = True)
+
+    # .................................................................................................................
+
+    def renderPrometheus(self):
+
+        lineList = []
+        for metricName, metricValue in sorted(self._collectFunc().items()):
+            if metricValue is None:
+                continue
+
+            # Strings can't be metric values, so they're given as a label instead
+            fullName = "_".join([self._prefix, metricName])
+            labelName, labelledList = None, [(None, metricValue)]
+            if isinstance(metricValue, str):
+                fullName, labelName, labelledList = (fullName + "_info"), "value", [(metricValue, 1)]
+            elif isinstance(metricValue, dict):
+                labelName, labelledList = "name", sorted(metricValue.items())
+
+            # Write the help & type lines, followed by one line per (labelled) value
+            helpText = self._helpDict.get(metricName, metricName.replace("_", " "))
+            metricType = "counter" if metricName.endswith("_total") else "gauge"
+            lineList.append("# HELP {} {}".format(fullName, helpText))
+            lineList.append("# TYPE {} {}".format(fullName, metricType))
+            for labelValue, eachValue in labelledList:
+                if eachValue is None:
+                    continue
+                labelString = "" if labelName is None else '{{{}="{}"}}'.format(labelName, _escapeLabel(labelValue))
+                lineList.append("{}{} {}".format(fullName, labelString, _formatValue(eachValue)))
+
+        return "\n".join(lineList) + "\n"
+
+    # .................................................................................................................
+
+# =====================================================================================================================
+# =====================================================================================================================
+# =====================================================================================================================
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+# =====================================================================================================================
+# =====================================================================================================================
+# =====================================================================================================================
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        # Pick the output format based on the path
+        metricsServer = self.server.metricsServer
+        requestPath = self.path.split("?")[0].rstrip("/")
+        if requestPath in ("", "/metrics"):
+            renderFunc, contentType = metricsServer.renderPrometheus, "text/plain; version=0.0.4; charset=utf-8"
+        elif requestPath == "/metrics.json":
+            renderFunc, contentType = metricsServer.renderJSON, "application/json"
+        else:
+            self.send_error(404)
+            return
+
+        # Problems collecting metrics shouldn't ever stop the job, so they're only reported to the scraper
+        try:
+            responseBytes = renderFunc().encode("utf-8")
+        except Exception as err:
+            self.send_error(500, explain = repr(err))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(responseBytes)))
+        self.end_headers()
+        self.wfile.write(responseBytes)
+
+    # .................................................................................................................
+
+    def log_message(self, *args):
+        # Don't print every request, since scrapers poll constantly
+        pass
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define functions
+
+def startMetricsServer(collectFunc, port, helpDict=None):
+
+    ''' Start serving metrics on localhost. Returns None (with a warning) if the server can't be started '''
+
+    try:
+        metricsServer = MetricsServer(collectFunc, port, helpDict=helpDict)
+    except OSError as err:
+        print("")
+        print("Couldn't start metrics server on port {}! Continuing without it".format(port))
+        print(err)
+        return None
+
+    print("")
+    print("Serving job metrics at:")
+    print(metricsServer.url)
+
+    return metricsServer
+
+# .....................................................................................................................
+
+def _escapeLabel(labelValue):
+    return str(labelValue).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+# .....................................................................................................................
+
+def _formatValue(metricValue):
+    if isinstance(metricValue, bool):
+        return "1" if metricValue else "0"
+    if isinstance(metricValue, int):
+        return str(metricValue)
+    return repr(float(metricValue))
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 24 15:17:08 2026
+
+@author: eo
+"""
+
+import os
+import uuid
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define constants
+
+# Default folder used to hold outputs while they're being written (moved to their final location when finished)
+SCRATCH_FOLDER = os.path.join(os.path.expanduser("~"), ".cache", "videostitch", "scratch")
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class FilePrefetcher:
+
+    '''
+    Warms up the OS page cache for upcoming files (e.g. the next few videos of a stitching job), so decoding
+    doesn't stall on slow (network) reads when moving on to the next file.
+    Files are read sequentially in a single background thread, after hinting to the OS that they'll be needed.
+    '''
+
+    def __init__(self, fileList, lookAhead=2, maxBytesPerFile=1024**3, chunkBytes=8*1024**2):
+
+        # Store prefetch settings
+        self._fileList = list(fileList)
+        self._lookAhead = max(0, int(lookAhead))
+        self._maxBytesPerFile = maxBytesPerFile
+        self._chunkBytes = chunkBytes
+
+        # Allocate storage for the background reader & which files were already requested
+        self._executor = ThreadPoolExecutor(max_workers = 1) if self._lookAhead > 0 else None
+        self._stopEvent = threading.Event()
+        self._requestedSet = set()
+        self.bytesRead = 0
+        self.filesRead = 0
+
+    # .................................................................................................................
+
+    def prefetch(self, currentIndex):
+
+        ''' Call when starting on a file, to queue up reading the next few files (in order) '''
+
+        if self._executor is None:
+            return
+
+        for fileIdx in range(1 + currentIndex, min(len(self._fileList), 1 + currentIndex + self._lookAhead)):
+            if fileIdx not in self._requestedSet:
+                self._requestedSet.add(fileIdx)
+                self._executor.submit(self._warmFile, self._fileList[fileIdx])
+
+    # .................................................................................................................
+
+    def pendingFiles(self):
+
+        ''' Number of files queued up for reading that haven't been finished yet (for monitoring) '''
+
+        return len(self._requestedSet) - self.filesRead
+
+    # .................................................................................................................
+
+    def close(self):
+        if self._executor is not None:
+            self._stopEvent.set()
+            self._executor.shutdown(wait = False)
+            self._executor = None
+
+    # .................................................................................................................
+
+    def _warmFile(self, fileSource):
+
+        try:
+            with open(fileSource, "rb", buffering = 0) as inFile:
+
+                # Let the OS know the whole file is wanted (starts read-ahead on systems that support it)
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(inFile.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                    os.posix_fadvise(inFile.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+                # Read through the file anyways, since network shares tend to ignore hints. Data is just discarded
+                readBuffer = bytearray(self._chunkBytes)
+                bytesLeft = self._maxBytesPerFile
+                while bytesLeft > 0 and not self._stopEvent.is_set():
+                    numRead = inFile.readinto(readBuffer)
+                    if not numRead:
+                        break
+                    bytesLeft -= numRead
+                    self.bytesRead += numRead
+
+        except OSError:
+            # Prefetching is only an optimization, so problems are left for the actual reads to deal with
+            pass
+
+        self.filesRead += 1
+
+    # .................................................................................................................
+
+# =====================================================================================================================
+# =====================================================================================================================
+# =====================================================================================================================
+
+class ScratchFile:
+
+    '''
+    Gives a local (scratch) path to write an output file into, which is then moved to its final location
+    once it's finished. The move is atomic at the destination: the file is copied in under a temporary name
+    and then renamed, so a partially copied output is never left behind under the final name.
+    Falls back to writing directly to the final location if the scratch folder doesn't have enough free space.
+    '''
+
+    def __init__(self, finalPath, scratchFolder=None, minFreeBytes=5*1024**3):
+
+        self.finalPath = finalPath
+        self.path = finalPath
+        self.isStaged = False
+
+        # Only stage outputs if there's a reasonable amount of free space in the scratch folder
+        scratchFolder = SCRATCH_FOLDER if scratchFolder is None else scratchFolder
+        try:
+            os.makedirs(scratchFolder, exist_ok = True)
+            freeBytes = shutil.disk_usage(scratchFolder).free
+        except OSError:
+            freeBytes = 0
+        if freeBytes < minFreeBytes:
+            print("")
+            print("Not enough space in scratch folder, writing output directly:")
+            print(finalPath)
+            return
+
+        # Use a unique name, so separate runs never write into the same scratch file
+        finalName = os.path.basename(finalPath)
+        self.path = os.path.join(scratchFolder, "{}_{}".format(uuid.uuid4().hex[:8], finalName))
+        self.isStaged = True
+
+    # .................................................................................................................
+
+    def finalize(self, verbose=True):
+
+        ''' Move the finished file to its final location. Returns the final path '''
+
+        if not self.isStaged:
+            return self.finalPath
+
+        if verbose:
+            print("")
+            print("Moving output to:")
+            print(self.finalPath)
+
+        # Same file system, so a rename is all that's needed
+        finalFolder = os.path.dirname(os.path.abspath(self.finalPath))
+        try:
+            os.replace(self.path, self.finalPath)
+            self.isStaged = False
+            return self.finalPath
+        except OSError:
+            pass
+
+        # Otherwise copy into the destination folder under a temporary name, then rename into place
+        # (with a unique part, so separate runs saving to the same place never copy into the same partial file)
+        partialName = ".{}.{}.partial".format(os.path.basename(self.finalPath), uuid.uuid4().hex[:8])
+        partialPath = os.path.join(finalFolder, partialName)
+        try:
+            with open(self.path, "rb") as inFile, open(partialPath, "wb") as outFile:
+                shutil.copyfileobj(inFile, outFile, 16*1024**2)
+                outFile.flush()
+                os.fsync(outFile.fileno())
+            os.replace(partialPath, self.finalPath)
+        except OSError:
+            if os.path.exists(partialPath):
+                os.remove(partialPath)
+            print("")
+            print("Couldn't move output! It was left in the scratch folder:")
+            print(self.path)
+            raise
+
+        os.remove(self.path)
+        self.isStaged = False
+
+        return self.finalPath
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
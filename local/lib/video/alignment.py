@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 13:20:05 2026
+
+@author: eo
+"""
+
+import os
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from local.lib.video.io import openVideoCapture
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define hashing functions
+
+def frameHash(frame, hashSize=8):
+
+    '''
+    Compute a compact perceptual (difference) hash of a frame.
+    The frame is shrunk to a tiny grayscale image and each pixel is compared to its right-hand neighbour,
+    giving hashSize*hashSize bits, which are packed into bytes for fast comparisons.
+    '''
+
+    grayFrame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim > 2 else frame
+    tinyFrame = cv2.resize(grayFrame, dsize = (hashSize + 1, hashSize), interpolation = cv2.INTER_AREA)
+    diffBits = tinyFrame[:, 1:] > tinyFrame[:, :-1]
+
+    return np.packbits(diffBits)
+
+# .....................................................................................................................
+
+def hammingDistances(hashesA, hashesB):
+
+    ''' Get the number of differing bits between two (equal length) arrays of packed hashes. Returns one per row '''
+
+    xorBytes = np.bitwise_xor(hashesA, hashesB)
+
+    return np.unpackbits(xorBytes, axis = -1).sum(axis = -1)
+
+# .....................................................................................................................
+
+def hashBoundaryWindows(videoSource, windowFrames, frameCount=None, hashSize=8):
+
+    '''
+    Hash the first & last few frames of a video. Only these boundary windows are decoded.
+    The tail is found using the given (verified) frame count, or the header count if one isn't given.
+    If neither is usable, no tail hashes are returned (so the following boundary isn't checked),
+    rather than decoding the whole file to find the end.
+
+    outputs:
+        - headHashes: array of hashes (one row per frame) from the start of the video
+        - tailHashes: array of hashes from the end of the video
+    '''
+
+    emptyHashes = np.zeros((0, (hashSize * hashSize) // 8), dtype=np.uint8)
+
+    videoObj = openVideoCapture(videoSource)
+    if not videoObj.isOpened():
+        return emptyHashes, emptyHashes
+
+    try:
+        # Hash the head of the video
+        headHashes = []
+        for _ in range(windowFrames):
+            (receivedFrame, inFrame) = videoObj.read()
+            if not receivedFrame: break
+            headHashes.append(frameHash(inFrame, hashSize))
+
+        # Jump near the end of the video and hash everything up to the last frame
+        totalFrames = frameCount if (frameCount is not None and frameCount > 0) else \
+                      int(videoObj.get(cv2.CAP_PROP_FRAME_COUNT))
+        tailHashes = []
+        reachedEnd = (len(headHashes) < windowFrames)
+        if totalFrames > 0 and not reachedEnd:
+            tailStart = max(len(headHashes), totalFrames - windowFrames)
+            videoObj.set(cv2.CAP_PROP_POS_FRAMES, tailStart)
+            
+            # Only read a little past the expected end, in case the count is too low
+            for _ in range(2 * windowFrames):
+                (receivedFrame, inFrame) = videoObj.read()
+                if not receivedFrame:
+                    reachedEnd = True
+                    break
+                tailHashes.append(frameHash(inFrame, hashSize))
+        
+        # Without the actual end of the video, the tail can't be trusted for matching
+        tailHashes = tailHashes[-windowFrames:] if reachedEnd else []
+
+    finally:
+        videoObj.release()
+
+    # Short videos may not have a separate tail window, in which case the tail overlaps with the head
+    if len(tailHashes) < 1 and len(headHashes) < windowFrames:
+        tailHashes = headHashes[-windowFrames:]
+
+    headHashes = np.array(headHashes, dtype=np.uint8) if len(headHashes) > 0 else emptyHashes
+    tailHashes = np.array(tailHashes, dtype=np.uint8) if len(tailHashes) > 0 else emptyHashes
+
+    return headHashes, tailHashes
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define alignment functions
+
+def findOverlap(tailHashes, headHashes, minOverlap=3, matchThreshold=4.0, minMotion=1.0):
+
+    '''
+    Find how many frames at the start of one video repeat the frames at the end of the previous video.
+
+    outputs:
+        - overlapFrames: number of duplicated frames at the start of the next video (0 if no overlap found)
+
+    inputs:
+        - tailHashes: frame hashes from the end of the previous video
+        - headHashes: frame hashes from the start of the next video
+        - minOverlap: smallest overlap (in frames) that counts as a match. Helps avoid chance matches
+        - matchThreshold: largest average hash distance (in bits) between frames considered duplicates
+        - minMotion: smallest average hash distance between consecutive tail frames. Static scenes match
+                     at every offset, so no overlap is reported unless the tail actually has some motion
+    '''
+
+    numTail, numHead = len(tailHashes), len(headHashes)
+    maxOverlap = min(numTail, numHead)
+    if maxOverlap < max(1, minOverlap):
+        return 0
+
+    # Bail on static scenes, since we wouldn't be able to tell which offset is correct
+    tailMotion = np.mean(hammingDistances(tailHashes[1:], tailHashes[:-1])) if numTail > 1 else 0
+    if tailMotion < minMotion:
+        return 0
+
+    # Compare the end of the tail to the start of the head, for every possible overlap length
+    overlapLengths = np.arange(1, 1 + maxOverlap)
+    overlapDistances = np.array([np.mean(hammingDistances(tailHashes[-eachLength:], headHashes[:eachLength]))
+                                 for eachLength in overlapLengths])
+
+    # Pick the best match, ignoring overlaps that are too short to be trusted
+    validLengths = (overlapLengths >= minOverlap)
+    bestIdx = np.argmin(np.where(validLengths, overlapDistances, np.inf))
+    bestOverlap, bestDistance = overlapLengths[bestIdx], overlapDistances[bestIdx]
+    if bestDistance > matchThreshold:
+        return 0
+
+    # Make sure the match is distinct, i.e. being off by a couple of frames should give a clearly worse match.
+    # Otherwise we're probably matching a mostly static scene (where every offset looks similar)
+    shiftedIdxs = [eachIdx for eachIdx in (bestIdx - 2, bestIdx + 2) if 0 <= eachIdx < maxOverlap]
+    if len(shiftedIdxs) > 0:
+        shiftedDistance = min(overlapDistances[eachIdx] for eachIdx in shiftedIdxs)
+        if shiftedDistance < max(2 * bestDistance, minMotion):
+            return 0
+
+    return int(bestOverlap)
+
+# .....................................................................................................................
+
+def findBoundaryOverlaps(videoSourceList, fpsList, frameCountList=None, windowSeconds=5.0, maxWorkers=None, 
+                         verbose=True):
+
+    '''
+    Check every boundary between consecutive videos for repeated footage.
+
+    outputs:
+        - skipFramesList: number of frames to skip at the start of each video, to remove duplicated footage.
+                          The first video is never skipped
+
+    inputs:
+        - videoSourceList: (sorted) list of video paths
+        - fpsList: frame rate of each video, used to size the boundary windows
+        - frameCountList: (verified) frame count of each video, used to find the tail windows.
+                          Header counts are used if not given. Files with unknown counts aren't matched to the next
+        - windowSeconds: amount of footage at each end of each video to check for overlaps
+    '''
+
+    # Hash the boundary windows of every video in parallel
+    numWorkers = maxWorkers if maxWorkers is not None else min(8, os.cpu_count() or 1)
+    windowFramesList = [max(2, int(round(windowSeconds * eachFPS))) for eachFPS in fpsList]
+    with ThreadPoolExecutor(max_workers = numWorkers) as executor:
+        frameCountList = [None] * len(videoSourceList) if frameCountList is None else frameCountList
+        hashList = list(executor.map(hashBoundaryWindows, videoSourceList, windowFramesList, frameCountList))
+
+    # Match the tail of each video to the head of the next video
+    skipFramesList = [0] * len(videoSourceList)
+    for fileIdx in range(1, len(videoSourceList)):
+        _, prevTailHashes = hashList[fileIdx - 1]
+        nextHeadHashes, _ = hashList[fileIdx]
+        skipFramesList[fileIdx] = findOverlap(prevTailHashes, nextHeadHashes)
+
+    # Some feedback
+    if verbose:
+        totalSkipSec = sum(eachSkip / eachFPS for eachSkip, eachFPS in zip(skipFramesList, fpsList))
+        numOverlaps = sum(1 for eachSkip in skipFramesList if eachSkip > 0)
+        print("")
+        print("Found", numOverlaps, "overlapping file boundaries")
+        print("  Will skip", "{:.1f} seconds of repeated footage".format(totalSkipSec))
+
+    return skipFramesList
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 13:48:09 2026
+
+@author: eo
+"""
+
+import cv2
+import numpy as np
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class FrameBatch:
+
+    '''
+    Collects frames into one contiguous (N, H, W, C) array, along with some per-frame info (record & repeat
+    counts, times and colour lookup tables), so that per-frame operations can be applied to the whole batch
+    with single numpy/OpenCV calls.
+    Mostly helps with small frames, where the per-call overhead costs more than the actual pixel work.
+    '''
+
+    def __init__(self, batchSize=32):
+
+        self.batchSize = max(1, int(batchSize))
+
+        # Allocate storage for the batch. The frame array is allocated once the frame size is known
+        self._frames = None
+        self.count = 0
+        self.recordCounts = []
+        self.repeatCounts = []
+        self.frameTimes = []
+        self.lookupTables = []
+
+    # .................................................................................................................
+
+    def __len__(self):
+        return self.count
+
+    # .................................................................................................................
+
+    def add(self, frame, recordCount=1, frameTime=None, lookupTable=None, repeatCount=1):
+
+        # (Re-)allocate the batch array based on the first frame of each batch
+        if self.count == 0 and (self._frames is None or self._frames.shape[1:] != frame.shape):
+            self._frames = np.empty((self.batchSize,) + frame.shape, dtype=np.uint8)
+
+        # Copy the frame into the next slot. Frames of the wrong size are resized on the way in
+        batchSlot = self._frames[self.count]
+        if frame.shape == batchSlot.shape:
+            np.copyto(batchSlot, frame)
+        else:
+            cv2.resize(frame, dsize = (batchSlot.shape[1], batchSlot.shape[0]), dst = batchSlot,
+                       interpolation = cv2.INTER_AREA)
+
+        self.recordCounts.append(recordCount)
+        self.repeatCounts.append(repeatCount)
+        self.frameTimes.append(frameTime)
+        self.lookupTables.append(lookupTable)
+        self.count += 1
+
+        return self.isFull()
+
+    # .................................................................................................................
+
+    def isFull(self):
+        return self.count >= self.batchSize
+
+    # .................................................................................................................
+
+    def frames(self):
+
+        ''' Returns the (N, H, W, C) array of frames currently in the batch. This is a view, not a copy! '''
+
+        if self._frames is None:
+            return np.zeros((0, 1, 1, 3), dtype=np.uint8)
+
+        return self._frames[:self.count]
+
+    # .................................................................................................................
+
+    def lookupTableRuns(self):
+
+        ''' Returns (start, end, lookup table) for each run of consecutive frames sharing the same lookup table '''
+
+        runList = []
+        runStart = 0
+        for frameIdx in range(1, 1 + self.count):
+            if frameIdx < self.count and self.lookupTables[frameIdx] is self.lookupTables[runStart]:
+                continue
+            runList.append((runStart, frameIdx, self.lookupTables[runStart]))
+            runStart = frameIdx
+
+        return runList
+
+    # .................................................................................................................
+
+    def clear(self):
+        self.count = 0
+        self.recordCounts = []
+        self.repeatCounts = []
+        self.frameTimes = []
+        self.lookupTables = []
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define functions
+
+def applyLUTBatch(frameBatch, lookupTable):
+
+    ''' Apply a (256 entry) lookup table to every frame of a (N, H, W, C) batch, in place, using one OpenCV call '''
+
+    # OpenCV only deals with 2D (multi-channel) images, so treat the batch as one tall image
+    numFrames, frameHeight, frameWidth = frameBatch.shape[0:3]
+    if frameBatch.flags.c_contiguous:
+        tallImage = frameBatch.reshape(numFrames * frameHeight, frameWidth, -1)
+        cv2.LUT(tallImage, lookupTable, dst = tallImage)
+        return frameBatch
+
+    # Views (e.g. cropped batches) can't be reshaped without copying, so copy the result back in instead
+    tallImage = np.ascontiguousarray(frameBatch).reshape(numFrames * frameHeight, frameWidth, -1)
+    frameBatch[:] = cv2.LUT(tallImage, lookupTable).reshape(frameBatch.shape)
+
+    return frameBatch
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 14:31:22 2026
+
+@author: eo
+"""
+
+import os
+import cv2
+import numpy as np
+
+from local.lib.video.io import setupVideoRecordingV2
+from local.lib.video.probe import verifyRecording
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class MotionDetector:
+
+    '''
+    Cheap motion detector, which compares small, blurred grayscale copies of each frame against a background.
+    The background starts from a given frame (e.g. from loadBackground) or the first frame,
+    and is slowly updated (running average) so lighting changes don't count as motion.
+    Batches of frames can be checked with updateBatch, which does the (full-size) shrinking, grayscale
+    conversion & blurring for the whole batch at once, with the same results as checking frame-by-frame.
+    '''
+
+    def __init__(self, backgroundFrame=None, detectWidth=160, pixelThreshold=25, activeFraction=0.005,
+                 learningRate=0.02, triggerFrames=2):
+
+        # Store detection settings
+        self._detectWidth = detectWidth
+        self._pixelThreshold = pixelThreshold
+        self._activeFraction = activeFraction
+        self._learningRate = learningRate
+        self._triggerFrames = max(1, int(triggerFrames))
+
+        # Allocate storage for the (float) background & detection state
+        self._detectWH = None
+        self._background = None
+        self._activeRun = 0
+        self.lastScore = 0.0
+
+        # Start with the given background, if any
+        if backgroundFrame is not None:
+            self._background = np.float32(self._preprocess(backgroundFrame))
+
+    # .................................................................................................................
+
+    def update(self, frame):
+
+        ''' Returns True if the frame has motion (for at least the last few frames, to ignore single-frame glitches) '''
+
+        return self._checkMotion(self._preprocess(frame))
+
+    # .................................................................................................................
+
+    def updateBatch(self, frameBatch):
+
+        ''' Same as update, but for a (N, H, W, C) batch of frames. Returns a list of N results '''
+
+        # Only the comparison against the (small) background needs to be done one frame at a time
+        return [self._checkMotion(eachGray) for eachGray in self._preprocessBatch(frameBatch)]
+
+    # .................................................................................................................
+
+    def _checkMotion(self, smallGray):
+
+        if self._background is None:
+            self._background = np.float32(smallGray)
+            return False
+
+        # Score motion as the fraction of pixels that differ noticeably from the background
+        absDiff = cv2.absdiff(smallGray, cv2.convertScaleAbs(self._background))
+        numChanged = np.count_nonzero(absDiff > self._pixelThreshold)
+        self.lastScore = numChanged / absDiff.size
+        isActive = (self.lastScore >= self._activeFraction)
+
+        # Learn slower while there's motion, so moving objects don't get absorbed into the background
+        learningRate = self._learningRate * (0.1 if isActive else 1.0)
+        cv2.accumulateWeighted(smallGray, self._background, learningRate)
+
+        self._activeRun = (1 + self._activeRun) if isActive else 0
+
+        return self._activeRun >= self._triggerFrames
+
+    # .................................................................................................................
+
+    def _preprocess(self, frame):
+
+        # Figure out the (small) detection size from the first frame, keeping the aspect ratio
+        if self._detectWH is None:
+            self._setDetectSize(frame.shape)
+
+        smallFrame = cv2.resize(frame, dsize = self._detectWH, interpolation = cv2.INTER_AREA)
+        smallGray = cv2.cvtColor(smallFrame, cv2.COLOR_BGR2GRAY) if smallFrame.ndim > 2 else smallFrame
+
+        return cv2.GaussianBlur(smallGray, (5, 5), 0)
+
+    # .................................................................................................................
+
+    def _preprocessBatch(self, frameBatch):
+
+        numFrames, frameHeight, frameWidth = frameBatch.shape[0:3]
+        if self._detectWH is None:
+            self._setDetectSize(frameBatch.shape[1:])
+        detectWidth, detectHeight = self._detectWH
+
+        # Shrink the batch as one tall image. Each frame maps to exactly detectHeight rows, so frames don't mix
+        tallShape = (numFrames * frameHeight, frameWidth) + frameBatch.shape[3:]
+        tallImage = np.ascontiguousarray(frameBatch).reshape(tallShape)
+        smallTall = cv2.resize(tallImage, dsize = (detectWidth, numFrames * detectHeight),
+                               interpolation = cv2.INTER_AREA)
+        smallTall = cv2.cvtColor(smallTall, cv2.COLOR_BGR2GRAY) if smallTall.ndim > 2 else smallTall
+
+        # Blurring would mix rows between frames, so give each frame its own (reflected) border rows first.
+        # This matches the default border handling of blurring each frame separately
+        paddedBatch = np.pad(smallTall.reshape(numFrames, detectHeight, detectWidth), ((0, 0), (2, 2), (0, 0)),
+                             mode = "reflect")
+        blurredTall = cv2.GaussianBlur(paddedBatch.reshape(-1, detectWidth), (5, 5), 0)
+
+        return blurredTall.reshape(numFrames, 4 + detectHeight, detectWidth)[:, 2:-2]
+
+    # .................................................................................................................
+
+    def _setDetectSize(self, frameShape):
+        frameHeight, frameWidth = frameShape[0:2]
+        detectWidth = min(frameWidth, self._detectWidth)
+        self._detectWH = (detectWidth, max(1, int(round(frameHeight * detectWidth / frameWidth))))
+
+    # .................................................................................................................
+
+# =====================================================================================================================
+# =====================================================================================================================
+# =====================================================================================================================
+
+class EventClipExporter:
+
+    '''
+    Writes short clips around periods of activity, each to its own file.
+    Recent frames are held in a fixed-size (pre-allocated) ring, so each clip can start a few seconds
+    before the activity. The ring is sized by output frames, so frames that fill more than one output frame
+    (i.e. repeated when upsampling) still give the full pre-roll time. Frames are resized to the clip size
+    on the way in, so the ring only takes as much memory as the (usually scaled down) output needs.
+    Clips keep going until there's been no activity for the post-roll time.
+    Frames outside of events are never encoded.
+    '''
+
+    def __init__(self, outputPath, baseName, frameWH, fps, preRollSeconds=5.0, postRollSeconds=5.0,
+                 recFCC="X264"):
+
+        # Store clip settings
+        self._outputPath = outputPath
+        self._baseName = os.path.splitext(baseName)[0]
+        self._frameWH = (int(frameWH[0]), int(frameWH[1]))
+        self._fps = fps
+        self._recFCC = recFCC
+        self._postRollFrames = int(round(postRollSeconds * fps))
+
+        # Allocate the pre-roll ring, at the clip size. Every entry fills at least one output frame,
+        # so there never needs to be more entries than pre-roll frames
+        self._preRollFrames = max(0, int(round(preRollSeconds * fps)))
+        self._ringSize = self._preRollFrames
+        clipWidth, clipHeight = self._frameWH
+        self._ringFrames = np.empty((self._ringSize, clipHeight, clipWidth, 3), dtype=np.uint8)
+        self._ringInfo = [None] * self._ringSize
+        self._ringStart = 0
+        self._ringCount = 0
+        self._ringTotal = 0
+
+        # Allocate storage for the current clip & a record of every clip
+        self._clipRecorder = None
+        self._quietFrames = 0
+        self.eventList = []
+
+    # .................................................................................................................
+
+    def update(self, frame, isActive, frameTime=None, repeatCount=1):
+
+        # Start a new clip when activity begins, beginning with the pre-roll frames
+        if self._clipRecorder is None:
+            if not isActive:
+                self._pushRing(frame, frameTime, repeatCount)
+                return False
+            self._startClip(frameTime)
+
+        # Write the frame into the current clip
+        self._clipRecorder.write(self._resizeFrame(frame), repeatCount = repeatCount)
+        self.eventList[-1]["end_time"] = frameTime
+        self.eventList[-1]["frames"] += repeatCount
+
+        # End the clip once there's been no activity for long enough
+        self._quietFrames = 0 if isActive else (self._quietFrames + repeatCount)
+        if self._quietFrames > self._postRollFrames:
+            self._endClip()
+
+        return True
+
+    # .................................................................................................................
+
+    def release(self):
+        if self._clipRecorder is not None:
+            self._endClip()
+
+        return self.eventList
+
+    # .................................................................................................................
+
+    def _pushRing(self, frame, frameTime, repeatCount):
+
+        if self._ringSize < 1:
+            return
+
+        # Drop the oldest frames once the rest (along with the new frame) cover the pre-roll on their own
+        while self._ringCount > 0:
+            oldestRepeat = self._ringInfo[self._ringStart][1]
+            if (self._ringTotal + repeatCount - oldestRepeat) < self._preRollFrames:
+                break
+            self._ringStart = (1 + self._ringStart) % self._ringSize
+            self._ringCount -= 1
+            self._ringTotal -= oldestRepeat
+
+        slotIdx = (self._ringStart + self._ringCount) % self._ringSize
+        self._resizeFrame(frame, self._ringFrames[slotIdx])
+        self._ringInfo[slotIdx] = (frameTime, repeatCount)
+        self._ringCount += 1
+        self._ringTotal += repeatCount
+
+    # .................................................................................................................
+
+    def _resizeFrame(self, frame, dst=None):
+
+        # Match the clip size, writing straight into the given destination (e.g. a ring slot) if provided
+        clipWidth, clipHeight = self._frameWH
+        if frame.shape[0:2] != (clipHeight, clipWidth):
+            return cv2.resize(frame, dsize = self._frameWH, dst = dst, interpolation = cv2.INTER_AREA)
+        if dst is None:
+            return frame
+        np.copyto(dst, frame)
+
+        return dst
+
+    # .................................................................................................................
+
+    def _startClip(self, frameTime):
+
+        # Open a writer for the new clip
+        clipIndex = 1 + len(self.eventList)
+        clipName = "{}_event{:03d}".format(self._baseName, clipIndex)
+        self._clipRecorder = setupVideoRecordingV2(self._outputPath, clipName, self._frameWH,
+                                                   recFPS = self._fps, recFCC = self._recFCC)
+        self._quietFrames = 0
+
+        # Write out the pre-roll frames (oldest first), then empty the ring
+        startTime = frameTime
+        numPreRoll = 0
+        for ringIdx in range(self._ringCount):
+            slotIdx = (self._ringStart + ringIdx) % self._ringSize
+            ringTime, ringRepeat = self._ringInfo[slotIdx]
+
+            # The oldest frame may cover more than the pre-roll needs, so only write the part that fits
+            if ringIdx == 0:
+                ringRepeat -= max(0, self._ringTotal - self._preRollFrames)
+            self._clipRecorder.write(self._ringFrames[slotIdx], repeatCount = ringRepeat)
+            startTime = ringTime if ringIdx == 0 else startTime
+            numPreRoll += ringRepeat
+        self._ringStart, self._ringCount, self._ringTotal = 0, 0, 0
+
+        self.eventList.append({"source": self._clipRecorder.source,
+                               "start_time": startTime,
+                               "end_time": frameTime,
+                               "frames": numPreRoll})
+
+    # .................................................................................................................
+
+    def _endClip(self):
+
+        # Spot-check each clip once it's finished
+        self._clipRecorder.release()
+        self.eventList[-1]["verified"] = verifyRecording(self._clipRecorder, verbose = False)["ok"]
+        self._clipRecorder = None
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 16:20:14 2026
+
+@author: eo
+"""
+
+import os
+import cv2
+import numpy as np
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+from local.lib.video.sampling import iterFramesAtFractions
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class ExposureNormalizer:
+
+    '''
+    Evens out brightness differences between videos (e.g. from auto-exposure or day/night profile changes),
+    using lookup tables (LUTs) which map each video's brightness histogram onto a common reference.
+    Each video gets a few 'anchor' LUTs (from samples near its start, middle & end), and frames in between use
+    a blend of the two nearest anchor LUTs. So drift within a video is followed smoothly, and the frames on either
+    side of a boundary between videos are both mapped onto the same reference, avoiding jumps.
+    Blended LUTs are computed (in a fixed number of steps) once and cached, so normalizing a frame
+    is just a single cv2.LUT call.
+
+    Usage (per video):
+        normalizer.startVideo(fileIndex)
+        for each frame:
+            lookupTable = normalizer.lookupTable(frameIndex)
+    '''
+
+    def __init__(self, anchorLUTsList, anchorFractions, frameCountList, blendSteps=16):
+
+        # Store per-video info
+        self._anchorLUTsList = anchorLUTsList
+        self._anchorFractions = list(anchorFractions)
+        self._frameCountList = frameCountList
+        self._blendSteps = max(1, int(blendSteps))
+
+        # Allocate storage for per-video state & blended LUTs
+        self._fileIdx = 0
+        self._blendCache = {}
+
+    # .................................................................................................................
+
+    def startVideo(self, fileIndex):
+        self._fileIdx = fileIndex
+
+    # .................................................................................................................
+
+    def lookupTable(self, frameIndex):
+
+        ''' Get the (uint8, 256 entry) LUT to apply to the given frame of the current video '''
+
+        fileIdx = self._fileIdx
+        anchorLUTs = self._anchorLUTsList[fileIdx]
+
+        # Without a frame count we can't tell where we are in the video, so use the middle anchor
+        frameCount = self._frameCountList[fileIdx]
+        if frameCount < 2:
+            return anchorLUTs[len(anchorLUTs) // 2]
+
+        # Use the first/last anchor LUTs as-is outside of the anchor positions
+        framePosition = frameIndex / (frameCount - 1)
+        if framePosition <= self._anchorFractions[0]:
+            return anchorLUTs[0]
+        if framePosition >= self._anchorFractions[-1]:
+            return anchorLUTs[-1]
+
+        # Figure out how far we are between the two nearest anchors, in fixed steps so blended LUTs can be cached
+        anchorIdx = bisect_right(self._anchorFractions, framePosition) - 1
+        prevFraction, nextFraction = self._anchorFractions[anchorIdx], self._anchorFractions[1 + anchorIdx]
+        blendStep = int(round(self._blendSteps * (framePosition - prevFraction) / (nextFraction - prevFraction)))
+        if blendStep <= 0:
+            return anchorLUTs[anchorIdx]
+        if blendStep >= self._blendSteps:
+            return anchorLUTs[1 + anchorIdx]
+
+        cacheKey = (fileIdx, anchorIdx, blendStep)
+        if cacheKey not in self._blendCache:
+            blendWeight = blendStep / self._blendSteps
+            blendedLUT = (1.0 - blendWeight) * anchorLUTs[anchorIdx] + blendWeight * anchorLUTs[1 + anchorIdx]
+            self._blendCache[cacheKey] = np.uint8(np.clip(np.round(blendedLUT), 0, 255))
+
+        return self._blendCache[cacheKey]
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define functions
+
+def lumaCDF(frameList):
+
+    ''' Get the cumulative (normalized) brightness histogram of a set of frames '''
+
+    lumaHist = np.zeros(256, dtype=np.float64)
+    for eachFrame in frameList:
+        grayFrame = cv2.cvtColor(eachFrame, cv2.COLOR_BGR2GRAY) if eachFrame.ndim > 2 else eachFrame
+        lumaHist += cv2.calcHist([grayFrame], [0], None, [256], [0, 256]).ravel()
+
+    lumaCumulative = np.cumsum(lumaHist)
+
+    return lumaCumulative / max(1.0, lumaCumulative[-1])
+
+# .....................................................................................................................
+
+def matchingLUT(sourceCDF, referenceCDF):
+
+    ''' Build a LUT that maps brightness levels so the source histogram matches the reference histogram '''
+
+    # For each source level, find the first reference level that reaches the same cumulative fraction.
+    # (Interpolating doesn't work well here, since the CDFs are flat wherever a level has no pixels)
+    mappedLevels = np.searchsorted(referenceCDF, sourceCDF - 1E-9, side = "left")
+
+    return np.uint8(np.clip(mappedLevels, 0, 255))
+
+# .....................................................................................................................
+
+def sampleAnchorCDFs(videoSource, anchorFractions, sampleSpread=0.02, sampleWH=(160, 90)):
+
+    '''
+    Get brightness CDFs at a few (fractional) positions within a video, each using a few frames
+    spread around the position. Returns a list with one CDF per anchor (None if no frames could be read)
+    '''
+
+    # Sample a few frames around each anchor
+    fractionList, anchorIdxList = [], []
+    for anchorIdx, eachFraction in enumerate(anchorFractions):
+        for eachOffset in (-sampleSpread, 0, sampleSpread):
+            fractionList.append(min(1.0, max(0.0, eachFraction + eachOffset)))
+            anchorIdxList.append(anchorIdx)
+
+    # Group the sampled frames by anchor
+    anchorFramesList = [[] for _ in anchorFractions]
+    for eachFraction, _, eachFrame in iterFramesAtFractions(videoSource, fractionList, sampleWH):
+        anchorFramesList[anchorIdxList[fractionList.index(eachFraction)]].append(eachFrame)
+
+    return [lumaCDF(eachFrameList) if len(eachFrameList) > 0 else None for eachFrameList in anchorFramesList]
+
+# .....................................................................................................................
+
+def buildExposureNormalizer(videoSourceList, frameCountList, anchorFractions=(0.03, 0.5, 0.97),
+                            maxWorkers=None, verbose=True):
+
+    '''
+    Sample a few (small) frames near the start, middle & end of every video (in parallel) to get brightness
+    histograms, then build LUTs mapping each of them to a common reference (the median of all the histograms).
+
+    outputs:
+        - exposureNormalizer: ExposureNormalizer object
+    '''
+
+    # Get brightness CDFs from every video. OpenCV releases the GIL while decoding, so threads are enough
+    numWorkers = maxWorkers if maxWorkers is not None else min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers = numWorkers) as executor:
+        cdfLists = list(executor.map(sampleAnchorCDFs, videoSourceList, [anchorFractions] * len(videoSourceList)))
+
+    # Use the median as the reference, so a few odd videos don't skew everything
+    validCDFs = [eachCDF for eachCDFList in cdfLists for eachCDF in eachCDFList if eachCDF is not None]
+    identityLUT = np.arange(256, dtype=np.uint8)
+    if len(validCDFs) < 1:
+        return ExposureNormalizer([[identityLUT] for _ in videoSourceList], [0.5], frameCountList)
+    referenceCDF = np.median(np.array(validCDFs), axis = 0)
+
+    # Build the anchor LUTs. Anchors that couldn't be sampled are left alone
+    anchorLUTsList = [[identityLUT if eachCDF is None else matchingLUT(eachCDF, referenceCDF)
+                       for eachCDF in eachCDFList] for eachCDFList in cdfLists]
+
+    # Some feedback
+    if verbose:
+        levelShifts = [np.sum(np.diff(eachCDF, prepend = 0) * np.abs(np.int32(eachLUT) - identityLUT))
+                       for eachCDFList, eachLUTs in zip(cdfLists, anchorLUTsList)
+                       for eachCDF, eachLUT in zip(eachCDFList, eachLUTs) if eachCDF is not None]
+        print("")
+        print("Exposure normalization:", len(cdfLists), "file(s) sampled")
+        print("  Average brightness correction: {:.1f} levels (max {:.1f})".format(np.mean(levelShifts),
+                                                                                   np.max(levelShifts)))
+
+    return ExposureNormalizer(anchorLUTsList, anchorFractions, frameCountList)
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 09:05:38 2026
+
+@author: eo
+"""
+
+import os
+import cv2
+import json
+import struct
+import numpy as np
+import datetime as dt
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define constants
+
+# File extension used to recognize frame store files
+FRAME_STORE_EXT = ".vsfs"
+
+# Store layout:
+#   [header (padded to one page)] [raw frames (M x H x W x C, uint8)] [frame index (N records)] [source list (json)]
+# Repeated frames are only stored once, so there can be fewer raw frames (M) than indexed frames (N).
+# Each index record gives the slot of its raw frame
+_HEADER_MAGIC = b"VSFS"
+_HEADER_VERSION = 2
+_HEADER_FORMAT = "<4sIIIIQQdQQQ"
+_HEADER_SIZE = 4096
+_INDEX_DTYPE = np.dtype([("file_idx", "<i4"), ("frame_idx", "<i4"), ("time", "<f8"), ("slot", "<i8")])
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class FrameStoreWriter:
+
+    '''
+    Writes decoded frames (at a fixed working resolution) into a single raw file, so that later exports
+    can skip decoding entirely. Each frame also gets an index record with its source file, source frame index
+    and wall-clock time (if known). Frames of the wrong size are resized before storing.
+    Repeated frames (e.g. from frame rate up-sampling) are stored once, with an index record for each repeat.
+    '''
+
+    def __init__(self, storePath, frameWH, storeFPS, sourceList=None):
+
+        # Store settings
+        self.source = storePath if storePath.endswith(FRAME_STORE_EXT) else storePath + FRAME_STORE_EXT
+        self._frameWH = (int(frameWH[0]), int(frameWH[1]))
+        self._shapeHWC = (self._frameWH[1], self._frameWH[0], 3)
+        self._fps = storeFPS
+        self._sourceList = [] if sourceList is None else list(sourceList)
+
+        # Allocate storage for the index, which is written after all the frames
+        self._indexList = []
+        self._slotCount = 0
+
+        # Open the file and reserve space for the header (filled in on release)
+        self._file = open(self.source, "wb")
+        self._file.write(bytes(_HEADER_SIZE))
+
+        # Feedback
+        print("")
+        print("Saving decoded frames to:")
+        print(self.source)
+
+    # .................................................................................................................
+
+    def __len__(self):
+        return len(self._indexList)
+
+    # .................................................................................................................
+
+    def write(self, frame, fileIdx=-1, frameIdx=-1, frameTime=None, repeatCount=1):
+
+        # Make sure the frame matches the store format
+        if frame.ndim < 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        if frame.shape != self._shapeHWC:
+            frame = cv2.resize(frame, dsize = self._frameWH, interpolation = cv2.INTER_AREA)
+
+        # Write raw frame data once, along with an index record for every repeat
+        self._file.write(np.ascontiguousarray(frame).data)
+        frameTimeSec = np.nan if frameTime is None else frameTime.timestamp()
+        indexRecord = (fileIdx, frameIdx, frameTimeSec, self._slotCount)
+        self._indexList.extend([indexRecord] * repeatCount)
+        self._slotCount += 1
+
+    # .................................................................................................................
+
+    def release(self):
+
+        if self._file is None:
+            return
+
+        # Write the frame index & source list after the frame data
+        numFrames = len(self._indexList)
+        indexOffset = self._file.tell()
+        self._file.write(np.array(self._indexList, dtype=_INDEX_DTYPE).tobytes())
+        sourcesOffset = self._file.tell()
+        sourcesBytes = json.dumps(self._sourceList).encode()
+        self._file.write(sourcesBytes)
+
+        # Go back and fill in the header, now that we know how many frames were stored
+        headerBytes = struct.pack(_HEADER_FORMAT, _HEADER_MAGIC, _HEADER_VERSION,
+                                  self._frameWH[0], self._frameWH[1], 3,
+                                  numFrames, self._slotCount, self._fps,
+                                  indexOffset, sourcesOffset, len(sourcesBytes))
+        self._file.seek(0)
+        self._file.write(headerBytes)
+        self._file.close()
+        self._file = None
+
+        # Feedback
+        print("")
+        print("Frame store saved:", numFrames, "frames ({} stored),".format(self._slotCount),
+              "{:.1f} MB".format(os.path.getsize(self.source)/1E6))
+
+    # .................................................................................................................
+
+
+# =====================================================================================================================
+# =====================================================================================================================
+# =====================================================================================================================
+
+class FrameStoreReader:
+
+    '''
+    Reads frames from a frame store file using memory-mapping, so frames are returned as zero-copy (read-only)
+    numpy views with random access. Indexing goes through the frame index, so repeated frames come out as
+    repeats. Also mimics the parts of cv2.VideoCapture used in this project, so a store can be used anywhere
+    a video file can.
+    '''
+
+    def __init__(self, storePath):
+
+        self.source = storePath
+        self._frameIdx = 0
+        self._opened = False
+
+        # Read the header
+        with open(storePath, "rb") as inFile:
+            headerBytes = inFile.read(struct.calcsize(_HEADER_FORMAT))
+        (magic, version, frameWidth, frameHeight, frameChannels,
+         numFrames, numStored, self._fps,
+         indexOffset, sourcesOffset, sourcesLength) = struct.unpack(_HEADER_FORMAT, headerBytes)
+
+        # Bail if this isn't actually a frame store (or it was never finished)
+        if magic != _HEADER_MAGIC or version != _HEADER_VERSION:
+            print("")
+            print("Not a valid frame store file:")
+            print(storePath)
+            return
+
+        # Memory-map the (stored) frame data & index
+        self.frameWH = (frameWidth, frameHeight)
+        frameShape = (numStored, frameHeight, frameWidth, frameChannels)
+        if numFrames > 0:
+            self.frames = np.memmap(storePath, dtype=np.uint8, mode="r", offset=_HEADER_SIZE, shape=frameShape)
+            self.index = np.memmap(storePath, dtype=_INDEX_DTYPE, mode="r", offset=indexOffset, shape=(numFrames,))
+        else:
+            self.frames = np.zeros(frameShape, dtype=np.uint8)
+            self.index = np.zeros((0,), dtype=_INDEX_DTYPE)
+
+        # Load the list of source files
+        with open(storePath, "rb") as inFile:
+            inFile.seek(sourcesOffset)
+            self.sourceList = json.loads(inFile.read(sourcesLength).decode())
+
+        self._opened = True
+
+    # .................................................................................................................
+
+    def __len__(self):
+        return len(self.index) if self._opened else 0
+
+    # .................................................................................................................
+
+    def __getitem__(self, frameIdx):
+        return self.frames[self.index["slot"][frameIdx]]
+
+    # .................................................................................................................
+
+    def frameTimestamp(self, frameIdx=None):
+
+        ''' Get the wall-clock time (datetime) of a frame. Defaults to the last grabbed frame. None if unknown '''
+
+        frameIdx = (self._frameIdx - 1) if frameIdx is None else frameIdx
+        frameTimeSec = self.index["time"][max(0, frameIdx)]
+
+        return None if np.isnan(frameTimeSec) else dt.datetime.fromtimestamp(frameTimeSec)
+
+    # .................................................................................................................
+
+    def frameSource(self, frameIdx=None):
+
+        ''' Get the (source file index, source frame index) of a frame. Defaults to the last grabbed frame '''
+
+        frameIdx = (self._frameIdx - 1) if frameIdx is None else frameIdx
+        indexRecord = self.index[max(0, frameIdx)]
+
+        return int(indexRecord["file_idx"]), int(indexRecord["frame_idx"])
+
+    # .................................................................................................................
+
+    def isOpened(self):
+        return self._opened
+
+    # .................................................................................................................
+
+    def grab(self):
+
+        # Nothing to decode, so grabbing just advances the read position
+        if self._frameIdx >= len(self):
+            return False
+        self._frameIdx += 1
+
+        return True
+
+    # .................................................................................................................
+
+    def retrieve(self):
+
+        if self._frameIdx < 1 or self._frameIdx > len(self):
+            return False, None
+
+        return True, self[self._frameIdx - 1]
+
+    # .................................................................................................................
+
+    def read(self):
+        return self.retrieve() if self.grab() else (False, None)
+
+    # .................................................................................................................
+
+    def get(self, propertyCode):
+
+        if propertyCode == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.frameWH[0])
+        if propertyCode == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.frameWH[1])
+        if propertyCode == cv2.CAP_PROP_FPS:
+            return float(self._fps)
+        if propertyCode == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self))
+        if propertyCode == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._frameIdx)
+        if propertyCode == cv2.CAP_PROP_POS_MSEC:
+            return 1000.0 * max(0, self._frameIdx - 1) / self._fps
+
+        return 0.0
+
+    # .................................................................................................................
+
+    def set(self, propertyCode, value):
+
+        # Only seeking is supported
+        if propertyCode == cv2.CAP_PROP_POS_FRAMES:
+            self._frameIdx = max(0, min(len(self), int(value)))
+            return True
+
+        return False
+
+    # .................................................................................................................
+
+    def release(self):
+
+        # Drop references to the memory-maps so the file can be closed
+        self.frames = np.zeros((0, 1, 1, 3), dtype=np.uint8)
+        self.index = np.zeros((0,), dtype=_INDEX_DTYPE)
+        self._opened = False
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define functions
+
+def isFrameStore(source):
+    return isinstance(source, str) and source.lower().endswith(FRAME_STORE_EXT)
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
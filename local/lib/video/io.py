@@ -7,13 +7,425 @@ Created on Tue Jun  5 15:01:29 2018
 """
 
 import os
+import re
 import cv2
 import datetime as dt
+from bisect import bisect_right
+from collections import OrderedDict
+
+from local.lib.video.framestore import FrameStoreReader, isFrameStore
+from local.lib.video.seekindex import IndexedCapture, loadSeekIndex
 
 
 # ---------------------------------------------------------------------------------------------------------------------
 #%% Define classes
 
+class VideoRecorder:
+    
+    '''
+    Wrapper around cv2.VideoWriter which handles timelapsing and frame reshaping.
+    Frames are only converted (resized and/or gray-to-BGR) if they don't already match the recording format,
+    so correctly sized frames are written directly without any copying.
+    Resizing is expected (e.g. when recording at a reduced scale), so the size of the first frame is taken as the
+    normal input size. Warnings are only given for frames that differ from this or that aren't 3-channel.
+    Also keeps hashes of a (bounded) set of evenly spaced written frames, so the output can be spot-checked
+    after recording without decoding all of it (see verifyRecording).
+    '''
+    
+    def __init__(self, recSource, recWH, recFPS=30, recTimelapse=1, recFCC="X264", recEnabled=True, 
+                 maxSampleHashes=32):
+        
+        # Store recording settings
+        self.source = recSource
+        self._sizeWH = (int(recWH[0]), int(recWH[1]))
+        self._shapeHW = (self._sizeWH[1], self._sizeWH[0])
+        self._fps = recFPS
+        self._timelapse = max(1, int(recTimelapse))
+        
+        # Allocate storage for frame counting
+        self._inputCount = 0
+        self._writeCount = 0
+        self._convertCount = 0
+        self._inputShapeHW = None
+        self._gaveWarning = False
+        
+        # Allocate storage for sampled frame hashes. The sampling stride doubles whenever there are too many samples
+        self.sampleHashes = {}
+        self._sampleStride = 1
+        self._maxSampleHashes = max(1, int(maxSampleHashes))
+        
+        # Set up the video writer, as long as recording is enabled
+        self._videoOut = None
+        if recEnabled:
+            self._createWriter(recFCC)
+            
+        else:
+            print("")
+            print("Recording not enabled!")
+            
+            # Blowout functions if recording is disabled, so the recorder can still be called but does nothing
+            def blankFunc(*args, **kwargs): return None
+            def falseFunc(*args, **kwargs): return False
+            def zeroFunc(*args, **kwargs): return 0
+            self.isRecordFrame = falseFunc
+            self.write = falseFunc
+            self.writeClaimed = falseFunc
+            self.claim = zeroFunc
+            self.skip = blankFunc
+            self.release = blankFunc
+    
+    # .................................................................................................................
+    
+    def isRecordFrame(self, numFrames=1):
+        
+        ''' Returns True if (any of) the next frame(s) given to the recorder will be written (i.e. not timelapsed) '''
+        
+        return self._countRecordFrames(numFrames) > 0
+    
+    # .................................................................................................................
+    
+    def skip(self, numFrames=1):
+        
+        ''' Count input frames without providing them. Use when the frames aren't going to be recorded anyways '''
+        
+        self._inputCount += numFrames
+    
+    # .................................................................................................................
+    
+    def claim(self, numFrames=1):
+        
+        ''' 
+        Count input frames and return the number of times the frame should be recorded. 
+        Use with writeClaimed when frames are written later (e.g. in batches), so timelapsing stays in order
+        '''
+        
+        numRecord = self._countRecordFrames(numFrames)
+        self._inputCount += numFrames
+        
+        return numRecord
+    
+    # .................................................................................................................
+    
+    def write(self, inFrame, repeatCount=1):
+        
+        # Increment frame count, regardless of whether a frame is recorded or not
+        return self.writeClaimed(inFrame, self.claim(repeatCount))
+    
+    # .................................................................................................................
+    
+    def writeClaimed(self, inFrame, numRecord):
+        
+        # Nothing to do if the frame was timelapsed out
+        if numRecord < 1:
+            return False
+        
+        # Check if the incoming frame matches the recording format
+        inShapeHW = inFrame.shape[0:2]
+        inChannels = inFrame.shape[2] if inFrame.ndim > 2 else 1
+        needReshape = (inShapeHW != self._shapeHW)
+        needBGR = (inChannels != 3)
+        
+        # Only convert the frame if needed. Both conversions return new frames, so no copy is needed
+        recFrame = inFrame
+        if needBGR:
+            grayToBGR = cv2.COLOR_GRAY2BGR if inChannels == 1 else cv2.COLOR_BGRA2BGR
+            recFrame = cv2.cvtColor(recFrame, grayToBGR)
+        if needReshape:
+            recFrame = cv2.resize(recFrame, dsize=self._sizeWH)
+        
+        # Record video frame (more than once if the frame is being repeated)
+        for _ in range(numRecord):
+            self._videoOut.write(recFrame)
+        self._hashSamples(recFrame, self._writeCount, numRecord)
+        self._writeCount += numRecord
+        
+        # Give warning about unexpected conversions (i.e. not just the usual resizing), but only once
+        if needReshape or needBGR:
+            self._convertCount += 1
+        if self._inputShapeHW is None:
+            self._inputShapeHW = inShapeHW
+        if (needBGR or inShapeHW != self._inputShapeHW) and not self._gaveWarning:
+            print("")
+            print("Video recording warning:")
+            print("Input frame dimensions do not match earlier frames or recording format!")
+            print("Got dimensions:")
+            print(inShapeHW, inChannels)
+            print("Expected:")
+            print(self._inputShapeHW, 3)
+            print("Frames will be converted before recording")
+            self._gaveWarning = True
+        
+        return True
+    
+    # .................................................................................................................
+    
+    def release(self):
+        if self._videoOut is not None:
+            self._videoOut.release()
+    
+    # .................................................................................................................
+    
+    def report(self):
+        
+        # Get the size of the output file (will grow while recording)
+        bytesWritten = os.path.getsize(self.source) if os.path.exists(self.source) else 0
+        
+        return {"frames_in": self._inputCount,
+                "frames_written": self._writeCount,
+                "frames_converted": self._convertCount,
+                "bytes_written": bytesWritten,
+                "fps": self._fps}
+    
+    # .................................................................................................................
+    
+    def _hashSamples(self, recFrame, firstWriteIdx, numRecord):
+        
+        # Only hash the frame if one of its (repeated) copies lands on the sampling stride
+        sampleIdx = self._sampleStride * ((firstWriteIdx + self._sampleStride - 1) // self._sampleStride)
+        if sampleIdx >= firstWriteIdx + numRecord:
+            return
+        
+        # Imported here, since the alignment functions depend on this module
+        from local.lib.video.alignment import frameHash
+        self.sampleHashes[sampleIdx] = frameHash(recFrame)
+        
+        # Thin out the samples (keeping them evenly spaced) once there are too many
+        if len(self.sampleHashes) > 2 * self._maxSampleHashes:
+            self._sampleStride *= 2
+            self.sampleHashes = {eachIdx: eachHash for eachIdx, eachHash in self.sampleHashes.items() 
+                                 if eachIdx % self._sampleStride == 0}
+    
+    # .................................................................................................................
+    
+    def _countRecordFrames(self, numFrames):
+        
+        # Count how many of the next input frames land on the timelapse stride
+        firstIdx = self._inputCount
+        lastIdx = self._inputCount + numFrames - 1
+        
+        return (lastIdx // self._timelapse) - ((firstIdx - 1) // self._timelapse)
+    
+    # .................................................................................................................
+    
+    def _createWriter(self, recFCC):
+        
+        # Create video writer based on input parameters
+        fourcc = cv2.VideoWriter_fourcc(*recFCC)
+        outputColorImage = True     # OpenCV property constant, named here for clarity
+        self._videoOut = cv2.VideoWriter(self.source, fourcc, self._fps, self._sizeWH, outputColorImage)
+        
+        # Make sure the writer actually opened, otherwise we'd silently record nothing
+        if not self._videoOut.isOpened():
+            print("")
+            print("Couldn't open video writer. Tried:")
+            print(self.source)
+            print("Codec:", recFCC)
+            print("Closing...")
+            print("")
+            raise IOError
+        
+        # Feedback
+        print("")
+        print("Recording enabled! Saving as:")
+        print(self.source)
+        
+    # .................................................................................................................
+
+
+# =====================================================================================================================
+# =====================================================================================================================
+# =====================================================================================================================
+
+class ChunkListCapture:
+    
+    '''
+    Presents an ordered list of videos (chunks) as one continuous video, mimicking cv2.VideoCapture.
+    A cumulative frame count index is used to map global frame indices (or times) to a (file, local frame) pair
+    with a binary search. A small pool of capture objects is kept open (least-recently-used are closed first),
+    so jumping back and forth between neighbouring chunks doesn't require re-opening files.
+    '''
+    
+    def __init__(self, videoSourceList, frameCountList=None, fpsList=None, maxOpen=3):
+        
+        # Store chunk info
+        self.sourceList = list(videoSourceList)
+        self._maxOpen = max(1, int(maxOpen))
+        self._capturePool = OrderedDict()
+        
+        # Get frame counts & frame rates from the video headers, if they aren't provided
+        if (frameCountList is None) or (fpsList is None):
+            headerCounts, headerFPS = self._readHeaders()
+            frameCountList = headerCounts if frameCountList is None else frameCountList
+            fpsList = headerFPS if fpsList is None else fpsList
+        self.frameCountList = [max(0, int(eachCount)) for eachCount in frameCountList]
+        self.fpsList = list(fpsList)
+        
+        # Build cumulative frame & time indices, used for binary searching
+        self._frameStarts = [0]
+        self._timeStarts = [0.0]
+        for eachCount, eachFPS in zip(self.frameCountList, self.fpsList):
+            self._frameStarts.append(self._frameStarts[-1] + eachCount)
+            self._timeStarts.append(self._timeStarts[-1] + eachCount / eachFPS)
+        self._totalFrames = self._frameStarts[-1]
+        
+        # Allocate storage for the read position
+        self._fileIdx = 0
+        self._localIdx = 0
+        self._grabbedObj = None
+        
+    # .................................................................................................................
+    
+    def locate(self, frameIndex):
+        
+        ''' Map a global frame index to a (file index, local frame index) pair '''
+        
+        frameIndex = max(0, min(self._totalFrames - 1, int(frameIndex)))
+        fileIdx = bisect_right(self._frameStarts, frameIndex) - 1
+        fileIdx = min(fileIdx, len(self.sourceList) - 1)
+        
+        return fileIdx, frameIndex - self._frameStarts[fileIdx]
+    
+    # .................................................................................................................
+    
+    def locateTime(self, timeSec):
+        
+        ''' Map a global time (in seconds) to a (file index, local frame index) pair '''
+        
+        fileIdx = bisect_right(self._timeStarts, max(0.0, timeSec)) - 1
+        fileIdx = max(0, min(fileIdx, len(self.sourceList) - 1))
+        localIdx = int((timeSec - self._timeStarts[fileIdx]) * self.fpsList[fileIdx])
+        localIdx = max(0, min(self.frameCountList[fileIdx] - 1, localIdx))
+        
+        return fileIdx, localIdx
+    
+    # .................................................................................................................
+    
+    def currentSource(self):
+        return self.sourceList[self._fileIdx]
+    
+    # .................................................................................................................
+    
+    def isOpened(self):
+        return self._totalFrames > 0
+    
+    # .................................................................................................................
+    
+    def grab(self):
+        
+        # Move on to the next chunk(s) if we reach the end of the current one
+        while self._fileIdx < len(self.sourceList):
+            videoObj = self._getCapture(self._fileIdx, self._localIdx)
+            if videoObj is not None and videoObj.grab():
+                self._grabbedObj = videoObj
+                self._localIdx += 1
+                return True
+            
+            self._fileIdx += 1
+            self._localIdx = 0
+        
+        self._grabbedObj = None
+        
+        return False
+    
+    # .................................................................................................................
+    
+    def retrieve(self):
+        
+        if self._grabbedObj is None:
+            return False, None
+        
+        return self._grabbedObj.retrieve()
+    
+    # .................................................................................................................
+    
+    def read(self):
+        return self.retrieve() if self.grab() else (False, None)
+    
+    # .................................................................................................................
+    
+    def get(self, propertyCode):
+        
+        globalIdx = self._frameStarts[min(self._fileIdx, len(self.sourceList))] + self._localIdx
+        if propertyCode == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self._totalFrames)
+        if propertyCode == cv2.CAP_PROP_POS_FRAMES:
+            return float(globalIdx)
+        if propertyCode == cv2.CAP_PROP_FPS:
+            return float(self.fpsList[min(self._fileIdx, len(self.fpsList) - 1)])
+        if propertyCode == cv2.CAP_PROP_POS_MSEC:
+            fileIdx = min(self._fileIdx, len(self.sourceList) - 1)
+            localTime = max(0, self._localIdx - 1) / self.fpsList[fileIdx]
+            return 1000.0 * (self._timeStarts[fileIdx] + localTime)
+        
+        # Anything else comes from the current chunk
+        videoObj = self._getCapture(min(self._fileIdx, len(self.sourceList) - 1))
+        
+        return 0.0 if videoObj is None else videoObj.get(propertyCode)
+    
+    # .................................................................................................................
+    
+    def set(self, propertyCode, value):
+        
+        # Only seeking is supported
+        if propertyCode == cv2.CAP_PROP_POS_FRAMES:
+            fileIdx, localIdx = self.locate(value)
+        elif propertyCode == cv2.CAP_PROP_POS_MSEC:
+            fileIdx, localIdx = self.locateTime(value / 1000.0)
+        else:
+            return False
+        
+        # Seek within the target chunk
+        videoObj = self._getCapture(fileIdx, localIdx)
+        self._fileIdx, self._localIdx = fileIdx, localIdx
+        self._grabbedObj = None
+        
+        return videoObj is not None
+    
+    # .................................................................................................................
+    
+    def release(self):
+        for eachCapture in self._capturePool.values():
+            eachCapture.release()
+        self._capturePool = OrderedDict()
+        self._grabbedObj = None
+    
+    # .................................................................................................................
+    
+    def _getCapture(self, fileIdx, localIdx=None):
+        
+        # Re-use an open capture if possible, otherwise open it (and close the least recently used capture)
+        videoObj = self._capturePool.get(fileIdx)
+        if videoObj is None:
+            videoObj = openVideoCapture(self.sourceList[fileIdx])
+            if not videoObj.isOpened():
+                return None
+            self._capturePool[fileIdx] = videoObj
+            if len(self._capturePool) > self._maxOpen:
+                _, oldCapture = self._capturePool.popitem(last = False)
+                oldCapture.release()
+        self._capturePool.move_to_end(fileIdx)
+        
+        # Seek if needed (skipped when already in position, so sequential reading never seeks)
+        if localIdx is not None and int(videoObj.get(cv2.CAP_PROP_POS_FRAMES)) != localIdx:
+            videoObj.set(cv2.CAP_PROP_POS_FRAMES, localIdx)
+        
+        return videoObj
+    
+    # .................................................................................................................
+    
+    def _readHeaders(self):
+        
+        frameCountList, fpsList = [], []
+        for eachSource in self.sourceList:
+            videoObj = openVideoCapture(eachSource)
+            frameCountList.append(int(videoObj.get(cv2.CAP_PROP_FRAME_COUNT)) if videoObj.isOpened() else 0)
+            vidFPS = videoObj.get(cv2.CAP_PROP_FPS) if videoObj.isOpened() else 0
+            fpsList.append(vidFPS if (5 < vidFPS < 61) else 30)
+            videoObj.release()
+        
+        return frameCountList, fpsList
+    
+    # .................................................................................................................
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -49,6 +461,28 @@ def scaleToTarget(vidWH, targetWH, fitInTarget=True):
 
 # .....................................................................................................................
 
+def openVideoCapture(source):
+    
+    ''' 
+    Create a video capture object for the given source. 
+    Lists of videos get a ChunkListCapture and frame store files (see framestore.py) get a store reader, 
+    both of which mimic cv2.VideoCapture. Video files with a stored seek index (see seekindex.py) 
+    are wrapped so that all seeking goes through the index
+    '''
+    
+    if isinstance(source, (list, tuple)):
+        return ChunkListCapture(source)
+    
+    if isFrameStore(source):
+        return FrameStoreReader(source)
+    
+    videoObj = cv2.VideoCapture(source)
+    seekIndex = loadSeekIndex(source) if videoObj.isOpened() else None
+    
+    return videoObj if seekIndex is None else IndexedCapture(videoObj, seekIndex)
+
+# .....................................................................................................................
+
 def setupVideoCapture(source, verbose=True):
     
     # OpenCV constants
@@ -59,7 +493,7 @@ def setupVideoCapture(source, verbose=True):
     vc_framecount = 7 
         
     # Set up video capture object
-    videoObj = cv2.VideoCapture(source)
+    videoObj = openVideoCapture(source)
     if not videoObj.isOpened():
         print("")
         print("Couldn't open video object. Tried:")
@@ -70,10 +504,13 @@ def setupVideoCapture(source, verbose=True):
         
     # Check for webcam inputs
     isWebcam = (type(source) is int)   
+    isChunkList = isinstance(source, (list, tuple))
 
     # Try to set the video name based on the input source
     if isWebcam:
         videoName = "Webcam-{}".format(source)
+    elif isChunkList:
+        videoName = "{} (+{} more)".format(os.path.basename(source[0]), len(source) - 1)
     else:    
         if "rtsp" in source.lower():
             # Try to grab the IP numbers out of the RTSP string
@@ -171,118 +608,55 @@ def setupVideoRecording(recPath, recName, recWH, recFPS=30, recFCC="X264", recEn
     return videoOut
 
 # .....................................................................................................................
-    
 
-# .....................................................................................................................
-    
 def setupVideoRecordingV2(recPath, recName, recWH, recFPS=30, recTimelapse=1, recFCC="X264", recEnabled=True):
     
-    raise NotImplementedError
+    # Check if file name has extension, if not, use .avi
+    recFilename, recFileExt = os.path.splitext(recName)
+    if recFileExt == "":
+        recFileExt = ".avi"
+    recName = "".join([recFilename, recFileExt])
+    videoOutSource = os.path.join(recPath, recName)
     
-    videoOut = None
-    if recEnabled:
-        
-        # Check if file name has extension, if not, use .avi
-        recFilename, recFileExt = os.path.splitext(recName)
-        if recFileExt == "":
-            recFileExt = ".avi"
-        recName = "".join([recFilename, recFileExt])
-        
-        # Define output variables
-        fourcc = cv2.VideoWriter_fourcc(*recFCC)
-        videoOutSource = os.path.join(recPath, recName)
-        
-        # Create video writer based on input parameters
-        outputColorImage = True     # OpenCV property constant, named here for clarity
-        videoOut = cv2.VideoWriter(videoOutSource, 
-                                   fourcc, 
-                                   recFPS,
-                                   recWH, 
-                                   outputColorImage)
-        
-        # Feedback
-        print("")
-        print("Recording enabled! Saving as:")
-        print(videoOutSource)
-        
-        # Create helper class that can reshape incoming frames for the video recorder
-        class VideoRecorder:
-            
-            def __init__(self, videoWriter, frameWH, timelapse=1):
-                
-                self._frameCount = 0
-                self._shapeHW = (frameWH[1], frameWH[0])
-                self._sizeWH = (frameWH[0], frameWH[1])
-                self._timelapse = timelapse
-                self._videoOut = videoWriter
-                self._gaveWarning = False
-                
-            def write(self, inFrame):
-                
-                if self._frameCount % self._timelapse == 0:
-                    
-                    needReshape = False
-                    inShapeHW = inFrame.shape[:2]
-                    inChannels = inFrame[2] if len(inFrame.shape) > 2 else 1
-                    
-                    needReshape = (inShapeHW != self._shapeHW)
-                    needBGR = (inChannels != 3)
-                    
-                    recFrame = inFrame.copy if (needReshape or needBGR) else inFrame
-                    
-                    
-                    # Resize the image if needed
-                    if needReshape:
-                        recFrame = cv2.resize(recFrame, dsize=self._sizeWH)
-                        
-                    # Convert a grayscale image into a 3 channel image if needed
-                    if needBGR:
-                        recFrame = cv2.cvtColor(recFrame, cv2.COLOR_GRAY2BGR)
-                        
-                    # Record video frame
-                    self._videoOut.write(recFrame)
-                    
-                    # Give warning, if needed
-                    if needReshape or needBGR:                            
-                        if not self._gaveWarning:
-                            # Feedback
-                            print("")
-                            print("Video recording warning:")
-                            print("Input frame dimensions do not match recording dimensions!")
-                            print("Got dimensions:")
-                            print(inShapeHW, inChannels)
-                            print("Expected:")
-                            print(self._shapeWH, 3)
-                            self._gaveWarning = True
-
-                # Increment frame count, regardless of whether a frame was recorded or not
-                self._frameCount += 1
-            
-            def release(self):                    
-                self._videoOut.release()
-            
-            
+    return VideoRecorder(videoOutSource, recWH, recFPS, recTimelapse, recFCC, recEnabled)
+
+# .....................................................................................................................
+
+def getVideoStartTime(videoSource, vidFPS=None, totalFrames=None, verbose=True):
+    
+    '''
+    outputs:
+        - startTime: datetime of the first frame of the video
         
-    else:
-        print("")
-        print("Recording not enabled!")
+    inputs:
+        - videoSource: path to a video file. If the file name contains a timestamp (e.g. 2018-07-09_10-14-00 or 
+                       20180709101400, as used by most VMS exports), it is used as the start time
+        - vidFPS, totalFrames (optional): If no timestamp is found in the file name, the file modification time
+                                         is assumed to mark the end of the recording, and these values are used
+                                         to work backwards to the start time
+    '''
     
-        # Create empty video recorder with dummy functions so that recording functions can be called, but do nothing
-        class VideoRecorder:
-            
-            def __init__(self,  *args, **kwargs):
-                return
-            
-            def write(self, *args, **kwargs):
-                
-                return
-            
-            def release(self, *args, **kwargs):
-                return
+    # Try to find a timestamp in the file name (year, month, day, hour, minute, second)
+    fileName = os.path.basename(videoSource)
+    timestampRegex = r"(\d{4})[-_.]?(\d{2})[-_.]?(\d{2})[-_.T ]?(\d{2})[-_.:]?(\d{2})[-_.:]?(\d{2})"
+    for eachMatch in re.finditer(timestampRegex, fileName):
+        try:
+            return dt.datetime(*[int(eachValue) for eachValue in eachMatch.groups()])
+        except ValueError:
+            # Not a valid date (e.g. some other long string of numbers), so keep looking
+            continue
     
+    # Fall back to the file modification time, adjusted by the run time of the video if possible
+    endTime = dt.datetime.fromtimestamp(os.path.getmtime(videoSource))
+    haveRunTime = (vidFPS is not None) and (totalFrames is not None) and (totalFrames > 0)
+    runTimeSec = (totalFrames / vidFPS) if haveRunTime else 0
     
+    if verbose:
+        print("")
+        print("No timestamp found in file name:", fileName)
+        print("Using file modification time to estimate video start time")
     
-    return VideoRecorder(videoOut, recWH, recTimelapse)
+    return endTime - dt.timedelta(seconds = runTimeSec)
 
 # .....................................................................................................................
 
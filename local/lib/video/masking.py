@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 10:05:47 2026
+
+@author: eo
+"""
+
+import os
+import cv2
+import numpy as np
+
+from local.lib.utils.files import saveHistoryFile, loadHistoryFile
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define constants
+
+# File used to remember the last privacy masks, so they don't need to be re-drawn for every export
+MASK_HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".cache", "videostitch", "privacy_masks.json")
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class PrivacyMask:
+
+    '''
+    Blanks out (or blurs) polygon zones of frames, e.g. for hiding neighbouring windows or sidewalks.
+    Zones are given in normalized co-ordinates, and are rasterized into a mask once per frame size.
+    The mask only covers the bounding box of the zones, so each frame just needs a single masked copy
+    over that region (plus a downscaled blur of the region, when blurring).
+    '''
+
+    def __init__(self, zoneListNormalized, blurZones=False, fillColor=(0, 0, 0), blurFactor=16):
+
+        # Store zones as (N, 2) arrays of normalized xy co-ordinates
+        self.zoneList = [np.float32(eachZone).reshape(-1, 2) for eachZone in zoneListNormalized]
+
+        # Store drawing settings
+        self._blurZones = blurZones
+        self._fillColor = fillColor
+        self._blurFactor = max(2, int(blurFactor))
+
+        # Allocate storage for rasterized masks, one per frame size: (roi slice, mask, fill array)
+        self._maskCache = {}
+
+    # .................................................................................................................
+
+    def __len__(self):
+        return len(self.zoneList)
+
+    # .................................................................................................................
+
+    def apply(self, frame):
+
+        # Frames read from a frame store are read-only views, so we need our own copy to draw into
+        if not frame.flags.writeable:
+            frame = frame.copy()
+
+        roiSlice, roiMask, fillArray = self._rasterize(frame.shape)
+        if roiSlice is None:
+            return frame
+
+        # Paste in the fill color (or a blurred copy of the region) wherever the mask is set
+        frameROI = frame[roiSlice]
+        fillSource = self._blurredCopy(frameROI) if self._blurZones else fillArray
+        np.copyto(frameROI, fillSource, where = roiMask)
+
+        return frame
+
+    # .................................................................................................................
+
+    def applyBatch(self, frameBatch):
+
+        ''' Mask every frame of a (N, H, W, C) batch, in place. Blanked zones are filled with one copy '''
+
+        roiSlice, roiMask, fillArray = self._rasterize(frameBatch.shape[1:])
+        if roiSlice is None:
+            return frameBatch
+
+        batchROI = frameBatch[(slice(None),) + roiSlice]
+        if self._blurZones:
+            for eachROI in batchROI:
+                np.copyto(eachROI, self._blurredCopy(eachROI), where = roiMask)
+        else:
+            np.copyto(batchROI, fillArray, where = roiMask[np.newaxis])
+
+        return frameBatch
+
+    # .................................................................................................................
+
+    def _rasterize(self, frameShape):
+
+        # Only rasterize the zones once per frame size (more than one size only happens on mixed-size inputs)
+        frameHeight, frameWidth = frameShape[0:2]
+        cacheKey = tuple(frameShape)
+        if cacheKey in self._maskCache:
+            return self._maskCache[cacheKey]
+
+        # Draw the zones into a full-size mask, using the same (size - 1) scaling as the cropping co-ordinates
+        fullMask = np.zeros((frameHeight, frameWidth), dtype=np.uint8)
+        zoneScaling = np.float32((frameWidth - 1, frameHeight - 1))
+        zonesPx = [np.int32(np.round(eachZone * zoneScaling)) for eachZone in self.zoneList if len(eachZone) > 2]
+        if len(zonesPx) > 0:
+            cv2.fillPoly(fullMask, zonesPx, 255)
+
+        # Keep only the bounding box of the mask, so frames don't need to be fully touched. Skip empty masks
+        x1, y1, roiW, roiH = cv2.boundingRect(fullMask)
+        if roiW * roiH == 0:
+            self._maskCache[cacheKey] = (None, None, None)
+            return self._maskCache[cacheKey]
+        roiSlice = (slice(y1, y1 + roiH), slice(x1, x1 + roiW))
+
+        # Shape the mask & fill color so they broadcast over the frame channels
+        numChannels = frameShape[2] if len(frameShape) > 2 else 1
+        roiMask = fullMask[roiSlice] > 0
+        fillArray = np.uint8(self._fillColor[0:numChannels]) if numChannels > 1 else np.uint8(self._fillColor[0])
+        if len(frameShape) > 2:
+            roiMask = roiMask[:, :, np.newaxis]
+
+        self._maskCache[cacheKey] = (roiSlice, roiMask, fillArray)
+
+        return self._maskCache[cacheKey]
+
+    # .................................................................................................................
+
+    def _blurredCopy(self, frameROI):
+
+        # Blur by shrinking then re-enlarging the region, which is much cheaper than a large blur kernel
+        roiH, roiW = frameROI.shape[0:2]
+        smallWH = (max(1, roiW // self._blurFactor), max(1, roiH // self._blurFactor))
+        smallROI = cv2.resize(frameROI, dsize = smallWH, interpolation = cv2.INTER_AREA)
+        blurredROI = cv2.resize(smallROI, dsize = (roiW, roiH), interpolation = cv2.INTER_LINEAR)
+
+        return blurredROI.reshape(frameROI.shape)
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define functions
+
+def loadMaskZones(historyPath=MASK_HISTORY_PATH):
+
+    ''' Load the last saved (normalized) mask zones. Returns an empty list if there aren't any '''
+
+    try:
+        historyDict = loadHistoryFile(historyPath)
+    except (OSError, ValueError):
+        historyDict = None
+
+    if historyDict is None:
+        return []
+
+    return [np.float32(eachZone) for eachZone in historyDict.get("zone_list", [])]
+
+# .....................................................................................................................
+
+def saveMaskZones(zoneListNormalized, historyPath=MASK_HISTORY_PATH):
+
+    zoneList = [np.float32(eachZone).tolist() for eachZone in zoneListNormalized]
+    try:
+        saveHistoryFile(historyPath, {"zone_list": zoneList})
+    except (OSError, ValueError):
+        print("")
+        print("Couldn't save privacy masks to:")
+        print(historyPath)
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
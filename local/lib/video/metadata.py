@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 10:12:33 2026
+
+@author: eo
+"""
+
+import os
+import hashlib
+
+from local.lib.utils.files import saveHistoryFile, loadHistoryFile
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define constants
+
+# Folder used to store per-video metadata (seek indices, verified frame counts etc.)
+METADATA_FOLDER = os.path.join(os.path.expanduser("~"), ".cache", "videostitch", "metadata")
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define functions
+
+def metadataPath(videoSource, metadataFolder=None):
+
+    '''
+    Get the path to the metadata file for a video. The file name changes if the video file changes,
+    so stale metadata is never loaded. Returns None if the source isn't a file on disk
+    '''
+
+    try:
+        fileStat = os.stat(videoSource)
+    except (OSError, TypeError):
+        return None
+
+    metadataFolder = METADATA_FOLDER if metadataFolder is None else metadataFolder
+    keyString = "{}|{}|{}".format(os.path.abspath(videoSource), fileStat.st_size, fileStat.st_mtime)
+    fileKey = hashlib.md5(keyString.encode()).hexdigest()
+
+    return os.path.join(metadataFolder, fileKey + ".json")
+
+# .....................................................................................................................
+
+def loadMetadata(videoSource, metadataKey=None):
+
+    ''' Load the stored metadata for a video (or one entry of it). Returns None if nothing has been stored '''
+
+    metaPath = metadataPath(videoSource)
+    if metaPath is None:
+        return None
+
+    try:
+        metaDict = loadHistoryFile(metaPath)
+    except (OSError, ValueError):
+        return None
+
+    if metaDict is None or metadataKey is None:
+        return metaDict
+
+    return metaDict.get(metadataKey)
+
+# .....................................................................................................................
+
+def saveMetadata(videoSource, metaDict):
+
+    ''' Merge new entries into the stored metadata for a video. Failing to save isn't treated as an error '''
+
+    metaPath = metadataPath(videoSource)
+    if metaPath is None:
+        return
+
+    try:
+        saveHistoryFile(metaPath, metaDict)
+    except (OSError, ValueError):
+        pass
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:31 2026
+
+@author: eo
+"""
+
+import cv2
+import numpy as np
+import datetime as dt
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class TimestampOverlay:
+
+    '''
+    Draws wall-clock timestamps onto frames.
+    Text is rendered into a small cached patch, which is only re-drawn when the displayed text changes.
+    Every other frame just gets the patch copied into a fixed region of the frame.
+    '''
+
+    def __init__(self, timeFormat="%Y-%m-%d %H:%M:%S", corner="bl", padding=10, drawBackground=True):
+
+        # Store text settings
+        self._timeFormat = timeFormat
+        self._corner = corner.lower()
+        self._padding = padding
+        self._drawBackground = drawBackground
+
+        # Set up text aesthetics. Font scale/thickness are set based on the frame size
+        self.text_config = {"fontFace": cv2.FONT_HERSHEY_SIMPLEX,
+                            "color": (255, 255, 255),
+                            "lineType": cv2.LINE_AA}
+        self._bgColor = (0, 0, 0)
+
+        # Allocate storage for cached drawing data
+        self._frameShape = None
+        self._roiSlice = None
+        self._patch = None
+        self._patchMask = None
+        self._lastText = None
+
+    # .................................................................................................................
+
+    def configure_text(self, new_text_config):
+        self.text_config = {**self.text_config, **new_text_config}
+        self._frameShape = None
+
+    # .................................................................................................................
+
+    def draw(self, frame, frameTime):
+
+        # Frames read from a frame store are read-only views, so we need our own copy to draw into
+        if not frame.flags.writeable:
+            frame = frame.copy()
+
+        # Re-compute the overlay layout if the frame size changes (only happens on mixed-size inputs)
+        if frame.shape != self._frameShape:
+            self._layout(frame.shape)
+
+        # Only re-render the text when it changes (i.e. once per second, for the default format)
+        timeText = frameTime.strftime(self._timeFormat)
+        if timeText != self._lastText:
+            self._renderPatch(timeText)
+
+        # Copy the cached patch into the frame
+        frameROI = frame[self._roiSlice]
+        if self._drawBackground:
+            frameROI[:] = self._patch
+        else:
+            np.copyto(frameROI, self._patch, where=self._patchMask)
+
+        return frame
+
+    # .................................................................................................................
+
+    def drawBatch(self, frameBatch, frameTimeList):
+
+        '''
+        Draw timestamps onto a (N, H, W, C) batch of frames, in place. Consecutive frames with the same text
+        (i.e. from the same second, for the default format) get the patch in a single copy.
+        Frames with a time of None are left alone
+        '''
+
+        if frameBatch.shape[1:] != self._frameShape:
+            self._layout(frameBatch.shape[1:])
+
+        # Find runs of frames that share the same text
+        textList = [None if eachTime is None else eachTime.strftime(self._timeFormat) for eachTime in frameTimeList]
+        runStart = 0
+        for frameIdx in range(1, 1 + len(textList)):
+            if frameIdx < len(textList) and textList[frameIdx] == textList[runStart]:
+                continue
+
+            # Copy the patch into every frame of the run at once
+            runText = textList[runStart]
+            if runText is not None:
+                if runText != self._lastText:
+                    self._renderPatch(runText)
+                batchROI = frameBatch[(slice(runStart, frameIdx),) + self._roiSlice]
+                if self._drawBackground:
+                    batchROI[:] = self._patch
+                else:
+                    np.copyto(batchROI, self._patch, where=self._patchMask)
+            runStart = frameIdx
+
+        return frameBatch
+
+    # .................................................................................................................
+
+    def _layout(self, frameShape):
+
+        # Store the new frame shape, so we don't re-layout every frame
+        self._frameShape = frameShape
+        frameHeight, frameWidth = frameShape[0:2]
+        frameChannels = frameShape[2] if len(frameShape) > 2 else 1
+
+        # Scale text relative to a 720p frame, so the text looks similar regardless of the frame size
+        fontScale = max(0.35, 0.75 * frameHeight / 720)
+        thickness = max(1, int(round(2 * frameHeight / 720)))
+        self._fontScale = self.text_config.get("fontScale", fontScale)
+        self._thickness = self.text_config.get("thickness", thickness)
+
+        # Figure out the largest text size we'll need, using a timestamp with wide digits
+        sampleText = dt.datetime(2000, 12, 28, 20, 58, 58).strftime(self._timeFormat)
+        (textW, textH), baseline = cv2.getTextSize(sampleText, self.text_config["fontFace"],
+                                                   self._fontScale, self._thickness)
+
+        # Get patch size, with a few pixels of padding around the text
+        textPad = max(2, self._thickness * 2)
+        patchW = min(frameWidth, textW + 2 * textPad)
+        patchH = min(frameHeight, textH + baseline + 2 * textPad)
+        self._textOrg = (textPad, textPad + textH)
+
+        # Figure out where the patch goes in the frame
+        x1 = (frameWidth - patchW - self._padding) if "r" in self._corner else self._padding
+        y1 = (frameHeight - patchH - self._padding) if "b" in self._corner else self._padding
+        x1 = max(0, min(frameWidth - patchW, x1))
+        y1 = max(0, min(frameHeight - patchH, y1))
+        self._roiSlice = (slice(y1, y1 + patchH), slice(x1, x1 + patchW))
+
+        # Allocate the patch & text mask images
+        patchShape = (patchH, patchW, frameChannels) if len(frameShape) > 2 else (patchH, patchW)
+        self._patch = np.zeros(patchShape, dtype=np.uint8)
+        maskShape = (patchH, patchW, 1) if len(frameShape) > 2 else (patchH, patchW)
+        self._patchMask = np.zeros(maskShape, dtype=np.bool_)
+
+        # Force the text to be re-drawn at the new size
+        self._lastText = None
+
+    # .................................................................................................................
+
+    def _renderPatch(self, timeText):
+
+        # Get text/background colors to match the number of frame channels
+        numChannels = self._patch.shape[2] if self._patch.ndim > 2 else 1
+        textColor = tuple(self.text_config["color"][0:numChannels]) + (255,) * max(0, numChannels - 3)
+        bgColor = tuple(self._bgColor[0:numChannels]) + (255,) * max(0, numChannels - 3)
+
+        # Draw new text into the patch
+        self._patch[:] = bgColor if numChannels > 1 else bgColor[0]
+        cv2.putText(self._patch, timeText, self._textOrg, self.text_config["fontFace"], self._fontScale,
+                    textColor, self._thickness, self.text_config["lineType"])
+
+        # Update the text mask, used when drawing without a background
+        if not self._drawBackground:
+            textMask = np.zeros(self._patchMask.shape[0:2], dtype=np.uint8)
+            cv2.putText(textMask, timeText, self._textOrg, self.text_config["fontFace"], self._fontScale,
+                        255, self._thickness, cv2.LINE_8)
+            self._patchMask[:] = textMask.reshape(self._patchMask.shape) > 0
+
+        self._lastText = timeText
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define functions
+
+def frameTimestamp(chunkStartTime, frameIndex, vidFPS):
+
+    ''' Get the wall-clock time of a frame, given the starting time of the video it came from '''
+
+    return chunkStartTime + dt.timedelta(seconds = frameIndex / vidFPS)
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+
+    testFrame = np.full((720, 1280, 3), 80, dtype=np.uint8)
+    testOverlay = TimestampOverlay()
+    startTime = dt.datetime.now()
+    for frameIdx in range(100):
+        testOverlay.draw(testFrame, frameTimestamp(startTime, frameIdx, 30))
+
+    cv2.imshow("Timestamp", testFrame)
+    cv2.waitKey(0)
+    cv2.destroyAllWindows()
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
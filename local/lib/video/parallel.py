@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 14:05:51 2026
+
+@author: eo
+"""
+
+import os
+import cv2
+import threading
+import multiprocessing as mp
+from multiprocessing import resource_tracker
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from local.lib.video.io import openVideoCapture
+from local.lib.video.seekindex import loadSeekIndex
+from local.lib.video.sharedframes import SharedFrameRing, sharedMemoryAvailable
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class ParallelFileCapture:
+
+    '''
+    Decodes a single (long) video using several worker processes, for cases where there aren't multiple files
+    to spread across cores. The video is split into blocks of frames, aligned to the seek index anchors,
+    and each block is decoded (and optionally downscaled) by a worker. Blocks are handed back in order,
+    so this mimics a cv2.VideoCapture object being read sequentially. The file needs a seek index
+    (see seekindex.py), since otherwise block boundaries would rely on the backend seeking accurately.
+    Workers come from a pool started ahead of time (see startDecodeWorkers), so processes aren't forked
+    while other threads are running. Only a limited number of blocks are decoded ahead of time,
+    to keep memory use under control.
+    Workers write frames directly into a shared memory ring (if available), so frames aren't pickled between
+    processes. Frames read from the ring are views, whose contents are only valid until the reader moves on to
+    another block. The ring itself stays mapped after release(), so views held elsewhere never point at freed memory.
+    Call close() to free it once nothing is using frames from this capture anymore.
+    '''
+
+    def __init__(self, videoSource, decodeExecutor, numWorkers=None, blockSeconds=1.0, frameWH=None,
+                 maxMegabytes=1024):
+
+        # Store settings
+        self.source = videoSource
+        self._frameWH = None if frameWH is None else (int(frameWH[0]), int(frameWH[1]))
+        self._executor = decodeExecutor
+        self._numWorkers = numWorkers if numWorkers is not None else min(8, os.cpu_count() or 1)
+
+        # Get basic video info, used to plan blocks
+        videoObj = openVideoCapture(videoSource)
+        self._opened = videoObj.isOpened()
+        vidFPS = videoObj.get(cv2.CAP_PROP_FPS)
+        self._fps = vidFPS if (5 < vidFPS < 61) else 30
+        self._sourceWH = (int(videoObj.get(cv2.CAP_PROP_FRAME_WIDTH)), int(videoObj.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        videoObj.release()
+
+        # Align blocks to the seek index anchors, so workers can jump straight (and exactly) to their block
+        seekIndex = loadSeekIndex(videoSource)
+        if seekIndex is None:
+            print("")
+            print("Can't decode in parallel without a seek index! Tried:")
+            print(videoSource)
+            print("")
+            raise IOError
+        self._anchorFrames = seekIndex.anchorFrames
+        self._blockFrames = max(1, int(round(blockSeconds * self._fps)))
+
+        # Limit the number of blocks being decoded at any one time, based on the (output) frame size.
+        # Each block gets its own group of slots in the frame ring, with one extra group for the block being read
+        outW, outH = self._sourceWH if self._frameWH is None else self._frameWH
+        self._groupSlots = 2 * self._blockFrames
+        groupBytes = max(1, self._groupSlots * outW * outH * 3)
+        self._maxBlocksAhead = max(2, min(2 * self._numWorkers, int(maxMegabytes * 1E6 / groupBytes) - 1))
+        self._numGroups = 1 + self._maxBlocksAhead
+        self._frameRing = None
+        if sharedMemoryAvailable() and self._opened:
+            self._frameRing = SharedFrameRing(self._numGroups * self._groupSlots, (outH, outW, 3))
+
+        # Allocate storage for read state
+        self._pendingBlocks = deque()
+        self._nextBlockStart = 0
+        self._blockCount = 0
+        self._endReached = False
+        self._blockFrameList = []
+        self._blockMsecList = []
+        self._blockIdx = 0
+        self._frameIdx = 0
+
+        # Start decoding right away
+        self._submitBlocks()
+
+    # .................................................................................................................
+
+    def isOpened(self):
+        return self._opened
+
+    # .................................................................................................................
+
+    def queuedBlocks(self):
+
+        ''' Number of blocks submitted for decoding that haven't been used yet (for monitoring) '''
+
+        return len(self._pendingBlocks)
+
+    # .................................................................................................................
+
+    def grab(self):
+
+        # Move on to the next decoded block once the current one runs out
+        while self._blockIdx >= len(self._blockFrameList):
+            if len(self._pendingBlocks) < 1:
+                return False
+
+            # Wait for the next block (in order) and queue up more work
+            blockStart, blockEnd, firstSlot, blockFuture = self._pendingBlocks.popleft()
+            self._blockFrameList, self._blockMsecList = blockFuture.result()
+            self._blockIdx = 0
+            
+            # Frames written to the shared ring come back as (zero-copy) views of their slots
+            if self._frameRing is not None:
+                self._blockFrameList = [self._frameRing[firstSlot + eachIdx] 
+                                        for eachIdx in range(len(self._blockMsecList))]
+
+            # A short block means we hit the end of the video, so stop decoding anything past it
+            if len(self._blockFrameList) < (blockEnd - blockStart):
+                self._endReached = True
+                self._cancelPending()
+            self._submitBlocks()
+
+        self._blockIdx += 1
+        self._frameIdx += 1
+
+        return True
+
+    # .................................................................................................................
+
+    def retrieve(self):
+
+        if self._blockIdx < 1:
+            return False, None
+
+        return True, self._blockFrameList[self._blockIdx - 1]
+
+    # .................................................................................................................
+
+    def read(self):
+        return self.retrieve() if self.grab() else (False, None)
+
+    # .................................................................................................................
+
+    def get(self, propertyCode):
+
+        if propertyCode == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._frameIdx)
+        if propertyCode == cv2.CAP_PROP_POS_MSEC:
+            return self._blockMsecList[self._blockIdx - 1] if self._blockIdx > 0 else 0.0
+        if propertyCode == cv2.CAP_PROP_FPS:
+            return float(self._fps)
+        if propertyCode == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self._sourceWH[0] if self._frameWH is None else self._frameWH[0])
+        if propertyCode == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self._sourceWH[1] if self._frameWH is None else self._frameWH[1])
+
+        return 0.0
+
+    # .................................................................................................................
+
+    def release(self):
+
+        # Wait for any blocks already being decoded, since they write into the ring. The workers are left running
+        for _, _, _, eachFuture in self._pendingBlocks:
+            eachFuture.cancel()
+        for _, _, _, eachFuture in self._pendingBlocks:
+            if not eachFuture.cancelled():
+                eachFuture.exception()
+        self._pendingBlocks = deque()
+        self._blockFrameList = []
+
+    # .................................................................................................................
+
+    def close(self):
+
+        ''' Stop decoding & free the shared frame ring. Frames read from this capture must not be used afterwards '''
+
+        self.release()
+        if self._frameRing is not None:
+            self._frameRing.close()
+            self._frameRing = None
+
+    # .................................................................................................................
+
+    def _nextBlockEnd(self, blockStart):
+
+        # End blocks on the first anchor that gives a full-sized block, or just use fixed sized blocks.
+        # Blocks can't be larger than their group of ring slots
+        minimumEnd = blockStart + self._blockFrames
+        anchorIdx = bisect_left(self._anchorFrames, minimumEnd)
+        if anchorIdx < len(self._anchorFrames):
+            return min(self._anchorFrames[anchorIdx], blockStart + self._groupSlots)
+
+        return minimumEnd
+
+    # .................................................................................................................
+
+    def _submitBlocks(self):
+
+        # Keep a limited number of blocks decoding ahead of the read position
+        while (not self._endReached) and (len(self._pendingBlocks) < self._maxBlocksAhead):
+            blockStart = self._nextBlockStart
+            blockEnd = self._nextBlockEnd(blockStart)
+            firstSlot = (self._blockCount % self._numGroups) * self._groupSlots
+            ringSpec = None if self._frameRing is None else self._frameRing.spec()
+            blockFuture = self._executor.submit(decodeFrameRange, self.source, blockStart, blockEnd, self._frameWH,
+                                                ringSpec, firstSlot)
+            self._pendingBlocks.append((blockStart, blockEnd, firstSlot, blockFuture))
+            self._nextBlockStart = blockEnd
+            self._blockCount += 1
+
+    # .................................................................................................................
+
+    def _cancelPending(self):
+        for _, _, _, eachFuture in self._pendingBlocks:
+            eachFuture.cancel()
+        self._pendingBlocks = deque()
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define functions
+
+def startDecodeWorkers(numWorkers=None):
+
+    '''
+    Start a pool of workers for decoding (see ParallelFileCapture). Worker processes are forked, since the main
+    script can't be re-imported safely, so this should be called before any GUI (tkinter or OpenCV windows)
+    or other threads are started (forking a process with that sort of state can deadlock or crash).
+    All the workers are started right away for the same reason. Falls back to threads if forking isn't
+    available. Shut down the pool once all decoding is done
+    '''
+
+    numWorkers = numWorkers if numWorkers is not None else min(8, os.cpu_count() or 1)
+    if "fork" not in mp.get_all_start_methods():
+        return ThreadPoolExecutor(max_workers = numWorkers)
+
+    # Make sure the workers share our shared memory tracker, otherwise each would start its own
+    # (which would wrongly report the frame rings as leaked when the workers exit)
+    if sharedMemoryAvailable():
+        resource_tracker.ensure_running()
+
+    # Give every worker a (quick) job at once, so they're all forked now rather than on demand later
+    decodeExecutor = ProcessPoolExecutor(max_workers = numWorkers,
+                                         mp_context = mp.get_context("fork"),
+                                         initializer = _initWorker)
+    for eachFuture in [decodeExecutor.submit(_initWorker) for _ in range(numWorkers)]:
+        eachFuture.result()
+
+    return decodeExecutor
+
+# .....................................................................................................................
+
+# Per-worker storage (capture & ring attachment kept open between ranges). Thread-local, for thread-based workers
+_workerStorage = threading.local()
+
+def decodeFrameRange(videoSource, startFrame, endFrame, frameWH=None, ringSpec=None, firstSlot=0):
+
+    '''
+    Decode (and optionally downscale) a range of frames from a video. Meant to be run in a worker.
+    Each worker keeps its capture open between calls, so that consecutive ranges don't need to seek.
+    Only the most recent capture & ring attachment are kept, older ones are released when the source/ring changes.
+    If a shared frame ring spec is given, frames are written into consecutive ring slots (starting at firstSlot)
+    instead of being returned, so they don't need to be pickled.
+
+    outputs:
+        - frameList: list of decoded frames (None if written to the ring).
+                     Shorter than the requested range if the video ended early
+        - msecList: timestamp (in milliseconds) of each frame, as reported by the video
+    '''
+
+    # Re-use this worker's capture if possible (seeking goes through the seek index)
+    storedSource, videoObj = getattr(_workerStorage, "capture", (None, None))
+    if storedSource != videoSource:
+        if videoObj is not None:
+            videoObj.release()
+        videoObj = openVideoCapture(videoSource)
+        _workerStorage.capture = (videoSource, videoObj)
+    if int(videoObj.get(cv2.CAP_PROP_POS_FRAMES)) != startFrame:
+        videoObj.set(cv2.CAP_PROP_POS_FRAMES, startFrame)
+
+    # Attach to the shared frame ring, if we're using one (also kept between calls)
+    storedSpec, frameRing = getattr(_workerStorage, "ring", (None, None))
+    if storedSpec != ringSpec:
+        if frameRing is not None:
+            frameRing.close()
+        frameRing = None if ringSpec is None else SharedFrameRing(*ringSpec)
+        _workerStorage.ring = (ringSpec, frameRing)
+
+    frameList, msecList = [], []
+    for frameIdx in range(endFrame - startFrame):
+        (receivedFrame, inFrame) = videoObj.read()
+        if not receivedFrame: break
+        msecList.append(videoObj.get(cv2.CAP_PROP_POS_MSEC))
+
+        # Write straight into the ring (which also handles downscaling), if possible
+        if frameRing is not None:
+            frameRing.write(firstSlot + frameIdx, inFrame)
+            continue
+
+        # Downscale here, so the main process has less data to receive & deal with
+        if frameWH is not None:
+            inFrame = cv2.resize(inFrame, dsize = frameWH, interpolation = cv2.INTER_AREA)
+        frameList.append(inFrame)
+
+    return (None if frameRing is not None else frameList), msecList
+
+# .....................................................................................................................
+
+def _initWorker():
+
+    # Each worker decodes a separate range, so OpenCV's own threading would only fight with the other workers
+    cv2.setNumThreads(1)
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 25 10:22:45 2026
+
+@author: eo
+"""
+
+import os
+import cv2
+import datetime as dt
+from time import perf_counter
+
+from local.lib.video.io import openVideoCapture
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class ProgressEstimator:
+
+    '''
+    Keeps a running estimate of throughput (input frames per second) & time remaining for a job.
+    Counting a frame is just an addition; the clock is only checked every so often, so it can be called per frame.
+    Until enough frames have been measured, the (calibrated) planned rate is used for estimates.
+    '''
+
+    def __init__(self, totalFrames, plannedFPS=None, reportSeconds=10.0, checkFrames=32, smoothing=0.3):
+
+        # Store estimation settings
+        self.totalFrames = max(0, int(totalFrames))
+        self._plannedFPS = plannedFPS
+        self._reportSeconds = reportSeconds
+        self._checkFrames = max(1, int(checkFrames))
+        self._smoothing = smoothing
+
+        # Allocate storage for counting & rate measurements
+        self.framesDone = 0
+        self.fps = None
+        self._uncheckedFrames = 0
+        self._startTime = perf_counter()
+        self._lastCheckTime = self._startTime
+        self._lastCheckFrames = 0
+        self._lastReportTime = self._startTime
+
+    # .................................................................................................................
+
+    def tick(self, numFrames=1):
+
+        ''' Count processed (input) frames. Returns True when it's time for a progress report '''
+
+        self.framesDone += numFrames
+        self._uncheckedFrames += numFrames
+        if self._uncheckedFrames < self._checkFrames:
+            return False
+        self._uncheckedFrames = 0
+
+        # Measure the rate over at least half a second, so the estimate isn't too jumpy
+        currentTime = perf_counter()
+        elapsedSec = currentTime - self._lastCheckTime
+        if elapsedSec < 0.5:
+            return False
+        newFPS = (self.framesDone - self._lastCheckFrames) / elapsedSec
+        self.fps = newFPS if self.fps is None else (self._smoothing * newFPS + (1 - self._smoothing) * self.fps)
+        self._lastCheckTime = currentTime
+        self._lastCheckFrames = self.framesDone
+
+        # Report every so often
+        if (currentTime - self._lastReportTime) < self._reportSeconds:
+            return False
+        self._lastReportTime = currentTime
+
+        return True
+
+    # .................................................................................................................
+
+    def elapsedSeconds(self):
+        return perf_counter() - self._startTime
+
+    # .................................................................................................................
+
+    def secondsLeft(self):
+
+        ''' Estimated seconds until all frames are done. None if there's no rate to go on yet '''
+
+        currentFPS = self.fps if self.fps is not None else self._plannedFPS
+        if not currentFPS:
+            return None
+
+        return max(0, self.totalFrames - self.framesDone) / currentFPS
+
+    # .................................................................................................................
+
+    def report(self):
+
+        percentDone = 100.0 * self.framesDone / max(1, self.totalFrames)
+        secondsLeft = self.secondsLeft()
+        timeLeftString = "unknown" if secondsLeft is None else formatDuration(secondsLeft)
+        rateString = "?" if self.fps is None else "{:.0f}".format(self.fps)
+        print("  Progress: {:.1f}% ({} frames/sec), approx. {} remaining".format(percentDone, rateString,
+                                                                                 timeLeftString))
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define functions
+
+def formatDuration(totalSeconds):
+
+    ''' Format seconds as H:MM:SS '''
+
+    totalSeconds = int(round(totalSeconds))
+
+    return "{}:{:02d}:{:02d}".format(totalSeconds // 3600, (totalSeconds // 60) % 60, totalSeconds % 60)
+
+# .....................................................................................................................
+
+def calibrateThroughput(videoSource, processSteps, recorderFunc=None, numFrames=45, startFraction=0.3):
+
+    '''
+    Time each stage of the pipeline on a short run of frames from the middle of a video, using the actual
+    processing steps (cropping, masking etc.) and recorder settings (size, codec) of the job.
+
+    inputs:
+        - processSteps: list of functions, each taking a frame and returning the processed frame
+        - recorderFunc: function taking a file name & returning a video recorder (None skips recording)
+
+    outputs:
+        - timingDict: dictionary with keys:
+            "grab_sec", "decode_sec", "process_sec", "encode_sec" (all per frame) & "bytes_per_frame"
+          Stages that couldn't be measured are given as 0
+    '''
+
+    timingDict = {"grab_sec": 0.0, "decode_sec": 0.0, "process_sec": 0.0, "encode_sec": 0.0, "bytes_per_frame": 0}
+
+    videoObj = openVideoCapture(videoSource)
+    if not videoObj.isOpened():
+        return timingDict
+
+    # Write test frames into a temporary file, next to where the real output is recorded
+    calibrationRecorder = None
+    numTimed = 0
+    if recorderFunc is not None:
+        calibrationRecorder = recorderFunc("calibration_{}.avi".format(os.getpid()))
+
+    try:
+        # Start part way into the video, to avoid any (atypical) intro footage
+        totalFrames = int(videoObj.get(cv2.CAP_PROP_FRAME_COUNT))
+        startFrame = max(0, min(totalFrames - 2 * numFrames, int(startFraction * totalFrames)))
+        videoObj.set(cv2.CAP_PROP_POS_FRAMES, startFrame)
+
+        # Time the full pipeline on a run of frames
+        stageTimes = [0.0, 0.0, 0.0, 0.0]
+        for _ in range(numFrames):
+            t1 = perf_counter()
+            if not videoObj.grab():
+                break
+            t2 = perf_counter()
+            (receivedFrame, inFrame) = videoObj.retrieve()
+            if not receivedFrame:
+                break
+            t3 = perf_counter()
+            for eachStep in processSteps:
+                inFrame = eachStep(inFrame)
+            t4 = perf_counter()
+            if calibrationRecorder is not None:
+                calibrationRecorder.write(inFrame)
+            t5 = perf_counter()
+            for stageIdx, stageTime in enumerate((t2 - t1, t3 - t2, t4 - t3, t5 - t4)):
+                stageTimes[stageIdx] += stageTime
+            numTimed += 1
+
+        # Time grabbing on its own (i.e. for frames that get dropped or timelapsed out)
+        numGrabbed = 0
+        t1 = perf_counter()
+        for _ in range(numFrames):
+            if not videoObj.grab():
+                break
+            numGrabbed += 1
+        grabOnlyTime = perf_counter() - t1
+
+        if numTimed > 0:
+            timingDict["decode_sec"] = stageTimes[1] / numTimed
+            timingDict["process_sec"] = stageTimes[2] / numTimed
+            timingDict["encode_sec"] = stageTimes[3] / numTimed
+            timingDict["grab_sec"] = (grabOnlyTime / numGrabbed) if numGrabbed > 0 else (stageTimes[0] / numTimed)
+
+    finally:
+        videoObj.release()
+        if calibrationRecorder is not None:
+            calibrationRecorder.release()
+            if numTimed > 0:
+                timingDict["bytes_per_frame"] = calibrationRecorder.report()["bytes_written"] / numTimed
+            if os.path.exists(calibrationRecorder.source):
+                os.remove(calibrationRecorder.source)
+
+    return timingDict
+
+# .....................................................................................................................
+
+def planRun(fileList, frameCountList, fpsList, timingDict, outputFPS, recordTimelapse=1, decodeAllFrames=False,
+            decodeWorkers=1, fastPathsList=None, verbose=True):
+
+    '''
+    Predict the run time, output size & throughput of a job, based on calibrated per-frame timings
+
+    inputs:
+        - decodeAllFrames: True if every (kept) frame needs decoding (e.g. for previews), not just recorded ones
+        - fastPathsList: list (one entry per file) of lists of fast path names, used for feedback only
+
+    outputs:
+        - planDict: dictionary with keys:
+            "total_sec", "output_frames", "output_bytes", "input_fps", "file_seconds" (list)
+    '''
+
+    fileSecondsList = []
+    totalInputFrames = 0
+    totalOutputFrames = 0
+    for eachCount, eachFPS in zip(frameCountList, fpsList):
+
+        # Figure out how many frames get grabbed, decoded & written
+        numInput = max(0, eachCount)
+        numKept = numInput * outputFPS / eachFPS
+        numWritten = numKept / max(1, recordTimelapse)
+        numDecoded = numKept if decodeAllFrames else numWritten
+
+        # Decoding is the only stage that gets split across processes
+        decodeSec = numInput * timingDict["grab_sec"] + numDecoded * timingDict["decode_sec"]
+        decodeSec = decodeSec / max(1, decodeWorkers)
+        otherSec = numDecoded * timingDict["process_sec"] + numWritten * timingDict["encode_sec"]
+        fileSecondsList.append(decodeSec + otherSec)
+        totalInputFrames += numInput
+        totalOutputFrames += numWritten
+
+    totalSec = sum(fileSecondsList)
+    planDict = {"total_sec": totalSec,
+                "output_frames": int(round(totalOutputFrames)),
+                "output_bytes": totalOutputFrames * timingDict["bytes_per_frame"],
+                "input_fps": (totalInputFrames / totalSec) if totalSec > 0 else None,
+                "file_seconds": fileSecondsList}
+
+    # Some feedback
+    if verbose:
+        fastPathsList = [[] for _ in fileList] if fastPathsList is None else fastPathsList
+        finishTime = dt.datetime.now() + dt.timedelta(seconds = totalSec)
+        print("")
+        print("*************** Run plan ***************")
+        print("")
+        for eachFile, eachCount, eachSec, eachPaths in zip(fileList, frameCountList, fileSecondsList, fastPathsList):
+            print("{} - {} frames, approx. {}".format(os.path.basename(eachFile), eachCount, formatDuration(eachSec)))
+            if len(eachPaths) > 0:
+                print("  Fast paths:", ", ".join(eachPaths))
+        print("")
+        print("Estimated total time:", formatDuration(totalSec),
+              "(done around {})".format(finishTime.strftime("%Y-%m-%d %H:%M")))
+        if planDict["input_fps"] is not None:
+            print("Estimated throughput: {:.0f} input frames/sec".format(planDict["input_fps"]))
+        if planDict["output_bytes"] > 0:
+            print("Estimated output: {} frames, {:.1f} MB".format(planDict["output_frames"],
+                                                                  planDict["output_bytes"] / 1E6))
+        print("")
+        print("****************************************")
+
+    return planDict
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 14:31:52 2026
+
+@author: eo
+"""
+
+import os
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+
+from local.lib.video.io import openVideoCapture
+from local.lib.video.framestore import isFrameStore
+from local.lib.video.alignment import frameHash, hammingDistances
+from local.lib.video.metadata import loadMetadata, saveMetadata
+from local.lib.video.seekindex import loadSeekIndex, buildSeekIndex
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define probing functions
+
+def probeVideo(videoSource, tailFrames=5, buildIndex=False):
+
+    '''
+    Quick integrity check of a single video file.
+    Opens the file, checks the header info and seeks near the end to confirm the file can be read all the way through.
+    If buildIndex is True, good files also get a seek index (see seekindex.py), which is used by every later seek.
+    Building an index means grabbing through the whole file, which costs most of a full decoding pass,
+    but only has to be done once per file since the index is stored. Indexed files also report exact frame counts.
+
+    outputs:
+        - probeDict: dictionary with keys:
+            "source", "ok", "reason", "wh", "fps", "frame_count"
+          If "ok" is False, "reason" gives a short description of the problem
+    '''
+
+    probeDict = {"source": videoSource,
+                 "ok": False,
+                 "reason": None,
+                 "wh": None,
+                 "fps": None,
+                 "frame_count": -1}
+
+    # Check that the file is there and isn't empty before handing it to OpenCV
+    if not os.path.isfile(videoSource):
+        probeDict["reason"] = "File not found"
+        return probeDict
+    if os.path.getsize(videoSource) == 0:
+        probeDict["reason"] = "Empty file"
+        return probeDict
+
+    try:
+        videoObj = openVideoCapture(videoSource)
+    except Exception:
+        probeDict["reason"] = "Couldn't open video"
+        return probeDict
+
+    try:
+        if not videoObj.isOpened():
+            probeDict["reason"] = "Couldn't open video"
+            return probeDict
+
+        # Check header info
+        vidWidth = int(videoObj.get(cv2.CAP_PROP_FRAME_WIDTH))
+        vidHeight = int(videoObj.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        vidFPS = videoObj.get(cv2.CAP_PROP_FPS)
+        totalFrames = int(videoObj.get(cv2.CAP_PROP_FRAME_COUNT))
+        if vidWidth < 1 or vidHeight < 1:
+            probeDict["reason"] = "Bad frame dimensions in header ({} x {})".format(vidWidth, vidHeight)
+            return probeDict
+
+        # Use the same FPS fallback as setupVideoCapture (some files report garbage)
+        vidFPS = vidFPS if (5 < vidFPS < 61) else 30
+        probeDict["wh"] = (vidWidth, vidHeight)
+        probeDict["fps"] = vidFPS
+        probeDict["frame_count"] = max(-1, totalFrames)
+
+        # Make sure we can decode the first frame
+        (receivedFrame, _) = videoObj.read()
+        if not receivedFrame:
+            probeDict["reason"] = "Couldn't read first frame"
+            return probeDict
+
+        # Seek near the end and make sure the last few frames can be decoded (catches truncated files)
+        if totalFrames > tailFrames:
+            videoObj.set(cv2.CAP_PROP_POS_FRAMES, totalFrames - tailFrames)
+            tailReadCount = 0
+            while True:
+                (receivedFrame, _) = videoObj.read()
+                if not receivedFrame: break
+                tailReadCount += 1
+            if tailReadCount < 1:
+                probeDict["reason"] = "Couldn't read end of file (truncated?)"
+                return probeDict
+
+    except cv2.error as err:
+        probeDict["reason"] = "OpenCV error: {}".format(str(err).strip().splitlines()[-1])
+        return probeDict
+
+    finally:
+        videoObj.release()
+
+    # If we get here, the file seems fine
+    probeDict["ok"] = True
+
+    # Index the file, so later seeks (and the frame count) are exact
+    if buildIndex and not isFrameStore(videoSource):
+        seekIndex = loadSeekIndex(videoSource, buildIfMissing = True)
+        if seekIndex is not None:
+            probeDict["frame_count"] = seekIndex.frameCount
+
+    return probeDict
+
+# .....................................................................................................................
+
+def scanVideoIntegrity(videoSourceList, buildIndex=False, maxWorkers=None, verbose=True):
+
+    '''
+    Probe every video in a list (in parallel), to find corrupted files before doing any real work.
+    Can also build seek indices for every good file while probing (see probeVideo for the cost of this).
+
+    outputs:
+        - probeList: list of probe dictionaries (see probeVideo), in the same order as the input list
+    '''
+
+    # Probe every file in parallel. Mostly waiting on disk/decoding, so threads are fine
+    numWorkers = maxWorkers if maxWorkers is not None else min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers = numWorkers) as executor:
+        probeList = list(executor.map(lambda eachSource: probeVideo(eachSource, buildIndex = buildIndex),
+                                      videoSourceList))
+
+    # Some feedback about bad files
+    if verbose:
+        badProbes = [eachProbe for eachProbe in probeList if not eachProbe["ok"]]
+        print("")
+        print("Integrity check:", len(probeList) - len(badProbes), "of", len(probeList), "file(s) OK")
+        for eachProbe in badProbes:
+            print("  Quarantined:", os.path.basename(eachProbe["source"]), "-", eachProbe["reason"])
+
+    return probeList
+
+# .....................................................................................................................
+
+def countFrames(videoSource):
+
+    '''
+    Get an exact frame count for a video. Stored counts (or seek indices) are re-used if available.
+    Otherwise the header count is only trusted if a cheap check confirms it (the last frame can be grabbed,
+    there's nothing after it and its timestamp makes sense). Failing that, every frame is grabbed (not decoded)
+    to count them, which also builds a seek index for the file. Results are stored in the video metadata.
+
+    outputs:
+        - frameCount: exact number of frames (-1 if the video can't be read)
+        - headerCount: frame count reported by the video header
+    '''
+
+    # Use the stored count, if we have one
+    countDict = loadMetadata(videoSource, "frame_count")
+    if countDict is not None:
+        return countDict["verified"], countDict["header"]
+
+    # Read the header info
+    videoObj = cv2.VideoCapture(videoSource)
+    if not videoObj.isOpened():
+        return -1, -1
+
+    try:
+        headerCount = int(videoObj.get(cv2.CAP_PROP_FRAME_COUNT))
+        vidFPS = videoObj.get(cv2.CAP_PROP_FPS)
+        vidFPS = vidFPS if (5 < vidFPS < 61) else 30
+
+        # Check that the header count lines up with the end of the file
+        headerConfirmed = False
+        if headerCount > 0:
+            videoObj.set(cv2.CAP_PROP_POS_FRAMES, headerCount - 1)
+            if videoObj.grab():
+                lastFrameMsec = videoObj.get(cv2.CAP_PROP_POS_MSEC)
+                expectedMsec = 1000.0 * (headerCount - 1) / vidFPS
+                timingOk = (lastFrameMsec <= 0) or (abs(lastFrameMsec - expectedMsec) <= max(1000.0/vidFPS,
+                                                                                              0.01*expectedMsec))
+                headerConfirmed = timingOk and (not videoObj.grab())
+
+    finally:
+        videoObj.release()
+
+    # Fall back to counting every frame if the header can't be trusted (a stored seek index already has the count)
+    frameCount = headerCount
+    if not headerConfirmed:
+        seekIndex = loadSeekIndex(videoSource)
+        if seekIndex is None:
+            seekIndex = buildSeekIndex(videoSource)
+        frameCount = -1 if seekIndex is None else seekIndex.frameCount
+
+    saveMetadata(videoSource, {"frame_count": {"verified": frameCount, "header": headerCount}})
+
+    return frameCount, headerCount
+
+# .....................................................................................................................
+
+def verifyFrameCounts(videoSourceList, maxWorkers=None, verbose=True):
+
+    '''
+    Get exact frame counts for every video in a list (in parallel). See countFrames.
+
+    outputs:
+        - frameCountList: list of exact frame counts, in the same order as the input list
+    '''
+
+    # Count frames in parallel. Grabbing releases the GIL, so threads are fine
+    numWorkers = maxWorkers if maxWorkers is not None else min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers = numWorkers) as executor:
+        countList = list(executor.map(countFrames, videoSourceList))
+
+    # Some feedback about incorrect headers
+    if verbose:
+        badHeaders = [(eachSource, eachCount, eachHeader)
+                      for eachSource, (eachCount, eachHeader) in zip(videoSourceList, countList)
+                      if eachCount != eachHeader]
+        print("")
+        print("Frame count check:", len(countList) - len(badHeaders), "of", len(countList), "header(s) correct")
+        for eachSource, eachCount, eachHeader in badHeaders:
+            print("  Corrected:", os.path.basename(eachSource), "-", eachHeader, "->", eachCount, "frames")
+
+    return [eachCount for eachCount, _ in countList]
+
+# .....................................................................................................................
+
+def verifyRecording(videoRecorder, maxBitErrors=12, searchFrames=2, verbose=True):
+
+    '''
+    Spot-check a finished recording, without decoding all of it. Checks the container frame count & frame rate
+    against what the recorder wrote, then seeks to the frames that were hashed while recording and compares
+    their hashes (allowing for some compression noise, and seeks landing a frame or two early).
+
+    outputs:
+        - verifyDict: dictionary with keys:
+            "source", "ok", "problems", "frame_count", "duration_sec", "samples_checked", "samples_matched"
+    '''
+
+    recReport = videoRecorder.report()
+    expectedFrames = recReport["frames_written"]
+    verifyDict = {"source": videoRecorder.source,
+                  "ok": False,
+                  "problems": [],
+                  "frame_count": -1,
+                  "duration_sec": None,
+                  "samples_checked": 0,
+                  "samples_matched": 0}
+    problemList = verifyDict["problems"]
+
+    # Check that the file is actually there
+    if (not os.path.isfile(videoRecorder.source)) or (recReport["bytes_written"] == 0):
+        problemList.append("Output file is missing or empty")
+    else:
+        videoObj = cv2.VideoCapture(videoRecorder.source)
+        try:
+            if not videoObj.isOpened():
+                problemList.append("Couldn't open output file")
+            else:
+                _checkContainer(videoObj, expectedFrames, recReport["fps"], verifyDict)
+                _checkSamples(videoObj, videoRecorder.sampleHashes, expectedFrames, maxBitErrors, searchFrames,
+                              verifyDict)
+        except cv2.error as err:
+            problemList.append("OpenCV error: {}".format(str(err).strip().splitlines()[-1]))
+        finally:
+            videoObj.release()
+
+    verifyDict["ok"] = (len(problemList) == 0)
+
+    # Some feedback
+    if verbose:
+        print("")
+        print("Output check:", "OK" if verifyDict["ok"] else "FAILED!", os.path.basename(videoRecorder.source))
+        print("  Frames: {} (expected {})".format(verifyDict["frame_count"], expectedFrames))
+        print("  Sampled frames matched:", verifyDict["samples_matched"], "of", verifyDict["samples_checked"])
+        for eachProblem in problemList:
+            print("  Problem:", eachProblem)
+
+    return verifyDict
+
+# .....................................................................................................................
+
+def _checkContainer(videoObj, expectedFrames, expectedFPS, verifyDict):
+
+    # Compare the container info to what was written
+    containerFrames = int(videoObj.get(cv2.CAP_PROP_FRAME_COUNT))
+    containerFPS = videoObj.get(cv2.CAP_PROP_FPS)
+    verifyDict["frame_count"] = containerFrames
+    verifyDict["duration_sec"] = (containerFrames / containerFPS) if containerFPS > 0 else None
+    if containerFrames != expectedFrames:
+        verifyDict["problems"].append("Frame count is {}, but {} were written".format(containerFrames,
+                                                                                      expectedFrames))
+    if abs(containerFPS - expectedFPS) > 0.01:
+        verifyDict["problems"].append("Frame rate is {:.3f}, but recorded at {:.3f}".format(containerFPS, expectedFPS))
+
+    # Make sure the very last frame can be decoded (catches files that were cut off)
+    if expectedFrames > 0:
+        videoObj.set(cv2.CAP_PROP_POS_FRAMES, expectedFrames - 1)
+        (receivedFrame, _) = videoObj.read()
+        if not receivedFrame:
+            verifyDict["problems"].append("Couldn't read the last frame (truncated?)")
+
+# .....................................................................................................................
+
+def _checkSamples(videoObj, sampleHashes, expectedFrames, maxBitErrors, searchFrames, verifyDict):
+
+    # Seek to each sampled frame & compare hashes. Allow a few frames of slack, in case seeking isn't exact
+    numMatched = 0
+    sampleList = sorted(eachIdx for eachIdx in sampleHashes if eachIdx < expectedFrames)
+    for eachIdx in sampleList:
+        videoObj.set(cv2.CAP_PROP_POS_FRAMES, max(0, eachIdx - searchFrames))
+        for _ in range(1 + 2 * searchFrames):
+            (receivedFrame, inFrame) = videoObj.read()
+            if not receivedFrame:
+                break
+            if hammingDistances(frameHash(inFrame), sampleHashes[eachIdx]) <= maxBitErrors:
+                numMatched += 1
+                break
+
+    verifyDict["samples_checked"] = len(sampleList)
+    verifyDict["samples_matched"] = numMatched
+    if numMatched < len(sampleList):
+        verifyDict["problems"].append("{} of {} sampled frames don't match what was written".format(
+                                      len(sampleList) - numMatched, len(sampleList)))
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
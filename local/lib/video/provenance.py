@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 24 09:40:16 2026
+
+@author: eo
+"""
+
+import os
+import json
+import struct
+import numpy as np
+import datetime as dt
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define constants
+
+# File extension used for provenance sidecar files (saved next to the output video)
+PROVENANCE_EXT = ".vsprov"
+
+# Sidecar layout:
+#   [header] [info (json)] [run records (appended while stitching)]
+# Each record covers a run of output frames, whose source frames & times change by a fixed step per output frame.
+# Records are sorted by output frame index, so lookups are a binary search over the (memory-mapped) records
+_HEADER_MAGIC = b"VSPR"
+_HEADER_VERSION = 1
+_HEADER_FORMAT = "<4sIQQ"
+_RECORD_DTYPE = np.dtype([("output_idx", "<i8"), ("length", "<i8"),
+                          ("file_idx", "<i4"), ("frame_idx", "<i4"), ("frame_step", "<i4"),
+                          ("time", "<f8"), ("time_step", "<f8")])
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class ProvenanceWriter:
+
+    '''
+    Records which source file/frame (and wall-clock time) every output frame came from, into a compact
+    sidecar file. Consecutive output frames which step through the source at a fixed rate (the usual case,
+    even when timelapsing) are merged into a single run record. Finished runs are appended to the file
+    every so often, so the sidecar stays usable even if stitching is stopped part way through.
+    '''
+
+    def __init__(self, sidecarPath, sourceList, sourceFPSList=None, outputFPS=None, flushRecords=256):
+
+        self.source = sidecarPath
+        self._flushRecords = max(1, int(flushRecords))
+
+        # Allocate storage for finished runs (not yet written) & the run in progress
+        self._recordList = []
+        self._run = None
+        self._outputCount = 0
+
+        # Write the header & info up front, since records are appended from then on
+        infoBytes = json.dumps({"sources": list(sourceList),
+                                "source_fps": None if sourceFPSList is None else list(sourceFPSList),
+                                "output_fps": outputFPS}).encode()
+        headerSize = struct.calcsize(_HEADER_FORMAT)
+        recordsOffset = 8 * ((headerSize + len(infoBytes) + 7) // 8)
+        self._file = open(self.source, "wb")
+        self._file.write(struct.pack(_HEADER_FORMAT, _HEADER_MAGIC, _HEADER_VERSION, recordsOffset, len(infoBytes)))
+        self._file.write(infoBytes)
+        self._file.write(bytes(recordsOffset - headerSize - len(infoBytes)))
+
+    # .................................................................................................................
+
+    def __len__(self):
+        return self._outputCount
+
+    # .................................................................................................................
+
+    def write(self, fileIdx, frameIdx, frameTime=None, recordCount=1):
+
+        ''' Record that the given source frame was written to the output (recordCount times in a row) '''
+
+        frameTimeSec = np.nan if frameTime is None else frameTime.timestamp()
+        for _ in range(recordCount):
+            if not self._extendRun(fileIdx, frameIdx, frameTimeSec):
+                self._finishRun()
+                self._run = [self._outputCount, 1, fileIdx, frameIdx, 0, frameTimeSec, 0.0]
+            self._outputCount += 1
+
+    # .................................................................................................................
+
+    def release(self):
+
+        if self._file is None:
+            return
+
+        self._finishRun()
+        self._flush()
+        self._file.close()
+        self._file = None
+
+    # .................................................................................................................
+
+    def _extendRun(self, fileIdx, frameIdx, frameTimeSec):
+
+        # Check if the frame continues the current run (same file, and the same frame/time step as before)
+        if self._run is None:
+            return False
+        _, runLength, runFileIdx, runFrameIdx, runFrameStep, runTime, runTimeStep = self._run
+        if fileIdx != runFileIdx:
+            return False
+
+        # The second frame of a run sets the step size
+        if runLength == 1:
+            if np.isnan(frameTimeSec) != np.isnan(runTime):
+                return False
+            self._run[4] = frameIdx - runFrameIdx
+            self._run[6] = 0.0 if np.isnan(frameTimeSec) else (frameTimeSec - runTime)
+            self._run[1] = 2
+            return True
+
+        # Later frames need to land exactly on the step (times are allowed to be off by up to a millisecond)
+        expectedFrameIdx = runFrameIdx + runLength * runFrameStep
+        if frameIdx != expectedFrameIdx:
+            return False
+        if np.isnan(frameTimeSec) or np.isnan(runTime):
+            if not (np.isnan(frameTimeSec) and np.isnan(runTime)):
+                return False
+        elif abs(frameTimeSec - (runTime + runLength * runTimeStep)) > 0.001:
+            return False
+
+        self._run[1] += 1
+
+        return True
+
+    # .................................................................................................................
+
+    def _finishRun(self):
+
+        if self._run is None:
+            return
+        self._recordList.append(tuple(self._run))
+        self._run = None
+
+        if len(self._recordList) >= self._flushRecords:
+            self._flush()
+
+    # .................................................................................................................
+
+    def _flush(self):
+        if len(self._recordList) > 0:
+            self._file.write(np.array(self._recordList, dtype=_RECORD_DTYPE).tobytes())
+            self._file.flush()
+            self._recordList = []
+
+    # .................................................................................................................
+
+# =====================================================================================================================
+# =====================================================================================================================
+# =====================================================================================================================
+
+class ProvenanceReader:
+
+    ''' Looks up the source of output frames, using a (memory-mapped) provenance sidecar file '''
+
+    def __init__(self, sidecarPath):
+
+        self.source = sidecarPath
+
+        # Read the header & info
+        with open(sidecarPath, "rb") as inFile:
+            headerBytes = inFile.read(struct.calcsize(_HEADER_FORMAT))
+            magic, version, recordsOffset, infoLength = struct.unpack(_HEADER_FORMAT, headerBytes)
+            if magic != _HEADER_MAGIC or version != _HEADER_VERSION:
+                print("")
+                print("Not a valid provenance file:")
+                print(sidecarPath)
+                print("")
+                raise IOError
+            infoDict = json.loads(inFile.read(infoLength).decode())
+
+        self.sourceList = infoDict["sources"]
+        self.sourceFPSList = infoDict["source_fps"]
+        self.outputFPS = infoDict["output_fps"]
+
+        # Memory-map the records. Any partially written record at the end (e.g. after a crash) is ignored
+        numRecords = (os.path.getsize(sidecarPath) - recordsOffset) // _RECORD_DTYPE.itemsize
+        if numRecords > 0:
+            self.records = np.memmap(sidecarPath, dtype=_RECORD_DTYPE, mode="r", offset=recordsOffset,
+                                     shape=(numRecords,))
+        else:
+            self.records = np.zeros((0,), dtype=_RECORD_DTYPE)
+
+    # .................................................................................................................
+
+    def __len__(self):
+
+        ''' Number of output frames covered by the sidecar '''
+
+        if len(self.records) < 1:
+            return 0
+        lastRecord = self.records[-1]
+
+        return int(lastRecord["output_idx"] + lastRecord["length"])
+
+    # .................................................................................................................
+
+    def lookup(self, outputFrameIndex):
+
+        '''
+        Find where an output frame came from. Returns None if the frame isn't covered by the sidecar
+        outputs:
+            - sourceDict: {"source", "file_idx", "frame_idx", "time" (datetime or None), "source_seconds"}
+        '''
+
+        # Binary search for the run containing the frame
+        recordIdx = np.searchsorted(self.records["output_idx"], outputFrameIndex, side = "right") - 1
+        if recordIdx < 0:
+            return None
+        record = self.records[recordIdx]
+        runOffset = outputFrameIndex - int(record["output_idx"])
+        if runOffset >= record["length"]:
+            return None
+
+        # Step through the run to get the source frame & time
+        fileIdx = int(record["file_idx"])
+        frameIdx = int(record["frame_idx"]) + runOffset * int(record["frame_step"])
+        frameTimeSec = float(record["time"]) + runOffset * float(record["time_step"])
+        frameTime = None if np.isnan(frameTimeSec) else dt.datetime.fromtimestamp(frameTimeSec)
+
+        # Get the position within the source video (in seconds), if the source frame rate is known
+        sourceFPS = None
+        if self.sourceFPSList is not None and 0 <= fileIdx < len(self.sourceFPSList):
+            sourceFPS = self.sourceFPSList[fileIdx]
+        sourceSeconds = (frameIdx / sourceFPS) if sourceFPS else None
+
+        return {"source": self.sourceList[fileIdx] if 0 <= fileIdx < len(self.sourceList) else None,
+                "file_idx": fileIdx,
+                "frame_idx": frameIdx,
+                "time": frameTime,
+                "source_seconds": sourceSeconds}
+
+    # .................................................................................................................
+
+    def close(self):
+        self.records = np.zeros((0,), dtype=_RECORD_DTYPE)
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define functions
+
+def provenancePath(videoSource):
+
+    ''' Get the path of the provenance sidecar that goes with an output video '''
+
+    return os.path.splitext(videoSource)[0] + PROVENANCE_EXT
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
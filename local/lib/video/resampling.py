@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 15:47:10 2026
+
+@author: eo
+"""
+
+import math
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class FrameRateResampler:
+
+    '''
+    Maps frames from videos with (possibly) different frame rates onto a single output frame grid.
+    Each output grid time is filled by the first source frame at or after that time, so the decision about
+    whether a source frame is needed can be made as soon as it is grabbed, before it is decoded (retrieved).
+    The grid continues from one video to the next, with each video starting where the previous one ended
+    (i.e. one frame period after its last frame), so grid times left over at the end of a video get filled
+    by the start of the next one.
+
+    Usage (per video):
+        resampler.startVideo(videoFPS)
+        for each grabbed frame:
+            outputCount = resampler.outputCount(frameIndex, timestampMsec)
+            -> 0 means the frame can be dropped, 2+ means the frame should be duplicated
+    '''
+
+    def __init__(self, outputFPS, useTimestamps=False):
+
+        # Store resampling settings
+        self.outputFPS = outputFPS
+        self._useTimestamps = useTimestamps
+
+        # Allocate storage for the grid position, which carries over between videos
+        self._nextGridIdx = 0
+        self._timeOffsetSec = 0.0
+
+        # Allocate storage for per-video state
+        self._videoFPS = None
+        self._firstFrameIdx = None
+        self._firstTimestampMsec = None
+        self._lastTimeSec = -1.0
+
+        # Allocate storage for reporting
+        self.framesIn = 0
+        self.framesOut = 0
+        self.framesDropped = 0
+        self.framesRepeated = 0
+
+    # .................................................................................................................
+
+    def startVideo(self, videoFPS):
+
+        # Start the new video where the previous one ended (one frame period after its last frame).
+        # Frame times are still measured from the start of each video, so timing errors can't accumulate
+        if (self._videoFPS is not None) and (self._lastTimeSec >= 0):
+            self._timeOffsetSec += self._lastTimeSec + (1.0 / self._videoFPS)
+
+        self._videoFPS = videoFPS
+        self._firstFrameIdx = None
+        self._firstTimestampMsec = None
+        self._lastTimeSec = -1.0
+
+    # .................................................................................................................
+
+    def outputCount(self, frameIndex, timestampMsec=None):
+
+        '''
+        Returns the number of output frames the given source frame should fill.
+        Frame times are taken from the (millisecond) timestamps if enabled and valid,
+        otherwise they're computed from the frame index and the nominal frame rate.
+        '''
+
+        # Times are measured relative to the first frame given for each video
+        if self._firstFrameIdx is None:
+            self._firstFrameIdx = frameIndex
+            self._firstTimestampMsec = timestampMsec
+        frameTimeSec = (frameIndex - self._firstFrameIdx) / self._videoFPS
+
+        # Use timestamps if possible, but only if they make sense (some backends report zeros or repeats)
+        if self._useTimestamps and (timestampMsec is not None) and (self._firstTimestampMsec is not None):
+            stampTimeSec = (timestampMsec - self._firstTimestampMsec) / 1000.0
+            if stampTimeSec > self._lastTimeSec:
+                frameTimeSec = stampTimeSec
+        frameTimeSec = max(frameTimeSec, self._lastTimeSec + 1E-6)
+        self._lastTimeSec = frameTimeSec
+
+        # Count the grid times that are covered by this frame (i.e. grid times up to & including the frame time)
+        lastGridIdx = int(math.floor((self._timeOffsetSec + frameTimeSec) * self.outputFPS + 1E-6))
+        newCount = max(0, 1 + lastGridIdx - self._nextGridIdx)
+        self._nextGridIdx += newCount
+
+        # Record stats for feedback
+        self.framesIn += 1
+        self.framesOut += newCount
+        self.framesDropped += int(newCount == 0)
+        self.framesRepeated += max(0, newCount - 1)
+
+        return newCount
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
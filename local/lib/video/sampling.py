@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:02:47 2026
+
+@author: eo
+"""
+
+import os
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from local.lib.video.io import openVideoCapture
+from local.lib.video.metadata import loadMetadata
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class LoopingClip:
+
+    '''
+    Short clip of (downscaled) frames, decoded once and held in memory.
+    Reading from the clip mimics a cv2.VideoCapture object, except that the clip loops forever,
+    so interactive tools can run without re-decoding the source video on every iteration.
+    '''
+
+    def __init__(self, videoSource, frameWH=None, maxFrames=90, frameStep=1, maxMegabytes=256):
+
+        # Store clip settings
+        self._source = videoSource
+        self._frameWH = None if frameWH is None else (int(frameWH[0]), int(frameWH[1]))
+        self._frameStep = max(1, int(frameStep))
+
+        # Allocate storage for the frames & playback position
+        self.frames = []
+        self._frameIdx = -1
+
+        # Decode the clip frames
+        self._loadFrames(maxFrames, maxMegabytes)
+
+    # .................................................................................................................
+
+    def __len__(self):
+        return len(self.frames)
+
+    # .................................................................................................................
+
+    def read(self):
+
+        # Loop back to the start of the clip once we reach the end
+        self._frameIdx = (1 + self._frameIdx) % len(self.frames)
+
+        return True, self.frames[self._frameIdx]
+
+    # .................................................................................................................
+
+    def map(self, frameFunction):
+
+        ''' Apply a function to every frame of the clip (once!), replacing the stored frames with the result '''
+
+        self.frames = [frameFunction(eachFrame) for eachFrame in self.frames]
+
+    # .................................................................................................................
+
+    def release(self):
+        self.frames = []
+
+    # .................................................................................................................
+
+    def _loadFrames(self, maxFrames, maxMegabytes):
+
+        # Open the video for reading
+        videoObj = openVideoCapture(self._source)
+        if not videoObj.isOpened():
+            print("")
+            print("Couldn't open video for clip. Tried:")
+            print(self._source)
+            print("")
+            raise IOError
+
+        maxBytes = int(maxMegabytes * 1E6)
+        clipBytes = 0
+        try:
+            while len(self.frames) < maxFrames:
+
+                # Get the next frame, skipping (without decoding) frames in between clip frames
+                (receivedFrame, inFrame) = videoObj.read()
+                if not receivedFrame: break
+                for _ in range(self._frameStep - 1):
+                    videoObj.grab()
+
+                # Downscale once, so we don't have to resize on every loop of the clip
+                if self._frameWH is not None:
+                    inFrame = cv2.resize(inFrame, dsize = self._frameWH, interpolation = cv2.INTER_AREA)
+
+                # Stop loading frames if we're taking up too much memory
+                clipBytes += inFrame.nbytes
+                if clipBytes > maxBytes and len(self.frames) > 0:
+                    break
+                self.frames.append(inFrame)
+
+        finally:
+            videoObj.release()
+
+        # Make sure we actually got something
+        if len(self.frames) < 1:
+            print("")
+            print("Couldn't read any frames for clip. Tried:")
+            print(self._source)
+            print("")
+            raise IOError
+
+    # .................................................................................................................
+
+
+# =====================================================================================================================
+# =====================================================================================================================
+# =====================================================================================================================
+
+class TimelineClip(LoopingClip):
+
+    '''
+    Set of (downscaled) frames sampled evenly across an entire list of videos, held in memory.
+    Samples are fetched in parallel (one task per video) using seeking, so only the sampled frames are decoded.
+    Reads loop through the samples in timeline order, just like a LoopingClip.
+    '''
+
+    def __init__(self, videoSourceList, frameWH=None, numSamples=24, maxWorkers=None):
+
+        # Store sampling settings, needed before loading frames
+        self._maxWorkers = maxWorkers
+        self.labels = []
+
+        super().__init__(list(videoSourceList), frameWH, maxFrames = numSamples)
+
+    # .................................................................................................................
+
+    def _loadFrames(self, numSamples, maxMegabytes):
+
+        # Spread samples evenly over the timeline, measured in units of 'files' (i.e. assume similar lengths)
+        numFiles = len(self._source)
+        timelinePositions = [(0.5 + eachSample) * numFiles / numSamples for eachSample in range(numSamples)]
+
+        # Group the sample positions by file, so each file only needs to be opened once
+        fileSampleDict = {}
+        for eachPosition in timelinePositions:
+            fileIdx = min(numFiles - 1, int(eachPosition))
+            fileSampleDict.setdefault(fileIdx, []).append(eachPosition - fileIdx)
+
+        # Fetch samples from every file in parallel. OpenCV releases the GIL while decoding, so threads are enough
+        numWorkers = self._maxWorkers if self._maxWorkers is not None else min(8, os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers = numWorkers) as executor:
+            sampleFutures = {fileIdx: executor.submit(readFramesAtFractions,
+                                                      self._source[fileIdx], fileFractions, self._frameWH)
+                             for fileIdx, fileFractions in fileSampleDict.items()}
+
+        # Store frames in timeline order, skipping any samples that failed to load
+        for fileIdx in sorted(sampleFutures.keys()):
+            fileName = os.path.basename(self._source[fileIdx])
+            for eachFrameIdx, eachFrame in sampleFutures[fileIdx].result():
+                self.frames.append(eachFrame)
+                self.labels.append("{} (frame {})".format(fileName, eachFrameIdx))
+
+        # Make sure we actually got something
+        if len(self.frames) < 1:
+            print("")
+            print("Couldn't read any sample frames from the video list!")
+            print("")
+            raise IOError
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define functions
+
+def iterFramesAtFractions(videoSource, fractionList, frameWH=None):
+
+    '''
+    Generator which yields (fraction, frame index, frame) tuples, read from the given (fractional) positions
+    within a video. Frames are found by seeking, and are downscaled right away if a frame size is given.
+    Positions that can't be read are skipped, rather than raising errors.
+    Positions are based on the verified frame count (see countFrames) if one is stored, otherwise the header count.
+    Videos without a usable frame count are skipped, since every position would land on the first frame.
+    '''
+
+    videoObj = openVideoCapture(videoSource)
+    if not videoObj.isOpened():
+        print("")
+        print("Couldn't open video for sampling. Skipping:")
+        print(videoSource)
+        return
+
+    try:
+        # Prefer the stored (verified) frame count, since headers can be wrong or missing (-1)
+        countDict = loadMetadata(videoSource, "frame_count")
+        totalFrames = int(videoObj.get(cv2.CAP_PROP_FRAME_COUNT)) if countDict is None else countDict["verified"]
+        if totalFrames < 1:
+            print("")
+            print("Unknown frame count, can't sample video. Skipping:")
+            print(videoSource)
+            return
+
+        for eachFraction in sorted(fractionList):
+
+            # Seek to the sample position & read the frame
+            frameIdx = max(0, min(totalFrames - 1, int(eachFraction * totalFrames)))
+            videoObj.set(cv2.CAP_PROP_POS_FRAMES, frameIdx)
+            (receivedFrame, inFrame) = videoObj.read()
+            if not receivedFrame:
+                continue
+
+            # Downscale once, so nothing else needs to deal with the full-size frame
+            if frameWH is not None:
+                inFrame = cv2.resize(inFrame, dsize = frameWH, interpolation = cv2.INTER_AREA)
+            yield eachFraction, frameIdx, inFrame
+
+    finally:
+        videoObj.release()
+
+# .....................................................................................................................
+
+def readFramesAtFractions(videoSource, fractionList, frameWH=None):
+
+    ''' Returns a list of (frame index, frame) tuples, read from the given (fractional) positions within a video '''
+
+    return [(frameIdx, eachFrame) for _, frameIdx, eachFrame in iterFramesAtFractions(videoSource,
+                                                                                        fractionList,
+                                                                                        frameWH)]
+
+# .....................................................................................................................
+
+def maskedOverlay(frame, overlayFrame, overlayMask):
+
+    ''' Returns a copy of the frame with the overlay pasted in (wherever the mask is True) '''
+
+    outFrame = frame.copy()
+    np.copyto(outFrame, overlayFrame, where = overlayMask)
+
+    return outFrame
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
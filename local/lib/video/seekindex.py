@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 10:40:18 2026
+
+@author: eo
+"""
+
+import cv2
+from bisect import bisect_right
+from time import perf_counter
+
+from local.lib.video.metadata import loadMetadata, saveMetadata
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class SeekIndex:
+
+    '''
+    Per-file list of anchor frames (every N frames), along with their timestamps and the measured cost of
+    seeking & grabbing. Seeks jump to the nearest earlier anchor and then grab forward to the target,
+    so the landing position is exact and the cost is predictable. If grabbing forward from the current
+    position is cheaper than jumping, no seek is done at all.
+    Anchors sit on a fixed time grid (not on keyframes), so jumping to one costs about the same as the
+    backend's own seek. Their timestamps are what make the landing checkable. If an anchor lands in the
+    wrong spot, it's dropped and the seek falls back to a nearby anchor that has landed correctly before,
+    or otherwise to the backend's own seek. Seeks never restart from the start of the file, since that
+    could mean grabbing through hours of video.
+    '''
+
+    def __init__(self, indexDict, maxFallbackSec=2.0):
+
+        self.frameCount = int(indexDict["frame_count"])
+        self.anchorFrames = [int(eachFrame) for eachFrame in indexDict["anchor_frames"]]
+        self.anchorMsec = [float(eachMsec) for eachMsec in indexDict["anchor_msec"]]
+        self.fps = float(indexDict["fps"])
+        self.grabSec = float(indexDict["grab_sec"])
+        self.seekSec = float(indexDict["seek_sec"])
+
+        # Limit on the (estimated) time spent grabbing forward from a fallback anchor after a bad landing
+        self._maxFallbackSec = maxFallbackSec
+
+        # Anchors which didn't land where expected are skipped from then on. Ones that did are kept as fallbacks
+        self._badAnchors = set()
+        self._goodAnchors = set()
+
+    # .................................................................................................................
+
+    def toDict(self):
+        return {"frame_count": self.frameCount,
+                "anchor_frames": self.anchorFrames,
+                "anchor_msec": self.anchorMsec,
+                "fps": self.fps,
+                "grab_sec": self.grabSec,
+                "seek_sec": self.seekSec}
+
+    # .................................................................................................................
+
+    def seekCost(self, frameIndex, currentIndex=None):
+
+        ''' Estimate the time (in seconds) needed to get to a frame, using the cheapest option '''
+
+        anchorFrame = self.anchorFrames[self._anchorBefore(frameIndex)]
+        jumpCost = self.seekSec + (frameIndex - anchorFrame) * self.grabSec
+        if currentIndex is not None and currentIndex <= frameIndex:
+            return min(jumpCost, (frameIndex - currentIndex) * self.grabSec)
+
+        return jumpCost
+
+    # .................................................................................................................
+
+    def seek(self, videoObj, frameIndex, currentIndex=None):
+
+        '''
+        Position a (cv2.VideoCapture) object so that the next grab/read returns the target frame.
+
+        outputs:
+            - landedIndex: the frame index the next grab will return
+        '''
+
+        frameIndex = max(0, min(self.frameCount, int(frameIndex)))
+
+        # Just grab forward if that's cheaper than jumping to an anchor
+        anchorIdx = self._anchorBefore(frameIndex)
+        anchorFrame = self.anchorFrames[anchorIdx]
+        jumpCost = self.seekSec + (frameIndex - anchorFrame) * self.grabSec
+        if currentIndex is not None and currentIndex <= frameIndex:
+            if (frameIndex - currentIndex) * self.grabSec <= jumpCost:
+                return self._grabForward(videoObj, currentIndex, frameIndex)
+
+        # Jump to the anchor. Grab the anchor frame and confirm (by timestamp) we landed in the right spot
+        videoObj.set(cv2.CAP_PROP_POS_FRAMES, anchorFrame)
+        if frameIndex == anchorFrame:
+            return frameIndex
+        if not videoObj.grab():
+            return anchorFrame
+        landedMsec = videoObj.get(cv2.CAP_PROP_POS_MSEC)
+        if abs(landedMsec - self.anchorMsec[anchorIdx]) <= (500.0 / self.fps):
+            self._goodAnchors.add(anchorIdx)
+            return self._grabForward(videoObj, 1 + anchorFrame, frameIndex)
+
+        # Seek was inaccurate, so don't use this anchor again. Fall back to the nearest earlier anchor that
+        # has landed correctly before, as long as it isn't too far back to grab forward from
+        self._badAnchors.add(anchorIdx)
+        fallbackIdx = self._goodAnchorBefore(frameIndex)
+        if fallbackIdx is not None:
+            fallbackFrame = self.anchorFrames[fallbackIdx]
+            if (frameIndex - fallbackFrame) * self.grabSec <= self._maxFallbackSec:
+                videoObj.set(cv2.CAP_PROP_POS_FRAMES, fallbackFrame)
+                return self._grabForward(videoObj, fallbackFrame, frameIndex)
+
+        # Otherwise leave it to the backend's own seeking, which may not be exact
+        videoObj.set(cv2.CAP_PROP_POS_FRAMES, frameIndex)
+
+        return frameIndex
+
+    # .................................................................................................................
+
+    def _anchorBefore(self, frameIndex):
+
+        # Find the last (good) anchor strictly before the target, so the landing can always be checked by grabbing
+        anchorIdx = max(0, bisect_right(self.anchorFrames, frameIndex - 1) - 1)
+        while anchorIdx > 0 and anchorIdx in self._badAnchors:
+            anchorIdx -= 1
+
+        return anchorIdx
+
+    # .................................................................................................................
+
+    def _goodAnchorBefore(self, frameIndex):
+
+        # Find the last anchor (strictly before the target) that is known to land correctly, if any
+        goodBeforeList = [eachIdx for eachIdx in self._goodAnchors
+                          if (self.anchorFrames[eachIdx] < frameIndex) and (eachIdx not in self._badAnchors)]
+
+        return max(goodBeforeList) if goodBeforeList else None
+
+    # .................................................................................................................
+
+    def _grabForward(self, videoObj, currentIndex, frameIndex):
+
+        # Grab (without decoding) up to the target frame
+        for eachIndex in range(currentIndex, frameIndex):
+            if not videoObj.grab():
+                return eachIndex
+
+        return frameIndex
+
+    # .................................................................................................................
+
+
+# =====================================================================================================================
+# =====================================================================================================================
+# =====================================================================================================================
+
+class IndexedCapture:
+
+    '''
+    Wrapper around a cv2.VideoCapture object which uses a seek index for all frame-based seeking.
+    Also tracks the frame position itself (rather than trusting the backend), and reports the exact frame count.
+    Anything not handled here is passed straight through to the capture object.
+    '''
+
+    def __init__(self, videoObj, seekIndex):
+
+        self._videoObj = videoObj
+        self.seekIndex = seekIndex
+        self._frameIdx = 0
+
+    # .................................................................................................................
+
+    def __getattr__(self, attrName):
+        return getattr(self._videoObj, attrName)
+
+    # .................................................................................................................
+
+    def grab(self):
+        receivedFrame = self._videoObj.grab()
+        self._frameIdx += int(receivedFrame)
+        return receivedFrame
+
+    # .................................................................................................................
+
+    def read(self):
+        return self._videoObj.retrieve() if self.grab() else (False, None)
+
+    # .................................................................................................................
+
+    def get(self, propertyCode):
+
+        if propertyCode == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._frameIdx)
+        if propertyCode == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.seekIndex.frameCount)
+
+        return self._videoObj.get(propertyCode)
+
+    # .................................................................................................................
+
+    def set(self, propertyCode, value):
+
+        if propertyCode == cv2.CAP_PROP_POS_FRAMES:
+            self._frameIdx = self.seekIndex.seek(self._videoObj, value, self._frameIdx)
+            return True
+        if propertyCode == cv2.CAP_PROP_POS_MSEC:
+            self._frameIdx = self.seekIndex.seek(self._videoObj, value * self.seekIndex.fps / 1000.0, self._frameIdx)
+            return True
+
+        return self._videoObj.set(propertyCode, value)
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define functions
+
+def buildSeekIndex(videoSource, anchorSeconds=1.0, numSeekTests=5):
+
+    '''
+    Build a seek index for a video, by grabbing (not decoding) every frame once. Anchor timestamps are recorded
+    every few frames, and a few seeks are timed to estimate seeking costs. The result is stored in the
+    video's metadata, so this only needs to be done once per file.
+
+    outputs:
+        - seekIndex: SeekIndex object, or None if the video couldn't be read
+    '''
+
+    videoObj = cv2.VideoCapture(videoSource)
+    if not videoObj.isOpened():
+        return None
+
+    try:
+        # Use the same FPS fallback as setupVideoCapture (some files report garbage)
+        vidFPS = videoObj.get(cv2.CAP_PROP_FPS)
+        vidFPS = vidFPS if (5 < vidFPS < 61) else 30
+        anchorStep = max(1, int(round(anchorSeconds * vidFPS)))
+
+        # Grab through the whole file, recording the timestamp of every anchor frame
+        anchorFrames, anchorMsec = [], []
+        frameCount = 0
+        t1 = perf_counter()
+        while videoObj.grab():
+            if (frameCount % anchorStep) == 0:
+                anchorFrames.append(frameCount)
+                anchorMsec.append(videoObj.get(cv2.CAP_PROP_POS_MSEC))
+            frameCount += 1
+        t2 = perf_counter()
+
+        if frameCount < 1:
+            return None
+
+        # Time a few jumps (spread over the file) to estimate the cost of seeking
+        testAnchors = anchorFrames[::max(1, len(anchorFrames) // numSeekTests)][:numSeekTests]
+        t3 = perf_counter()
+        for eachAnchor in testAnchors:
+            videoObj.set(cv2.CAP_PROP_POS_FRAMES, eachAnchor)
+            videoObj.grab()
+        t4 = perf_counter()
+
+    finally:
+        videoObj.release()
+
+    seekIndex = SeekIndex({"frame_count": frameCount,
+                           "anchor_frames": anchorFrames,
+                           "anchor_msec": anchorMsec,
+                           "fps": vidFPS,
+                           "grab_sec": (t2 - t1) / frameCount,
+                           "seek_sec": (t4 - t3) / max(1, len(testAnchors))})
+    saveMetadata(videoSource, {"seek_index": seekIndex.toDict()})
+
+    return seekIndex
+
+# .....................................................................................................................
+
+def loadSeekIndex(videoSource, buildIfMissing=False):
+
+    ''' Load the stored seek index for a video, optionally building it if there isn't one. None if unavailable '''
+
+    indexDict = loadMetadata(videoSource, "seek_index")
+    if indexDict is not None:
+        try:
+            return SeekIndex(indexDict)
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    return buildSeekIndex(videoSource) if buildIfMissing else None
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 09:26:40 2026
+
+@author: eo
+"""
+
+import cv2
+import numpy as np
+
+# Shared memory needs python 3.8+. Without it, frames have to be passed between processes the slow way (pickling)
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class SharedFrameRing:
+
+    '''
+    Fixed number of (same-sized) frame slots, held in a block of shared memory.
+    The process that creates the ring owns it. Other processes attach to it using the ring spec (see spec()),
+    and then read/write slots directly, so only slot indices & small metadata need to be passed between processes.
+    Deciding which slots are free to be written is left to the user of the ring.
+    '''
+
+    def __init__(self, numSlots, frameShape, ringName=None):
+
+        # Store ring layout
+        self.numSlots = int(numSlots)
+        self.frameShape = tuple(int(eachSize) for eachSize in frameShape)
+        self._isOwner = (ringName is None)
+
+        # Create a new block of shared memory, or attach to an existing one
+        ringBytes = self.numSlots * int(np.prod(self.frameShape))
+        if self._isOwner:
+            self._sharedMem = shared_memory.SharedMemory(create = True, size = max(1, ringBytes))
+        else:
+            self._sharedMem = shared_memory.SharedMemory(name = ringName)
+        self.name = self._sharedMem.name
+
+        # Access all the slots as one numpy array (no copying)
+        self.frames = np.ndarray((self.numSlots,) + self.frameShape, dtype=np.uint8, buffer=self._sharedMem.buf)
+
+    # .................................................................................................................
+
+    def __len__(self):
+        return self.numSlots
+
+    # .................................................................................................................
+
+    def __getitem__(self, slotIdx):
+        return self.frames[slotIdx % self.numSlots]
+
+    # .................................................................................................................
+
+    def spec(self):
+
+        ''' Returns the info needed to attach to this ring from another process: SharedFrameRing(*ring.spec()) '''
+
+        return self.numSlots, self.frameShape, self.name
+
+    # .................................................................................................................
+
+    def write(self, slotIdx, frame):
+
+        # Write straight into the slot. Frames of the wrong size are resized on the way in
+        slotFrame = self.frames[slotIdx % self.numSlots]
+        if frame.shape == self.frameShape:
+            np.copyto(slotFrame, frame)
+        else:
+            cv2.resize(frame, dsize = (self.frameShape[1], self.frameShape[0]), dst = slotFrame,
+                       interpolation = cv2.INTER_AREA)
+
+        return slotFrame
+
+    # .................................................................................................................
+
+    def close(self):
+
+        # Drop the numpy view first, otherwise the shared memory can't be closed
+        self.frames = None
+        self._sharedMem.close()
+        if self._isOwner:
+            self._sharedMem.unlink()
+
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define functions
+
+def sharedMemoryAvailable():
+    return shared_memory is not None
+
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
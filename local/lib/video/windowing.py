@@ -9,7 +9,11 @@ Created on Fri Jul 13 16:04:54 2018
 
 """
 
+import os
 import cv2
+import json
+import hashlib
+import threading
 import numpy as np
 from time import perf_counter
 
@@ -120,22 +124,22 @@ class SimpleWindow:
         if store_new_setting:
             self._trackbars[bar_name] = cv2.getTrackbarPos(bar_name, self._name)        
     
-    # .................................................................................................................    
+    # .................................................................................................................
     
     def reset(self):
         self._createWindow()    # Similar to restart, but will re-position open windows as well
     
-    # .................................................................................................................    
+    # .................................................................................................................
     
     def restart(self):
         if not self.exists(): self._createWindow()
     
-    # .................................................................................................................    
+    # .................................................................................................................
     
     def close(self):
         if self.exists(): cv2.destroyWindow(self._name)
         
-    # .................................................................................................................  
+    # .................................................................................................................
     
     def exists(self):
         return cv2.getWindowProperty(self._name, 1) > 0
@@ -176,6 +180,8 @@ class TimebarWindow(SimpleWindow):
         self._paused = False
         self._pause_frame = None
         self.keyPress = None
+        self._filmstrip = None
+        self._seek_request = None
         
     # .................................................................................................................  
     
@@ -185,6 +191,28 @@ class TimebarWindow(SimpleWindow):
         
     # .................................................................................................................  
     
+    def addFilmstrip(self, video_source, num_thumbnails = 10, thumbnail_width = 160, cache_folder = None):
+        
+        # Start generating thumbnails in the background. They'll show up (under the timebar) as they're ready
+        self._filmstrip = Filmstrip(video_source, num_thumbnails, thumbnail_width, cache_folder)
+        
+        # Jump to a thumbnail's position when it's clicked
+        cv2.setMouseCallback(self._name, self._filmstrip_callback)
+        
+    # .................................................................................................................  
+    
+    def imshow(self, frame):
+        
+        # Draw the filmstrip above the frame, if we have one
+        if self._filmstrip is not None:
+            strip_image = self._filmstrip.draw(frame.shape[1], self._frame_idx, self._total_frames)
+            if strip_image is not None:
+                frame = np.vstack((strip_image, frame))
+        
+        return super().imshow(frame)
+        
+    # .................................................................................................................  
+    
     def get_frame(self, videoObj_ref, frame_delay = 10, pause_delay = 10):
         
         # Set output defaults
@@ -192,6 +220,20 @@ class TimebarWindow(SimpleWindow):
         request_continue = False
         new_frame = self._pause_frame        
         
+        # Handle jumps from clicking on the filmstrip
+        if self._seek_request is not None:
+            videoObj_ref.set(cv2.CAP_PROP_POS_FRAMES, self._seek_request)
+            self._seek_request = None
+            
+            # Update the paused frame, so the jump is visible while paused
+            if self._paused:
+                (received_frame, seek_frame) = videoObj_ref.read()
+                if received_frame:
+                    self._pause_frame = seek_frame.copy()
+                    new_frame = self._pause_frame
+                    self._frame_idx = int(videoObj_ref.get(cv2.CAP_PROP_POS_FRAMES))
+                    cv2.setTrackbarPos(self._timebar_name, self._name, self._frame_idx)
+        
         if self._paused:
             request_continue = True
             frame_delay = pause_delay
@@ -229,8 +271,326 @@ class TimebarWindow(SimpleWindow):
             request_continue = True
         
         return request_break, request_continue, new_frame
+    
+    # .................................................................................................................  
+    
+    def _filmstrip_callback(self, event, mx, my, flags, param):
+        
+        # Only respond to left clicks on the filmstrip
+        if event != cv2.EVENT_LBUTTONDOWN:
+            return
+        
+        thumbnail_frame_idx = self._filmstrip.frame_index_at(mx, my)
+        if thumbnail_frame_idx is not None:
+            self._seek_request = thumbnail_frame_idx
+        
+    
+# =====================================================================================================================
+# =====================================================================================================================
+# =====================================================================================================================
+        
+class Filmstrip:
+    
+    '''
+    Strip of evenly spaced thumbnails from a video, used for scrubbing through long videos.
+    Thumbnails are generated in a background thread (with seeking, using a separate capture object),
+    so that playback is never blocked. Finished strips are cached on disk, so they only need to be generated once.
+    '''
+    
+    def __init__(self, video_source, num_thumbnails = 10, thumbnail_width = 160, cache_folder = None):
+        
+        # Store filmstrip settings
+        self._source = video_source
+        self._num_thumbnails = int(num_thumbnails)
+        self._thumbnail_width = int(thumbnail_width)
+        self._cache_folder = cache_folder
+        if cache_folder is None:
+            self._cache_folder = os.path.join(os.path.expanduser("~"), ".cache", "videostitch", "thumbnails")
+        
+        # Thumbnails are taken from the middle of evenly sized sections of the video
+        self._fractions = [(0.5 + each_idx) / self._num_thumbnails for each_idx in range(self._num_thumbnails)]
+        
+        # Allocate storage for the strip image (created once the video size is known) & thumbnail positions
+        self._strip = None
+        self.frame_indices = [None] * self._num_thumbnails
+        self._strip_version = 0
+        
+        # Allocate storage for the (resized) strip used for display
+        self._display_strip = None
+        self._display_key = None
+        
+        # Generate thumbnails in the background
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+    
+    # .................................................................................................................
+    
+    def draw(self, display_width, current_frame_idx = None, total_frames = None):
+        
+        ''' Returns an image of the filmstrip, sized to the given width, with a marker for the current position '''
+        
+        if self._strip is None:
+            return None
+        
+        # Only resize the strip if it changed (new thumbnails) or the display size changed
+        display_key = (self._strip_version, display_width)
+        if display_key != self._display_key:
+            strip_height, strip_width = self._strip.shape[0:2]
+            display_height = max(1, int(round(strip_height * display_width / strip_width)))
+            self._display_strip = cv2.resize(self._strip, dsize = (display_width, display_height), 
+                                             interpolation = cv2.INTER_AREA)
+            self._display_key = display_key
+        
+        # Mark the current position on the strip
+        strip_image = self._display_strip.copy()
+        if (current_frame_idx is not None) and total_frames:
+            marker_x = int(round((display_width - 1) * min(1.0, current_frame_idx / total_frames)))
+            cv2.line(strip_image, (marker_x, 0), (marker_x, strip_image.shape[0] - 1), (0, 255, 255), 2)
+        
+        return strip_image
+    
+    # .................................................................................................................
+    
+    def frame_index_at(self, x, y):
+        
+        ''' Get the frame index of the thumbnail at the given (display) position, or None if not on the strip '''
+        
+        if self._display_strip is None:
+            return None
+        
+        display_height, display_width = self._display_strip.shape[0:2]
+        if not ((0 <= y < display_height) and (0 <= x < display_width)):
+            return None
+        
+        thumbnail_idx = min(self._num_thumbnails - 1, int(x * self._num_thumbnails / display_width))
+        
+        return self.frame_indices[thumbnail_idx]
+    
+    # .................................................................................................................
+    
+    def _run(self):
+        
+        # Use the cached strip if possible
+        cache_path = self._cache_path()
+        if (cache_path is not None) and self._load_cache(cache_path):
+            return
+        
+        # Avoid circular imports (sampling relies on io, which doesn't need any windowing)
+        from local.lib.video.sampling import iterFramesAtFractions
+        
+        # Generate each thumbnail, updating the strip as we go
+        fraction_lut = {each_fraction: each_idx for each_idx, each_fraction in enumerate(self._fractions)}
+        thumbnail_wh = None
+        try:
+            for each_fraction, each_frame_idx, each_frame in iterFramesAtFractions(self._source, self._fractions):
+                
+                # Create the strip once we know the video dimensions
+                if thumbnail_wh is None:
+                    frame_height, frame_width = each_frame.shape[0:2]
+                    thumbnail_height = max(1, int(round(frame_height * self._thumbnail_width / frame_width)))
+                    thumbnail_wh = (self._thumbnail_width, thumbnail_height)
+                    strip_shape = (thumbnail_height, self._thumbnail_width * self._num_thumbnails, 3)
+                    new_strip = np.zeros(strip_shape, dtype = np.uint8)
+                else:
+                    new_strip = self._strip.copy()
+                
+                # Draw the thumbnail into it's spot on the strip (with a thin divider)
+                thumb_idx = fraction_lut[each_fraction]
+                x1 = thumb_idx * self._thumbnail_width
+                thumbnail = cv2.resize(each_frame, dsize = thumbnail_wh, interpolation = cv2.INTER_AREA)
+                new_strip[:, x1:(x1 + self._thumbnail_width)] = thumbnail
+                new_strip[:, x1] = 0
+                
+                # Swap in the new strip (rather than editing the displayed strip in-place)
+                self.frame_indices[thumb_idx] = each_frame_idx
+                self._strip = new_strip
+                self._strip_version += 1
+                
+        except Exception as err:
+            print("")
+            print("Error generating filmstrip thumbnails:")
+            print(err)
+            return
+        
+        # Save the finished strip, so we don't need to generate it again
+        if (cache_path is not None) and (self._strip is not None) and (None not in self.frame_indices):
+            self._save_cache(cache_path)
+    
+    # .................................................................................................................
+    
+    def _cache_path(self):
+        
+        # Build a cache name that changes if the video file changes (or if the strip settings change)
+        try:
+            file_stat = os.stat(self._source)
+        except (OSError, TypeError):
+            return None
+        
+        cache_key_string = "{}|{}|{}|{}|{}".format(os.path.abspath(self._source), file_stat.st_size, 
+                                                   file_stat.st_mtime, self._num_thumbnails, self._thumbnail_width)
+        cache_key = hashlib.md5(cache_key_string.encode()).hexdigest()
+        
+        return os.path.join(self._cache_folder, cache_key + ".png")
+    
+    # .................................................................................................................
+    
+    def _load_cache(self, cache_path):
+        
+        if not os.path.exists(cache_path):
+            return False
+        
+        # Load the strip image, along with the (json) frame indices
+        try:
+            cached_strip = cv2.imread(cache_path)
+            with open(cache_path + ".json", "r") as in_file:
+                cached_indices = json.load(in_file)
+        except Exception:
+            return False
+        
+        if cached_strip is None or len(cached_indices) != self._num_thumbnails:
+            return False
+        
+        self.frame_indices = cached_indices
+        self._strip = cached_strip
+        self._strip_version += 1
+        
+        return True
+    
+    # .................................................................................................................
+    
+    def _save_cache(self, cache_path):
+        
+        # Failing to save the cache shouldn't be a problem, we'll just have to re-generate next time
+        try:
+            os.makedirs(self._cache_folder, exist_ok = True)
+            with open(cache_path + ".json", "w") as out_file:
+                json.dump(self.frame_indices, out_file)
+            cv2.imwrite(cache_path, self._strip)
+        except Exception:
+            pass
+    
+    # .................................................................................................................
+        
+    
+# =====================================================================================================================
+# =====================================================================================================================
+# =====================================================================================================================
+        
+class PreviewWindow:
+    
+    '''
+    Window for previewing frames from a separate thread, so that displaying never blocks processing.
+    The processing loop hands over a copy of its latest frame, which the preview thread displays at a fixed
+    refresh rate. A copy is needed, since the original may be overwritten or freed (e.g. shared memory views)
+    while the preview thread is still using it. Frames are only provided at the refresh rate (see wantsFrame),
+    so copying is cheap. Any frames provided in between refreshes are dropped.
+    '''
+    
+    def __init__(self, name="Preview", x=None, y=None, refreshRate=10, maxWH=None, enabled=True):
+        
+        # Store window settings, for use when the window is created (inside the preview thread)
+        self._name = name
+        self._x = x
+        self._y = y
+        self._maxWH = maxWH
+        self._period = 1.0 / refreshRate
+        
+        # Allocate storage for the frame handoff
+        self._latestFrame = None
+        self._lastUpdateTime = -self._period
+        
+        # Set up signalling between the processing & preview threads
+        self._stopEvent = threading.Event()
+        self._thread = None
+        self.stopRequested = False
+        self.windowClosed = False
+        
+        # Start the preview thread, as long as this display is enabled
+        if enabled:
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+            
+        else:
+            # Blowout functions if this window is disabled
+            def blankFunc(*args, **kwargs): return None
+            def falseFunc(*args, **kwargs): return False
+            self.wantsFrame = falseFunc
+            self.update = blankFunc
+    
+    # .................................................................................................................
+    
+    def wantsFrame(self):
+        
+        ''' Returns True if a new frame would be displayed. Can be used to skip processing of dropped frames '''
         
+        return (not self.windowClosed) and ((perf_counter() - self._lastUpdateTime) >= self._period)
     
+    # .................................................................................................................
+    
+    def update(self, frame):
+        
+        # Store a copy of the frame, the preview thread will pick it up when ready
+        self._latestFrame = frame.copy()
+        self._lastUpdateTime = perf_counter()
+    
+    # .................................................................................................................
+    
+    def close(self):
+        
+        # Signal the preview thread to stop, then wait for it to close it's window
+        self._stopEvent.set()
+        if self._thread is not None:
+            self._thread.join(timeout = 5.0)
+            self._thread = None
+    
+    # .................................................................................................................
+    
+    def _run(self):
+        
+        # Create the window inside the preview thread, since OpenCV windows belong to the thread that made them
+        previewWindow = SimpleWindow(self._name, x = self._x, y = self._y)
+        frameDelay = max(1, int(1000 * self._period))
+        
+        # Figure out how large we can display the preview
+        maxWH = self._maxWH
+        if maxWH is None:
+            dispWH = displayDimensionsWH(verbose = False)
+            maxWH = (int(dispWH[0]*0.5), int(dispWH[1]*0.5))
+        
+        shownFrame = None
+        while not self._stopEvent.is_set():
+            
+            # Show the latest frame, if it hasn't already been shown
+            newFrame = self._latestFrame
+            if (newFrame is not None) and (newFrame is not shownFrame):
+                
+                # Shrink the frame for display if needed
+                frameHeight, frameWidth = newFrame.shape[0:2]
+                dispFrame = newFrame
+                if frameWidth > maxWH[0] or frameHeight > maxWH[1]:
+                    scaleFactor = min(maxWH[0] / frameWidth, maxWH[1] / frameHeight)
+                    dispWH = (int(frameWidth * scaleFactor), int(frameHeight * scaleFactor))
+                    dispFrame = cv2.resize(newFrame, dsize = dispWH, interpolation = cv2.INTER_NEAREST)
+                
+                # Stop previewing if the window is closed, but don't stop processing
+                winExists = previewWindow.imshow(dispFrame)
+                if not winExists:
+                    self.windowClosed = True
+                    break
+                shownFrame = newFrame
+            
+            # Waiting on keypresses sets the refresh rate. Allow q/Esc to request a stop
+            reqBreak, _ = breakByKeypress(frameDelay)
+            if reqBreak:
+                self.stopRequested = True
+                
+        # Clean up
+        previewWindow.close()
+        cv2.waitKey(1)
+    
+    # .................................................................................................................
+
+
 # =====================================================================================================================
 # =====================================================================================================================
 # =====================================================================================================================
@@ -385,6 +745,10 @@ class Process_Timer:
     
 # ---------------------------------------------------------------------------------------------------------------------
 #%% Define functions
+
+# Screen dimensions, stored after the first lookup (see displayDimensionsWH)
+_display_dimensions_cache = None
+
     
 def breakByKeypress(frame_delay=1):
     
@@ -423,7 +787,6 @@ def plusminusKeys(keyPress):
 # .....................................................................................................................
     
 def displayIsAvailable():
-    import os
     return "DISPLAY" in os.environ
 
 # .....................................................................................................................
@@ -431,7 +794,10 @@ def displayIsAvailable():
 
 def displayDimensionsWH(verbose = True):
     
-    import subprocess
+    # Only probe the display once per process, since it can be slow (especially when it fails)
+    global _display_dimensions_cache
+    if _display_dimensions_cache is not None:
+        return list(_display_dimensions_cache)
     
     # . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .
     
@@ -443,13 +809,25 @@ def displayDimensionsWH(verbose = True):
         
         return [int(eachStrNum) for eachStrNum in pixel_string.split("x")]  # Convert dimension strings to integers
     
+    # . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .
+    
+    def first_line_with(command_list, search_string):
+        
+        # Run a command (with a timeout, in case the display server is unresponsive) and find the matching line
+        import subprocess
+        command_output = subprocess.check_output(command_list, stderr = subprocess.DEVNULL, timeout = 2).decode()
+        
+        return next(each_line for each_line in command_output.splitlines() if search_string in each_line)
+    
     # . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .
     # Try xdpyinfo, since it has a clear representation of the dimensions
     
+    dimensions = None
     try:
-        dimension_string = subprocess.check_output(["xdpyinfo | grep dimensions"], shell=True).decode()
+        if not displayIsAvailable(): raise OSError("No display")
+        dimension_string = first_line_with(["xdpyinfo"], "dimensions:")
         # Example return:
-        # '  dimensions:    1920x1080 pixels (483x272 millimeters)\n'
+        # '  dimensions:    1920x1080 pixels (483x272 millimeters)'
         
         dimensions = extract_dimensions(dimension_string, 
                                         bound_left="dimensions:", 
@@ -457,33 +835,31 @@ def displayDimensionsWH(verbose = True):
     # Ignore errors
     except Exception: pass
     
-    # If no exception occurs, assume we got good dimensions
-    else: return dimensions
-    
     # . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .
     # Try using xrandr if xdpyinfo failed
     
     try:
-        subprocess.check_output(["xrandr | grep ' connected'"], shell=True).decode()
+        if dimensions is not None or not displayIsAvailable(): raise OSError("No display")
+        dimension_string = first_line_with(["xrandr"], " connected")
         # Example return
-        # 'HDMI-1 connected 1920x1080+0+0 (normal left inverted right x axis y axis) 480mm x 270mm\n'
+        # 'HDMI-1 connected 1920x1080+0+0 (normal left inverted right x axis y axis) 480mm x 270mm'
         
-        dimensions = extract_dimensions(dimension_string, 
-                                        bound_left="connected:", 
+        dimensions = extract_dimensions(dimension_string.replace("primary", ""), 
+                                        bound_left="connected", 
                                         bound_right="+")
     # Ignore errors
     except Exception: pass    
-
-    # If no exception occurs, assume we got good dimensions
-    else: return dimensions
     
     # . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .
     # Return an assumed default 
     
-    dimensions = [1280, 720]
-    if verbose:
-        print("")
-        print("Couldn't find screen dimensions! Using default: {} x {}".format(*dimensions))
+    if dimensions is None:
+        dimensions = [1280, 720]
+        if verbose:
+            print("")
+            print("Couldn't find screen dimensions! Using default: {} x {}".format(*dimensions))
+    
+    _display_dimensions_cache = tuple(dimensions)
     
     return dimensions
 
@@ -541,12 +917,19 @@ def arrange_windows(rows, cols, window_list, padding_tlbr = [20, 20, 20, 20]):
 
 if __name__ == "__main__":
     
+    from local.lib.video.io import openVideoCapture
+    from local.lib.video.seekindex import loadSeekIndex
+    
     video_source = "/home/eo/Desktop/PythonData/Shared/videos/pl_part1_rot720.mp4"
-    videoObj = cv2.VideoCapture(video_source)
+    
+    # Build a seek index (only slow the first time), so the +/- keys & filmstrip clicks jump accurately
+    loadSeekIndex(video_source, buildIfMissing = True)
+    videoObj = openVideoCapture(video_source)
     
     
     winTest = TimebarWindow("TestTimebar")#, videoObj_ref = videoObj)
     winTest.addTimebar(videoObj)
+    winTest.addFilmstrip(video_source)
     
     while True:
         
@@ -13,9 +13,22 @@ import datetime as dt
 
 import re
 
-from local.lib.video.io import setupVideoCapture, setupVideoRecording
-from local.lib.video.windowing import SimpleWindow, breakByKeypress, arrowKeys, displayDimensionsWH
+from local.lib.video.io import setupVideoCapture, setupVideoRecordingV2, getVideoStartTime, openVideoCapture
+from local.lib.video.io import loadBackground
+from local.lib.video.overlays import TimestampOverlay, frameTimestamp
+from local.lib.video.sampling import LoopingClip, TimelineClip, maskedOverlay
+from local.lib.video.alignment import findBoundaryOverlaps
+from local.lib.video.probe import scanVideoIntegrity, verifyFrameCounts, verifyRecording
+from local.lib.video.resampling import FrameRateResampler
+from local.lib.video.framestore import FrameStoreWriter, isFrameStore
+from local.lib.video.batching import FrameBatch, applyLUTBatch
+from local.lib.video.planning import ProgressEstimator, formatDuration
+from local.lib.video.windowing import SimpleWindow, PreviewWindow, breakByKeypress, arrowKeys, displayDimensionsWH
 from local.lib.utils.files import guiLoadMany, guiSave, guiConfirm, guiDialogEntry
+from local.lib.utils.staging import FilePrefetcher, ScratchFile
+
+# Optional features (masking, exposure, events, parallel decoding, metrics etc.) are imported where they're enabled,
+# so start-up isn't slowed down by modules that don't end up being used
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -117,13 +130,13 @@ def crop_callback(event, mx, my, flags, param):
         zonepointSelect = param["zonepoint_select"]
         if zonepointSelect is not None:
             
-            # Force rectangular shape after dragging
+            # Force rectangular shape after dragging (for cropping), otherwise just move the point
             zone_select = zonepointSelect[0]
             point_select = zonepointSelect[1]
-            new_quad = rectangularize(param["zone_list"][zone_select], mxy, point_select)
-
-            # Update zone with rectangular quad co-ordinates            
-            param["zone_list"][zone_select] = new_quad
+            if param["rectangular_zones"]:
+                param["zone_list"][zone_select] = rectangularize(param["zone_list"][zone_select], mxy, point_select)
+            else:
+                param["zone_list"][zone_select][point_select] = mxy
     
     # .................................................................................................................
     # If no points-in-progress, un-select dragging points on left-release
@@ -136,8 +149,8 @@ def crop_callback(event, mx, my, flags, param):
     # If points-in-progress, complete polygon (or remove non-polygons) on left-release
     
     # Add new zone if releasing left click while in the middle of adding new points
-    if event == cv2.EVENT_LBUTTONUP and points_in_progress:
-        '''
+    if event == cv2.EVENT_LBUTTONUP and points_in_progress and param["zone_editing"]:
+        
         # For convenience
         new_points = param["new_points"]
         
@@ -154,48 +167,33 @@ def crop_callback(event, mx, my, flags, param):
         
         # Clear the points used to create the zone so we don't re-use them
         param["new_points"] = []
-        '''
-        pass
     
     # .................................................................................................................  
-    # Create new points with middle click
+    # Create new points with middle click (or shift + right click, for mice without a middle button)
     
-    # flags == (param["mouse_move_offset"] + cv2.EVENT_FLAG_LBUTTON + cv2.EVENT_FLAG_SHIFTKEY):
-    if event == cv2.EVENT_MBUTTONDOWN:
-        '''
+    shift_right_click = (event == cv2.EVENT_RBUTTONDOWN) and (flags & cv2.EVENT_FLAG_SHIFTKEY)
+    if (event == cv2.EVENT_MBUTTONDOWN or shift_right_click) and param["zone_editing"]:
         param["new_points"].append(mxy)
-        '''
-        pass
+        return
     
     # .................................................................................................................
     # Delete masks with right-click
     
-    if event == cv2.EVENT_RBUTTONDOWN:
+    if event == cv2.EVENT_RBUTTONDOWN and param["zone_editing"]:
         
-        '''
         # Clear zone that are moused over, but only if we aren't currently drawing a new region
         if not points_in_progress:
             param["zone_list"] = [eachZone for eachZone in param["zone_list"] 
-                                  if (cv2.pointPolygonTest(eachZone, tuple(mxy), measureDist=False) < 0)]
+                                  if (cv2.pointPolygonTest(eachZone, tuple(map(float, mxy)), False) < 0)]
             
         # Clear mask-in-progress points regardless
         param["new_points"] = []
         param["zonepoint_select"] = None
         param["zonepoint_hover"] = None
-        '''
-        pass
     
 # .....................................................................................................................
     
-def crop_video(video_source, vidWH, vidFPS):
-    
-    # Set some convenient parameters
-    solidBorder = cv2.BORDER_CONSTANT
-    borderColor = (20,20,20)
-    wBorder = 35
-    hBorder = 35
-    borderWH = np.array((wBorder, hBorder))
-    cropping_frame_delay = int(1000/vidFPS)
+def load_editing_clip(video_source_list, vidWH, vidFPS, borderWH, borderColor=(20,20,20)):
     
     # Check if the user display is large enough to show the image. If not, we'll need to shrink it
     dispWH = displayDimensionsWH()
@@ -204,6 +202,47 @@ def crop_video(video_source, vidWH, vidFPS):
     resizeWH = (min(maxW, vidWH[0]), min(maxH, vidWH[1]))
     resize_unscaling = (vidWH - np.array((1, 1))) / (resizeWH - np.array((1,1)))
     
+    # Load (downscaled) sample frames once, so we don't re-read the video(s) on every loop
+    if len(video_source_list) > 1:
+        # Cycle through frames sampled across every video, so edits can be checked against the whole timeline
+        frame_delay = 400
+        sampleClip = TimelineClip(video_source_list, resizeWH, numSamples=30)
+    else:
+        # Loop a short clip from the only video
+        clipFrameStep = 2
+        frame_delay = int(1000*clipFrameStep/vidFPS)
+        sampleClip = LoopingClip(video_source_list[0], resizeWH, maxFrames=90, frameStep=clipFrameStep)
+    
+    # Add borders to the clip frames for drawing 'out-of-bounds'. Also only needs to be done once
+    wBorder, hBorder = borderWH
+    sampleClip.map(lambda eachFrame: cv2.copyMakeBorder(eachFrame, 
+                                                        top=hBorder, 
+                                                        bottom=hBorder, 
+                                                        left=wBorder,
+                                                        right=wBorder,
+                                                        borderType=cv2.BORDER_CONSTANT,
+                                                        value=borderColor))
+    
+    # Label timeline samples (in the top border) so the user knows where each frame came from
+    for eachFrame, eachLabel in zip(sampleClip.frames, getattr(sampleClip, "labels", [])):
+        cv2.putText(eachFrame, eachLabel, (wBorder, hBorder - 12), cv2.FONT_HERSHEY_SIMPLEX, 0.45, 
+                    (200, 200, 200), 1, cv2.LINE_AA)
+    
+    return sampleClip, frame_delay, resizeWH, resize_unscaling
+
+# .....................................................................................................................
+    
+def crop_video(video_source_list, vidWH, vidFPS):
+    
+    # Set some convenient parameters
+    wBorder = 35
+    hBorder = 35
+    borderWH = np.array((wBorder, hBorder))
+    
+    # Load the (downscaled) clip used for editing
+    sampleClip, cropping_frame_delay, resizeWH, resize_unscaling = \
+    load_editing_clip(video_source_list, vidWH, vidFPS, borderWH)
+    
     # Create initial region for cropping (user can adjust this with mouse)
     initial_crop_region_norm = [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0)]
     initial_crop_region = np.int32(np.array(initial_crop_region_norm)*(np.array(resizeWH) - np.array((1,1))))
@@ -215,39 +254,35 @@ def crop_video(video_source, vidWH, vidFPS):
                     "zonepoint_hover": None,
                     "zonepoint_select": None,
                     "zone_list": [initial_crop_region],
-                    "new_points": []}
+                    "new_points": [],
+                    "rectangular_zones": True,
+                    "zone_editing": False}
     
+    # Allocate an overlay layer for drawing the crop region, which is only re-drawn when the region changes
+    borderedShape = sampleClip.frames[0].shape
+    overlayLayer = np.zeros(borderedShape, dtype=np.uint8)
+    overlayMask = np.zeros((borderedShape[0], borderedShape[1], 1), dtype=np.bool_)
+    lastCropZone = None
     
-    # Set up windowing and video capture
-    videoObj, _, _ = setupVideoCapture(video_source, verbose=False)
+    # Set up windowing
     cropWindow = SimpleWindow("Crop Video", x = 100, y = 25)    
     cropWindow.attachCallback(crop_callback, crop_cb_data)
     
     while True:
         
-        # Get video frame        
-        (receivedFrame, inFrame) = videoObj.read()
+        # Get (cached) video frame. The clip loops, so there's always a frame
+        (_, borderedFrame) = sampleClip.read()
         
-        # Restart the video if we reach the end
-        if not receivedFrame: 
-            videoObj.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            
-        # Resize the frame if needed
-        scaledFrame = cv2.resize(inFrame, dsize=resizeWH)#vidWH)
-        
-        # Create bordered frame for drawing crop region
-        # Add borders to the frame for drawing 'out-of-bounds'
-        borderedFrame = cv2.copyMakeBorder(scaledFrame, 
-                                           top=hBorder, 
-                                           bottom=hBorder, 
-                                           left=wBorder,
-                                           right=wBorder,
-                                           borderType=solidBorder,
-                                           value=borderColor)
+        # Re-draw the crop region overlay, only if the region changed
+        crop_zone = crop_cb_data["zone_list"][0] + borderWH
+        if (lastCropZone is None) or (not np.array_equal(crop_zone, lastCropZone)):
+            overlayLayer[:] = 0
+            cv2.polylines(overlayLayer, [crop_zone], True, (0, 255, 255), 1, cv2.LINE_8)
+            overlayMask[:] = np.any(overlayLayer, axis = 2, keepdims = True)
+            lastCropZone = crop_zone
         
         # Draw crop region
-        crop_zone = crop_cb_data["zone_list"][0] + borderWH
-        cv2.polylines(borderedFrame, [crop_zone], True, (0, 255, 255), 1, cv2.LINE_AA)        
+        borderedFrame = maskedOverlay(borderedFrame, overlayLayer, overlayMask)
         
         winExists = cropWindow.imshow(borderedFrame)
         if not winExists: break
@@ -270,7 +305,7 @@ def crop_video(video_source, vidWH, vidFPS):
         
         
     # Clean up
-    videoObj.release()
+    sampleClip.release()
     cv2.destroyAllWindows()
     
     # Get crop-coords in px (point order: TL, TR, BR, BL)
@@ -305,13 +340,168 @@ def crop_video(video_source, vidWH, vidFPS):
 
 # .....................................................................................................................
 
+def mask_video(video_source_list, vidWH, vidFPS, initial_zones_normalized=None):
+    
+    # Set some convenient parameters
+    wBorder = 35
+    hBorder = 35
+    borderWH = np.array((wBorder, hBorder))
+    
+    # Load the (downscaled) clip used for editing
+    sampleClip, masking_frame_delay, resizeWH, resize_unscaling = \
+    load_editing_clip(video_source_list, vidWH, vidFPS, borderWH)
+    
+    # Start with any previously used zones (converted to display pixels), so they don't need to be re-drawn
+    zone_scaling = np.array(resizeWH) - np.array((1,1))
+    initial_zones_normalized = [] if initial_zones_normalized is None else initial_zones_normalized
+    initial_zones = [np.int32(np.round(np.array(each_zone) * zone_scaling)) for each_zone in initial_zones_normalized]
+    
+    # Store callback data for mouse interaction
+    mask_cb_data = {"mouse_move_offset": 1000000,
+                    "mouse": None,
+                    "borderWH": borderWH,
+                    "zonepoint_hover": None,
+                    "zonepoint_select": None,
+                    "zone_list": initial_zones,
+                    "new_points": [],
+                    "rectangular_zones": False,
+                    "zone_editing": True}
+    
+    # Allocate an overlay layer for drawing the masks, which is only re-drawn when the zones change
+    borderedShape = sampleClip.frames[0].shape
+    overlayLayer = np.zeros(borderedShape, dtype=np.uint8)
+    overlayMask = np.zeros((borderedShape[0], borderedShape[1], 1), dtype=np.bool_)
+    lastZoneKey = None
+    
+    # Set up windowing
+    print("")
+    print("Privacy masks:")
+    print("  Middle click (or shift + right click) to add points, left click to finish a mask")
+    print("  Drag points to adjust, right click to delete a mask. Press enter when done")
+    maskWindow = SimpleWindow("Privacy Masks", x = 100, y = 25)    
+    maskWindow.attachCallback(crop_callback, mask_cb_data)
+    
+    while True:
+        
+        # Get (cached) video frame. The clip loops, so there's always a frame
+        (_, borderedFrame) = sampleClip.read()
+        
+        # Re-draw the mask overlay, only if the zones (or in-progress points) changed
+        zone_list = [each_zone + borderWH for each_zone in mask_cb_data["zone_list"]]
+        new_points = [each_point + borderWH for each_point in mask_cb_data["new_points"]]
+        zone_key = repr([each_zone.tolist() for each_zone in zone_list] + [np.int32(new_points).tolist()])
+        if zone_key != lastZoneKey:
+            overlayLayer[:] = 0
+            if len(zone_list) > 0:
+                cv2.fillPoly(overlayLayer, zone_list, (40, 40, 40))
+                cv2.polylines(overlayLayer, zone_list, True, (255, 0, 255), 1, cv2.LINE_AA)
+            if len(new_points) > 0:
+                cv2.polylines(overlayLayer, [np.int32(new_points)], False, (0, 255, 255), 1, cv2.LINE_AA)
+                for each_point in new_points:
+                    cv2.circle(overlayLayer, tuple(int(each_value) for each_value in each_point), 3, 
+                               (0, 255, 255), -1, cv2.LINE_AA)
+            overlayMask[:] = np.any(overlayLayer, axis = 2, keepdims = True)
+            lastZoneKey = zone_key
+        
+        # Draw masks
+        borderedFrame = maskedOverlay(borderedFrame, overlayLayer, overlayMask)
+        
+        winExists = maskWindow.imshow(borderedFrame)
+        if not winExists: break
+    
+        # Allow q/Esc to break the loop
+        reqBreak, keyPress = breakByKeypress(masking_frame_delay)
+        if reqBreak: 
+            break
+        
+        # Break on enter key
+        if keyPress == 10:
+            break
+        
+        # Allow for small adjustments using the arrow keys (adjust points closest to the mouse)
+        arrowPressed, arrowXY = arrowKeys(keyPress)
+        if arrowPressed:
+            zonepointHover = mask_cb_data["zonepoint_hover"]
+            if zonepointHover is not None:
+                mask_cb_data["zone_list"][zonepointHover[0]][zonepointHover[1]] += arrowXY
+        
+        
+    # Clean up
+    sampleClip.release()
+    cv2.destroyAllWindows()
+    
+    # Normalize zone co-ordinates (relative to the full frame), so masks work at any frame size
+    frame_scaling = np.float32(vidWH) - np.float32((1, 1))
+    zones_norm = [np.clip(np.float32(each_zone * resize_unscaling) / frame_scaling, 0.0, 1.0) 
+                  for each_zone in mask_cb_data["zone_list"]]
+    
+    return zones_norm
+
+# .....................................................................................................................
+
+def crop_zones(zones_normalized, crop_coordinates_normalized):
+    
+    # Convert zones from full-frame co-ordinates to cropped-frame co-ordinates (both normalized)
+    if crop_coordinates_normalized is None:
+        return zones_normalized
+    cropY1, cropY2, cropX1, cropX2 = crop_coordinates_normalized
+    crop_offset = np.float32((cropX1, cropY1))
+    crop_scaling = np.float32((max(1E-6, cropX2 - cropX1), max(1E-6, cropY2 - cropY1)))
+    
+    return [(np.float32(each_zone) - crop_offset) / crop_scaling for each_zone in zones_normalized]
+
+# .....................................................................................................................
+
 def apply_crop(input_frame, crop_coordinates_normalized):
     
-    frame_height, frame_width = input_frame.shape[0:2]
+    # Also works on (N, H, W, C) batches of frames, in which case every frame is cropped (with one slice)
+    is_batch = (input_frame.ndim == 4)
+    frame_height, frame_width = input_frame.shape[1:3] if is_batch else input_frame.shape[0:2]
     frame_scaling = np.float32((frame_height - 1, frame_height - 1, frame_width - 1, frame_width - 1))
-    cropY1, cropY2, cropX1, cropX2 = np.int32(crop_coordinates_normalized * frame_scaling)
+    cropY1, cropY2, cropX1, cropX2 = np.int32(np.round(crop_coordinates_normalized * frame_scaling))
+    
+    # Crop co-ordinates are inclusive, to match the cropped dimensions given by the crop_video function
+    crop_slice = (slice(cropY1, 1 + cropY2), slice(cropX1, 1 + cropX2))
+    
+    return input_frame[(slice(None),) + crop_slice] if is_batch else input_frame[crop_slice]
+
+# .....................................................................................................................
+
+def write_batch(frame_batch, crop_coordinates_normalized, privacy_mask, timestamp_overlay, video_recorder,
+                motion_detector=None, event_exporter=None):
+    
+    # Apply the per-frame steps to the whole batch at once
+    batch_frames = frame_batch.frames()
+    if crop_coordinates_normalized is not None:
+        batch_frames = apply_crop(batch_frames, crop_coordinates_normalized)
+    for run_start, run_end, run_lut in frame_batch.lookupTableRuns():
+        if run_lut is not None:
+            applyLUTBatch(batch_frames[run_start:run_end], run_lut)
+    if privacy_mask is not None:
+        privacy_mask.applyBatch(batch_frames)
+    
+    # Check for motion before timestamps are added, so the changing text doesn't count as activity
+    if motion_detector is not None:
+        active_list = motion_detector.updateBatch(batch_frames)
+    if timestamp_overlay is not None:
+        timestamp_overlay.drawBatch(batch_frames, frame_batch.frameTimes)
+    
+    # Save event clips (only frames near activity are ever encoded)
+    if event_exporter is not None:
+        for each_frame, each_active, each_time, each_repeat_count in zip(batch_frames, active_list,
+                                                                         frame_batch.frameTimes,
+                                                                         frame_batch.repeatCounts):
+            event_exporter.update(each_frame, each_active, each_time, repeatCount=each_repeat_count)
     
-    return input_frame[cropY1:cropY2, cropX1:cropX2]
+    # Hand frames over to the recorder. Timelapsing was already accounted for when the frames were batched
+    for each_frame, each_record_count in zip(batch_frames, frame_batch.recordCounts):
+        video_recorder.writeClaimed(each_frame, each_record_count)
+    
+    # Return a copy of the last frame (e.g. for previewing), since the batch storage gets re-used
+    last_frame = batch_frames[-1].copy() if len(batch_frames) > 0 else None
+    frame_batch.clear()
+    
+    return last_frame
 
 # .....................................................................................................................
     
@@ -324,6 +514,44 @@ def apply_crop(input_frame, crop_coordinates_normalized):
 # Set display timelapse. Will be overriden by recording timelapse, if one is specified
 displayTL = 1
 
+# Set refresh rate of the (threaded) preview window, if enabled
+previewRate = 10
+
+# Use per-frame timestamps (instead of the nominal FPS) when matching frame rates. Helps with variable-rate files
+useFrameTimestamps = False
+
+# Process small frames in batches while recording, since per-frame overhead dominates at low resolutions
+batchSize = 32
+batchMaxPixels = 640 * 480
+
+# Build a seek index for each file while checking them, so every seek is exact. Costs a pass through each new file
+# (about as slow as decoding it), which plain stitching never makes use of, so this is off by default.
+# Indices are stored & re-used on later runs. Parallel decoding builds the index it needs regardless
+buildSeekIndices = False
+
+# Allow decoding a single (long) file in parallel. The worker processes have to be started before any dialogs are
+# shown, so they're started on every run (a fraction of a second) and shut down again if they aren't needed
+allowParallelDecoding = True
+
+# Read the next few files in the background while decoding (helps with network storage). Set to 0 to disable
+readAheadFiles = 2
+
+# Record into a local scratch folder, then move the output into place when finished (None uses the default folder)
+useScratchOutput = True
+scratchFolder = None
+
+# Serve job metrics (Prometheus/JSON) on localhost at this port, for monitoring unattended jobs. None disables
+metricsPort = None
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Start decoding workers
+
+# Worker processes are forked, which is only safe before any GUI (tkinter/OpenCV windows) or threads have started
+decodeExecutor = None
+if allowParallelDecoding:
+    from local.lib.video.parallel import ParallelFileCapture, startDecodeWorkers
+    decodeExecutor = startDecodeWorkers()
+
 # ---------------------------------------------------------------------------------------------------------------------
 #%% Load files
 
@@ -347,18 +575,42 @@ print("**************************************************")
 # ---------------------------------------------------------------------------------------------------------------------
 #%% Validate video list
 
-# Try to open each video and get it's info. If this fails, better to find out now!
-wh_list = []
-fps_list = []
-for eachVideo in sortedFileList:
-    videoObj, vidWH, vidFPS = setupVideoCapture(eachVideo, verbose=False)
-    videoObj.release()
-    wh_list.append(vidWH)
-    fps_list.append(vidFPS)
+# Quickly check that each video can be read all the way through. If this fails, better to find out now!
+probeList = scanVideoIntegrity(sortedFileList, buildIndex=buildSeekIndices)
+
+# Quarantine bad files (i.e. leave them out of the stitching), rather than giving up on the whole job
+quarantineList = [(eachProbe["source"], eachProbe["reason"]) for eachProbe in probeList if not eachProbe["ok"]]
+goodProbeList = [eachProbe for eachProbe in probeList if eachProbe["ok"]]
+if len(goodProbeList) < 1:
+    print("")
+    print("No readable video files! Quitting...")
+    print("")
+    raise IOError
+
+# Get the info for each of the good videos
+sortedFileList = [eachProbe["source"] for eachProbe in goodProbeList]
+wh_list = [eachProbe["wh"] for eachProbe in goodProbeList]
+fps_list = [eachProbe["fps"] for eachProbe in goodProbeList]
+framecount_list = [eachProbe["frame_count"] for eachProbe in goodProbeList]
+totalFileCount = len(sortedFileList)
     
 # Set 'target' values for video output
-vidWH = max(wh_list)                    # Pick the dimensions with the highest width
-vidFPS = sum(fps_list)/len(fps_list)    # Average FPS
+vidWH = max(wh_list)                                # Pick the dimensions with the highest width
+vidFPS = max(set(fps_list), key=fps_list.count)     # Most common FPS (other videos get resampled to match)
+fullWH = vidWH                                      # Keep track of the un-cropped size
+
+# Check if we're re-exporting from a frame store (saved by a previous run), rather than regular videos
+storeModeEnabled = (totalFileCount == 1) and isFrameStore(sortedFileList[0])
+if storeModeEnabled:
+    print("")
+    print("Re-exporting from frame store! Videos won't need to be decoded")
+
+# Header frame counts are often wrong for VMS exports, which throws off timing. Stores are always exact though
+if not storeModeEnabled:
+    countCheckEnabled = guiConfirm("Would you like to verify video frame counts?\n"
+                                   "(Can be slow the first time, results are saved for later runs)", "Frame counts")
+    if countCheckEnabled:
+        framecount_list = verifyFrameCounts(sortedFileList)
     
 # Check if there are differences in the video dimensions and provide feedback
 uniqueWH = set(wh_list)
@@ -372,7 +624,18 @@ uniqueFPS = set(fps_list)
 if len(uniqueFPS) > 1:
     print("")
     print("Video FPS rates are not all equal!")
-    print("Will use average FPS:", "{:.3f}".format(vidFPS))
+    print("Will resample to FPS:", "{:.3f}".format(vidFPS))
+    
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Check for overlapping footage
+
+# Some VMS exports repeat a few seconds of footage at the start of each chunk, which we can skip
+skipFramesList = [0] * totalFileCount
+if totalFileCount > 1:
+    overlapCheckEnabled = guiConfirm("Would you like to remove repeated footage between files?\n"
+                                     "(Only needed if files overlap at the start/end)", "Overlapping files")
+    if overlapCheckEnabled:
+        skipFramesList = findBoundaryOverlaps(sortedFileList, fps_list, framecount_list)
     
 # --------------------------------------------------------------------------------------------------------------------- 
 #%% Set up cropping 
@@ -380,9 +643,37 @@ if len(uniqueFPS) > 1:
 crop_coords = None
 croppingEnabled = guiConfirm("Would you like to crop the video?", "Cropping")
 if croppingEnabled:
-    sample_video_ref = sortedFileList[0]  
-    crop_coords, vidWH = crop_video(sample_video_ref, vidWH, vidFPS)
+    crop_coords, vidWH = crop_video(sortedFileList, vidWH, vidFPS)
     
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up privacy masks
+
+# Masks are drawn on the full frame, then applied to the (cropped) output frames as part of the export
+privacyMask = None
+maskingEnabled = guiConfirm("Would you like to add privacy masks?\n"
+                            "(Masks from the last run are loaded for editing)", "Privacy masks")
+if maskingEnabled:
+    from local.lib.video.masking import PrivacyMask, loadMaskZones, saveMaskZones
+    mask_zones = mask_video(sortedFileList, fullWH, vidFPS, loadMaskZones())
+    saveMaskZones(mask_zones)
+    maskingEnabled = (len(mask_zones) > 0)
+if maskingEnabled:
+    blurMasks = guiConfirm("Blur the masked areas?\n(Otherwise they're blanked out)", "Mask style")
+    privacyMask = PrivacyMask(crop_zones(mask_zones, crop_coords), blurZones=blurMasks)
+    
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up exposure normalization
+
+# Auto-exposure (or day/night switching) can cause brightness jumps between files, which can be evened out
+exposureNormalizer = None
+exposureEnabled = False
+if (totalFileCount > 1) and not storeModeEnabled:
+    exposureEnabled = guiConfirm("Would you like to even out brightness changes between files?\n"
+                                 "(Samples a few frames from each file)", "Exposure")
+if exposureEnabled:
+    from local.lib.video.exposure import buildExposureNormalizer
+    exposureNormalizer = buildExposureNormalizer(sortedFileList, framecount_list)
+
 # ---------------------------------------------------------------------------------------------------------------------
 #%% Set up video scaling
 
@@ -418,7 +709,7 @@ if recordingEnabled:
         print("Using timelapse factor:", recordTL)
         
         # Get recording framerate
-        infoString = "(Orignal FPS: {})".format(vidFPS)
+        infoString = "(Orignal FPS: {})\n(Lower rates drop frames, but keep real-time speed)".format(vidFPS)
         recordFPS = guiDialogEntry(dialogText="Enter recording framerate:\n" + infoString, 
                                   windowTitle="Recording framerate", 
                                   retType=float)
@@ -426,81 +717,476 @@ if recordingEnabled:
         print("")
         print("Using framerate:", recordFPS)
         
+        # Record into a local scratch folder first, so slow (network) saving doesn't hold up the video loop
+        outSource = outSource if os.path.splitext(outSource)[1] != "" else (outSource + ".avi")
+        outputStage = ScratchFile(outSource, scratchFolder) if useScratchOutput else None
+        recordSource = outSource if outputStage is None else outputStage.path
+        
         # Set up video writer
-        outName = os.path.basename(outSource)
-        outPath = os.path.dirname(outSource)
-        videoOut = setupVideoRecording(outPath, outName, scaledWH, recFPS=recordFPS, recEnabled=True)
+        outName = os.path.basename(recordSource)
+        outPath = os.path.dirname(recordSource)
+        videoOut = setupVideoRecordingV2(outPath, outName, scaledWH, 
+                                         recFPS=recordFPS, 
+                                         recTimelapse=recordTL, 
+                                         recEnabled=True)
+        
+        # Keep track of where every output frame came from. Frame stores remember their original sources
+        from local.lib.video.provenance import ProvenanceWriter, provenancePath
+        if storeModeEnabled:
+            storeRefObj = openVideoCapture(sortedFileList[0])
+            provenanceSources, provenanceFPS = storeRefObj.sourceList, None
+            storeRefObj.release()
+        else:
+            provenanceSources, provenanceFPS = sortedFileList, fps_list
+        # The sidecar is staged along with the recording (if it's staged), so both land in place together
+        sidecarSource = provenancePath(outSource)
+        sidecarStage = None
+        if (outputStage is not None) and outputStage.isStaged:
+            sidecarStage = ScratchFile(sidecarSource, scratchFolder, minFreeBytes=0)
+        provenanceLog = ProvenanceWriter(sidecarSource if sidecarStage is None else sidecarStage.path, 
+                                         provenanceSources, provenanceFPS, outputFPS=recordFPS)
     else:
         # Disable recording if the save prompt is cancelled
         videoOut = None
         recordingEnabled = False
 
 # ---------------------------------------------------------------------------------------------------------------------
-#%% Video loop
+#%% Set up frame rate normalization
+
+# Every video is resampled onto a common frame grid, so playback speed is correct regardless of input FPS
+stitchFPS = recordFPS if recordingEnabled else vidFPS
+resampler = FrameRateResampler(stitchFPS, useTimestamps=useFrameTimestamps)
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up timestamps
+
+timestampOverlay = None
+timestampEnabled = guiConfirm("Would you like to add timestamps to the video?", "Timestamps")
+if timestampEnabled:
+    timestampOverlay = TimestampOverlay()
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up event clips
 
-# Set up windowing
-displayEnabled = (not recordingEnabled)
+# Save short clips around periods of activity, so footage can be reviewed without watching all of it
+eventExporter = None
+motionDetector = None
+eventsEnabled = guiConfirm("Would you like to save clips around periods of activity (motion)?\n"
+                           "(Each event is saved to its own file)", "Event clips")
+if eventsEnabled:
+    eventSource = guiSave(windowTitle="Save event clips (numbered automatically)", fileTypes=[["video", "*.avi"]])
+    eventsEnabled = (eventSource is not None)
+if eventsEnabled:
+    from local.lib.video.events import MotionDetector, EventClipExporter
+    
+    # Get the amount of footage to keep before & after each event
+    preRollSec = guiDialogEntry(dialogText="Enter seconds of footage to keep before each event:\n(Default: 5)", 
+                                windowTitle="Event pre-roll", 
+                                retType=float)
+    preRollSec = 5.0 if preRollSec is None else preRollSec
+    postRollSec = guiDialogEntry(dialogText="Enter seconds of footage to keep after each event:\n(Default: 5)", 
+                                 windowTitle="Event post-roll", 
+                                 retType=float)
+    postRollSec = 5.0 if postRollSec is None else postRollSec
+    
+    # Start motion detection from a background image (if there's one next to the videos), or the first frame
+    backgroundSource = os.path.join(os.path.dirname(sortedFileList[0]), "background.png")
+    backgroundRefObj = openVideoCapture(sortedFileList[0])
+    backgroundFrame = loadBackground(backgroundSource, backgroundRefObj)
+    backgroundRefObj.release()
+    if croppingEnabled:
+        backgroundFrame = apply_crop(backgroundFrame, crop_coords)
+    if maskingEnabled:
+        backgroundFrame = privacyMask.apply(backgroundFrame.copy())
+    motionDetector = MotionDetector(backgroundFrame)
+    
+    # Clips use the recording size (rather than the full source resolution), which keeps the pre-roll ring small
+    eventExporter = EventClipExporter(os.path.dirname(eventSource), os.path.basename(eventSource), scaledWH, 
+                                      stitchFPS, preRollSeconds=preRollSec, postRollSeconds=postRollSec)
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up frame store
+
+# Saving decoded frames lets later exports (with different cropping/scaling/timelapsing) skip decoding entirely
+frameStore = None
+frameStoreEnabled = False
+if not storeModeEnabled:
+    frameStoreEnabled = guiConfirm("Would you like to save decoded frames for faster re-exports?", "Frame store")
+if frameStoreEnabled:
+    storeSource = guiSave(windowTitle="Save frame store", fileTypes=[["frame store", "*.vsfs"]])
+    frameStoreEnabled = (storeSource is not None)
+if frameStoreEnabled:
+    
+    # Get the (un-cropped) working resolution of the store
+    storeFrameCount = sum(eachCount*stitchFPS/eachFPS for eachCount, eachFPS in zip(framecount_list, fps_list))
+    infoString = "(Full size: {} x {}, {:.0f} frames)".format(*fullWH, storeFrameCount)
+    storeScale = guiDialogEntry(dialogText="Enter frame store down-scaling factor:\n" + infoString, 
+                                windowTitle="Frame store scaling", 
+                                retType=int)
+    storeScale = 1 if storeScale is None else storeScale
+    storeWH = (int(fullWH[0]/storeScale), int(fullWH[1]/storeScale))
+    
+    # Warn about the size of the store, since it holds raw frames
+    print("")
+    print("Frame store size: {} x {}".format(*storeWH))
+    print("  Approx. {:.1f} GB of disk space needed".format(storeFrameCount*storeWH[0]*storeWH[1]*3/1E9))
+    frameStore = FrameStoreWriter(storeSource, storeWH, stitchFPS, sortedFileList)
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up parallel decoding
+
+# A single long video can't be spread across cores file-by-file, so offer to decode it in blocks instead
+parallelDecodeEnabled = False
+if (decodeExecutor is not None) and (totalFileCount == 1) and not storeModeEnabled:
+    infoString = "(Helps with very long single files, uses up to {} processes)".format(min(8, os.cpu_count() or 1))
+    parallelDecodeEnabled = guiConfirm("Would you like to decode the video in parallel?\n" + infoString, 
+                                       "Parallel decoding")
+
+# Blocks can only be split exactly using a seek index, so build one if it wasn't already (stored for later runs)
+if parallelDecodeEnabled:
+    from local.lib.video.seekindex import loadSeekIndex
+    if loadSeekIndex(sortedFileList[0], buildIfMissing=True) is None:
+        print("")
+        print("Couldn't index video, so it can't be decoded in parallel!")
+        parallelDecodeEnabled = False
+
+# Shut down the (already started) decoding processes if they aren't going to be used
+parallelCaptureList = []
+if (decodeExecutor is not None) and not parallelDecodeEnabled:
+    decodeExecutor.shutdown()
+    decodeExecutor = None
+
+# Downscale in the worker processes where possible, so there's less data to pass back. Cropping still happens here
+parallelWH = None
+if parallelDecodeEnabled and (videoScale > 1) and not frameStoreEnabled:
+    parallelWH = (int(fullWH[0]/videoScale), int(fullWH[1]/videoScale))
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up previewing
+
+# Set up previewing, which runs separately from the video loop (so it can be used while recording)
+infoString = "(Refreshes at {} Hz, without slowing down stitching)".format(previewRate)
+previewEnabled = guiConfirm("Would you like to show a live preview?\n" + infoString, "Preview")
+
+# Set up windowing. Only use the regular display if we aren't recording or previewing
+displayEnabled = (not recordingEnabled) and (not previewEnabled)
 displayWindow = SimpleWindow("Display", enabled=displayEnabled)
+previewWindow = PreviewWindow("Preview", x = 100, y = 25, refreshRate=previewRate, enabled=previewEnabled)
+
+# Set up batching (only used when recording without the regular display)
+decodedWH = fullWH if parallelWH is None else parallelWH
+batchingEnabled = recordingEnabled and (not displayEnabled) and (decodedWH[0] * decodedWH[1] <= batchMaxPixels)
+frameBatch = FrameBatch(batchSize)
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Plan the run
+
+# Frames actually read from each file (repeated footage between files is skipped without counting)
+planFrameCounts = [max(0, eachCount - eachSkip) for eachCount, eachSkip in zip(framecount_list, skipFramesList)]
+
+# Unattended jobs get a calibrated estimate of the run time & output size up front, for scheduling
+planDict = None
+if not displayEnabled:
+    from local.lib.video.planning import calibrateThroughput, planRun
+    
+    # Time the actual processing steps & recording settings on a few frames
+    calibrationSteps = []
+    if croppingEnabled:
+        calibrationSteps.append(lambda frame: apply_crop(frame, crop_coords))
+    if exposureEnabled:
+        exposureNormalizer.startVideo(0)
+        calibrationSteps.append(lambda frame: cv2.LUT(frame, exposureNormalizer.lookupTable(0)))
+    if maskingEnabled:
+        calibrationSteps.append(privacyMask.apply)
+    if timestampEnabled:
+        calibrationSteps.append(lambda frame: timestampOverlay.draw(frame, dt.datetime.now()))
+    calibrationRecorderFunc = None
+    if recordingEnabled:
+        calibrationRecorderFunc = lambda calibrationName: setupVideoRecordingV2(os.path.dirname(videoOut.source), 
+                                                                                calibrationName, scaledWH, 
+                                                                                recFPS=recordFPS)
+    timingDict = calibrateThroughput(sortedFileList[0], calibrationSteps, calibrationRecorderFunc)
+    
+    # List out the fast paths each file will take, so it's clear why some files are quicker than others
+    decodeAllFrames = frameStoreEnabled or eventsEnabled
+    decodeWorkers = min(8, os.cpu_count() or 1) if parallelDecodeEnabled else 1
+    fastPathsList = []
+    for fileIdx, eachFPS in enumerate(fps_list):
+        fileFastPaths = []
+        if storeModeEnabled:
+            fileFastPaths.append("frame store (no decoding)")
+        if parallelDecodeEnabled:
+            fileFastPaths.append("parallel decoding ({} processes)".format(decodeWorkers))
+        if batchingEnabled:
+            fileFastPaths.append("batched processing")
+        if (recordTL > 1 or stitchFPS < eachFPS) and not decodeAllFrames:
+            fileFastPaths.append("skipped frames aren't decoded")
+        if skipFramesList[fileIdx] > 0:
+            fileFastPaths.append("{} repeated frames skipped".format(skipFramesList[fileIdx]))
+        if fileIdx > 0 and readAheadFiles > 0 and not storeModeEnabled:
+            fileFastPaths.append("read-ahead")
+        fastPathsList.append(fileFastPaths)
+    
+    planDict = planRun(sortedFileList, planFrameCounts, fps_list, timingDict, stitchFPS, 
+                       recordTimelapse=recordTL if recordingEnabled else 1, 
+                       decodeAllFrames=decodeAllFrames, 
+                       decodeWorkers=decodeWorkers, 
+                       fastPathsList=fastPathsList)
+
+# Keep a running estimate of the time remaining, starting from the plan (if there is one)
+progress = ProgressEstimator(sum(planFrameCounts), plannedFPS=None if planDict is None else planDict["input_fps"])
+
+# Read upcoming files in the background, so decoding doesn't stall when moving on to the next file
+prefetcher = FilePrefetcher(sortedFileList, lookAhead = (0 if storeModeEnabled else readAheadFiles))
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up job metrics
+
+# Only updated once per file. Everything else is read from the existing counters when metrics are requested
+jobStatus = {"file_idx": None, "file_name": None, "video_capture": None}
+
+def collect_job_metrics():
+    
+    # Count frames passing through each stage & get the average rate of each
+    elapsedSec = max(1E-3, progress.elapsedSeconds())
+    stageFramesDict = {"read": progress.framesDone, "output": resampler.framesOut}
+    recReport = videoOut.report() if recordingEnabled else None
+    if recordingEnabled:
+        stageFramesDict["recorded"] = recReport["frames_written"]
+    if eventsEnabled:
+        stageFramesDict["event_clips"] = sum(eachEvent["frames"] for eachEvent in eventExporter.eventList)
+    
+    # Get the number of items waiting at each stage
+    videoCapture = jobStatus["video_capture"]
+    queueDict = {"batch_frames": len(frameBatch) if batchingEnabled else 0, 
+                 "prefetch_files": prefetcher.pendingFiles(), 
+                 "decode_blocks": videoCapture.queuedBlocks() if parallelDecodeEnabled and videoCapture else 0}
+    
+    secondsLeft = progress.secondsLeft()
+    
+    return {"frames_total": stageFramesDict,
+            "stage_fps": {eachStage: eachCount / elapsedSec for eachStage, eachCount in stageFramesDict.items()},
+            "input_fps": progress.fps,
+            "planned_frames": progress.totalFrames,
+            "progress_ratio": progress.framesDone / max(1, progress.totalFrames),
+            "file_index": jobStatus["file_idx"],
+            "file_count": totalFileCount,
+            "current_file": jobStatus["file_name"],
+            "queue_depth": queueDict,
+            "output_bytes": None if recReport is None else recReport["bytes_written"],
+            "event_clips_total": len(eventExporter.eventList) if eventsEnabled else None,
+            "errors_total": len(quarantineList),
+            "elapsed_seconds": progress.elapsedSeconds(),
+            "eta_seconds": secondsLeft,
+            "eta_timestamp_seconds": None if secondsLeft is None else (dt.datetime.now().timestamp() + secondsLeft)}
+
+metricsHelpDict = {"frames_total": "Frames passed through each stage",
+                   "stage_fps": "Average frames per second through each stage",
+                   "input_fps": "Recent input frames per second",
+                   "planned_frames": "Input frames to be read over the whole job",
+                   "progress_ratio": "Fraction of input frames read so far",
+                   "file_index": "Index of the file being worked on (0-based)",
+                   "file_count": "Number of files in the job",
+                   "current_file": "Name of the file being worked on",
+                   "queue_depth": "Items waiting in each queue",
+                   "output_bytes": "Size of the recording so far",
+                   "event_clips_total": "Event clips started",
+                   "errors_total": "Problem files (skipped or ended early)",
+                   "elapsed_seconds": "Time since processing started",
+                   "eta_seconds": "Estimated time remaining",
+                   "eta_timestamp_seconds": "Estimated finish time (unix time)"}
+metricsServer = None
+if metricsPort is not None:
+    from local.lib.utils.metrics import startMetricsServer
+    metricsServer = startMetricsServer(collect_job_metrics, metricsPort, helpDict=metricsHelpDict)
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Video loop
 
 # Some loop-helping variables
 breakFullLoop = False
 frameCount = -1
+loopError = None
 
 try:
     for fileIdx, eachVideo in enumerate(sortedFileList):
         
-        # Try to open each video file. We didn't do any safety checks beforehand...
+        # Start reading ahead on the next file(s)
+        prefetcher.prefetch(fileIdx)
+        
+        # Try to open each video file. If it fails anyways, skip it rather than stopping the whole job
         try:
-            videoObj, _, _ = setupVideoCapture(eachVideo, verbose=False)
-        except:
+            videoObj, _, chunkFPS = setupVideoCapture(eachVideo, verbose=False)
+        except Exception:
             print("")
             print("Error loading video file:")
             print(eachVideo)
-            print("Quitting...")
-            break
+            print("Skipping...")
+            quarantineList.append((eachVideo, "Couldn't open video during stitching"))
+            continue
+        
+        # Swap in the (block-based) parallel reader if needed. Frames still come out in order
+        if parallelDecodeEnabled:
+            videoObj.release()
+            videoObj = ParallelFileCapture(eachVideo, decodeExecutor, frameWH=parallelWH)
+            parallelCaptureList.append(videoObj)
+        
+        # Update the current file for job metrics
+        jobStatus.update({"file_idx": fileIdx, "file_name": os.path.basename(eachVideo), "video_capture": videoObj})
         
         # Some feedback
         print("")
         print("Working on video:", os.path.basename(eachVideo))
         
+        # Figure out the (wall-clock) starting time of the video, used for timestamping
+        if (timestampEnabled or frameStoreEnabled or eventsEnabled or recordingEnabled) and not storeModeEnabled:
+            chunkFrameCount = framecount_list[fileIdx]
+            chunkStartTime = getVideoStartTime(eachVideo, chunkFPS, chunkFrameCount, verbose=timestampEnabled)
+        
         # Pull frames from each video
         startTime = dt.datetime.now()
+        chunkFrameIdx = -1
+        resampler.startVideo(chunkFPS)
+        
+        # Skip footage that was already included at the end of the previous video (no need to decode it)
+        for _ in range(skipFramesList[fileIdx]):
+            videoObj.grab()
+            chunkFrameIdx += 1
+        if exposureEnabled:
+            exposureNormalizer.startVideo(fileIdx)
+        
         while True:
             
             # .........................................................................................................
             # Get video frame
             
-            (receivedFrame, inFrame) = videoObj.read()
+            # Move on to the next video if decoding fails part way through the file
+            try:
+                receivedFrame = videoObj.grab()
+            except cv2.error:
+                receivedFrame = False
             
             if not receivedFrame: break
-            frameCount += 1
+            chunkFrameIdx += 1
             
-            # Only bother with the rest of the processing if we aren't timelapsing
-            if frameCount % displayTL != 0 and frameCount % recordTL != 0:
+            # Give progress updates every so often
+            if progress.tick():
+                progress.report()
+            
+            # Figure out how many output frames this frame fills. Dropped frames are never decoded (retrieved)
+            frameMsec = videoObj.get(cv2.CAP_PROP_POS_MSEC) if useFrameTimestamps else None
+            outputCount = resampler.outputCount(chunkFrameIdx, frameMsec)
+            if outputCount < 1:
+                continue
+            frameCount += outputCount
+            
+            # Only bother with the rest of the processing if the frame is going to be recorded or shown
+            recordFrame = recordingEnabled and videoOut.isRecordFrame(outputCount)
+            displayFrame = displayEnabled and (frameCount % displayTL == 0)
+            previewFrame = previewWindow.wantsFrame()
+            if not (recordFrame or displayFrame or previewFrame or frameStoreEnabled or eventsEnabled):
+                if recordingEnabled: videoOut.skip(outputCount)
+                continue
+            
+            # Decode the frame, now that we know it's needed
+            try:
+                (receivedFrame, inFrame) = videoObj.retrieve()
+            except cv2.error:
+                receivedFrame = False
+            if not receivedFrame: break
+            
+            # Figure out the (wall-clock) time of the frame, if anything needs it
+            frameTime = None
+            if timestampEnabled or frameStoreEnabled or eventsEnabled or recordingEnabled:
+                if storeModeEnabled:
+                    frameTime = videoObj.frameTimestamp()
+                else:
+                    frameTime = frameTimestamp(chunkStartTime, chunkFrameIdx, chunkFPS)
+            
+            # Keep track of where the frame came from (frame stores remember the original source file & frame)
+            sourceFileIdx, sourceFrameIdx = videoObj.frameSource() if storeModeEnabled else (fileIdx, chunkFrameIdx)
+            
+            # Save the (un-cropped) frame for re-exports, if needed
+            if frameStoreEnabled:
+                frameStore.write(inFrame, fileIdx, chunkFrameIdx, frameTime, repeatCount=outputCount)
+            
+            # Collect small frames into batches, so cropping, timestamps etc. are done once per batch
+            if batchingEnabled:
+                frameLUT = exposureNormalizer.lookupTable(chunkFrameIdx) if exposureEnabled else None
+                recordCount = videoOut.claim(outputCount)
+                provenanceLog.write(sourceFileIdx, sourceFrameIdx, frameTime, recordCount)
+                if not frameBatch.add(inFrame, recordCount, frameTime, frameLUT, repeatCount=outputCount):
+                    continue
+                
+                # Write out full batches. Preview the last frame of each batch
+                lastFrame = write_batch(frameBatch, crop_coords, privacyMask, timestampOverlay, videoOut, 
+                                        motionDetector, eventExporter)
+                previewWindow.update(lastFrame)
+                if previewWindow.stopRequested:
+                    print("")
+                    print("Key pressed to stop!")
+                    breakFullLoop = True
+                    break
                 continue
             
             # Crop if needed
             if croppingEnabled:
                 inFrame = apply_crop(inFrame, crop_coords)
             
-            # Shrink the frame if needed
-            scaledFrame = cv2.resize(inFrame, dsize=scaledWH)
+            # Even out brightness between files (after cropping, so there are fewer pixels to map)
+            if exposureEnabled:
+                inFrame = cv2.LUT(inFrame, exposureNormalizer.lookupTable(chunkFrameIdx))
+            
+            # Hide privacy zones (after brightness changes, so blanked areas stay blank)
+            if maskingEnabled:
+                inFrame = privacyMask.apply(inFrame)
+            
+            # Check for motion before timestamps are added, so the changing text doesn't count as activity
+            if eventsEnabled:
+                eventActive = motionDetector.update(inFrame)
             
             # .........................................................................................................
             # Add time text
             
-            # Not implemented yet...
+            if timestampEnabled and (frameTime is not None):
+                inFrame = timestampOverlay.draw(inFrame, frameTime)
             
             # .........................................................................................................
-            # Record frames
+            # Save event clips (only frames near activity are ever encoded)
+            
+            if eventsEnabled:
+                eventExporter.update(inFrame, eventActive, frameTime, repeatCount=outputCount)
+            
+            # .........................................................................................................
+            # Record frames (the recorder handles any resizing needed to match the output dimensions)
             
             if recordingEnabled:
-                videoOut.write(scaledFrame)
+                recordCount = videoOut.claim(outputCount)
+                videoOut.writeClaimed(inFrame, recordCount)
+                provenanceLog.write(sourceFileIdx, sourceFrameIdx, frameTime, recordCount)
+            
+            # .........................................................................................................
+            # Preview frame
+            
+            if previewFrame:
+                
+                # Only hands off the frame reference, the preview thread takes care of the actual display
+                previewWindow.update(inFrame)
+                
+                # Allow q/Esc (in the preview window) to break the loop
+                if previewWindow.stopRequested:
+                    print("")
+                    print("Key pressed to stop!")
+                    breakFullLoop = True
+                    break
             
             # .........................................................................................................
             # Display frame
             
-            if displayEnabled:
+            if displayFrame:
+                
+                # Shrink the frame if needed
+                scaledFrame = cv2.resize(inFrame, dsize=scaledWH)
                 
                 # Only show the window if not recording. Allow the closing of the window to shutdown the system
                 winExists = displayWindow.imshow(scaledFrame)
@@ -527,29 +1213,135 @@ try:
         # Stop the loop if there is a break request
         if breakFullLoop: break
         
+        # Record videos that ended early (most likely a decoding failure part way through the file)
+        expectedFrames = framecount_list[fileIdx]
+        if (1 + chunkFrameIdx) < (expectedFrames - int(chunkFPS)):
+            print("  Video ended early! Got", 1 + chunkFrameIdx, "of", expectedFrames, "frames")
+            earlyEndReason = "Ended early ({} of {} frames)".format(1 + chunkFrameIdx, expectedFrames)
+            quarantineList.append((eachVideo, earlyEndReason))
+        
         # Provide feedback about timing
         endTime = dt.datetime.now()
         procTime = (endTime - startTime).total_seconds()
         filesLeft = totalFileCount - (1 + fileIdx)
         print("  Took", "{:.0f}".format(procTime), "seconds")
         if filesLeft > 0:
+            
+            # Estimate remaining time from the measured frame rate if the frame counts are all known
+            frameCountsKnown = (min(framecount_list) > 0)
+            timeLeftSec = progress.secondsLeft() if frameCountsKnown else None
+            timeLeftSec = (filesLeft*procTime) if timeLeftSec is None else timeLeftSec
             print("  There are", filesLeft, "file(s) left")
-            print("  Approx.", "{:.1f} minutes remaining".format(filesLeft*procTime/60.0))
+            print("  Approx.", formatDuration(timeLeftSec), "remaining")
         
 except KeyboardInterrupt:
     print("")
     print("Keyboard cancel!")
     
+except Exception as err:
+    # Finish the clean up first, so whatever was recorded so far still gets saved. The error is raised at the end
+    loopError = err
+    print("")
+    print("Error while stitching! Saving outputs before stopping:")
+    print(repr(err))
+    
     
 # ---------------------------------------------------------------------------------------------------------------------
 #%% Clean up 
 
-# Close window now that we're done
+# Close windows now that we're done
+previewWindow.close()
 cv2.destroyAllWindows()
 
-# Stop recording
-if recordingEnabled:
-    videoOut.release()
+# Compare the actual run time to the plan, which helps with scheduling future jobs
+print("")
+print("Total time:", formatDuration(progress.elapsedSeconds()), 
+      "" if planDict is None else "(planned {})".format(formatDuration(planDict["total_sec"])))
+
+# Stop any read-ahead that's still going
+prefetcher.close()
+jobStatus["video_capture"] = None
+
+# Shut down the decoding processes. The shared frame rings are only freed now that the preview is closed,
+# since frames handed out by the parallel readers are views into them
+if decodeExecutor is not None:
+    decodeExecutor.shutdown()
+for eachCapture in parallelCaptureList:
+    eachCapture.close()
+
+# Some feedback about frame rate normalization
+if resampler.framesDropped > 0 or resampler.framesRepeated > 0:
+    print("")
+    print("Resampled to {:.3f} FPS:".format(stitchFPS))
+    print("  Dropped", resampler.framesDropped, "and repeated", resampler.framesRepeated, 
+          "of", resampler.framesIn, "input frames")
+
+# Report any problem files, so they can be dealt with separately
+if len(quarantineList) > 0:
+    print("")
+    print("*************** Problem files ***************")
+    print("")
+    for eachSource, eachReason in quarantineList:
+        print(os.path.basename(eachSource), "-", eachReason)
+    print("")
+    print("*********************************************")
+
+try:
+    # Write out any partially filled batch
+    if batchingEnabled and len(frameBatch) > 0:
+        write_batch(frameBatch, crop_coords, privacyMask, timestampOverlay, videoOut, motionDetector, eventExporter)
+
+    # Finish saving the frame store
+    if frameStoreEnabled:
+        frameStore.release()
+
+    # Close any event clip that was still in progress & list out all the events
+    if eventsEnabled:
+        eventList = eventExporter.release()
+        print("")
+        print("Event clips saved:", len(eventList))
+        for eachEvent in eventList:
+            eventStart = eachEvent["start_time"]
+            eventTimeString = "" if eventStart is None else eventStart.strftime("%Y-%m-%d %H:%M:%S")
+            verifyString = "" if eachEvent["verified"] else " - Output check FAILED!"
+            print("  {} - {} ({:.1f} seconds){}".format(os.path.basename(eachEvent["source"]), eventTimeString, 
+                                                       eachEvent["frames"] / stitchFPS, verifyString))
+
+    # Stop recording
+    if recordingEnabled:
+        videoOut.release()
+        provenanceLog.release()
+    
+        # Some feedback about the recording
+        recReport = videoOut.report()
+        print("")
+        print("Recording finished:")
+        print("  Frames written:", recReport["frames_written"], 
+              "(of {} input frames)".format(recReport["frames_in"]))
+        print("  File size:", "{:.1f} MB".format(recReport["bytes_written"]/1E6))
+        print("  Frame sources saved to:", os.path.basename(sidecarSource))
+    
+        # Spot-check the output, so broken recordings (e.g. from a full disk) don't go unnoticed
+        verifyRecording(videoOut)
+
+finally:
+    
+    # Always close the recording & move it from the scratch folder to where it was meant to be saved, even if
+    # something failed along the way, so outputs are never left behind in the scratch folder
+    if recordingEnabled:
+        videoOut.release()
+        provenanceLog.release()
+        for eachStage in (outputStage, sidecarStage):
+            if eachStage is not None:
+                eachStage.finalize(verbose = (eachStage is outputStage))
+
+# Stop serving job metrics, now that everything is finished
+if metricsServer is not None:
+    metricsServer.close()
+
+# Pass on any error from the main loop, now that the outputs are saved
+if loopError is not None:
+    raise loopError
 
 
 # ---------------------------------------------------------------------------------------------------------------------